@@ -8,6 +8,7 @@ import threading
 from datetime import datetime
 from decimal import Decimal, ROUND_HALF_UP
 from pathlib import Path
+from typing import Awaitable, Callable, Tuple
 
 # ===== 第三方库 =====
 from dotenv import load_dotenv
@@ -17,17 +18,21 @@ from fastapi.responses import FileResponse, JSONResponse
 
 # ===== 本地模块（数据库 & 配置）=====
 from app.core.config import settings
-from app.models.database import Database, APILogRepository
+from app.models.async_database import (
+    AsyncTokenRepository,
+)
 
 # ===== 本地模块（服务函数）=====
 from app.services.token_fun import (
-    verify_token,
-    update_token_usage,
-    get_ip_prefix,
-    get_token_use_times,
+    QuotaReservation,
+    reserve_quota,
+    commit_quota,
+    release_quota,
+    get_token_center_id,
 )
 from app.services.image_fun import (
     process_image,
+    negotiate_image_format,
 )
 from app.services.check_fun import (
     check_other_value_error,
@@ -35,6 +40,12 @@ from app.services.check_fun import (
     check_blood_pressure_fake_data,
 )
 from app.services.model_fun import get_ocr_model
+from app.services.quality_fun import check_image_quality, quality_stats
+from app.services.upload_fun import read_upload_limited, read_request_body_limited, FileTooLargeError
+from app.services.log_writer_service import api_log_writer
+from app.services.token_filter_service import token_filter
+from app.services.access_control_service import access_control
+from app.services.stream_analytics_service import stream_analytics
 
 # ===== 日志 =====
 import logging
@@ -57,9 +68,7 @@ MAX_PIXELS = int(os.getenv("MAX_PIXELS", 28 * 28 * 8192))  # 最大像素阈值
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", 500 * 1024))  # 最大文件大小（500KB）
 ENABLE_IMAGE_ENHANCEMENT = os.getenv("ENABLE_IMAGE_ENHANCEMENT", "true").lower() == "true"  # 是否启用图像增强
 API_TIMEOUT = int(os.getenv("GEMINI_TIMEOUT", "60"))  # API调用超时时间，默认60秒
-
-# 初始化数据库
-db = Database()
+MAX_BULK_TOKENS = int(os.getenv("MAX_BULK_TOKENS", "1000"))  # 批量创建token的单次上限
 
 
 @router.post("/image")
@@ -77,6 +86,73 @@ async def upload_image(
     返回:
         图像分析结果的JSON响应
     """
+    # 内存准入由 ImageAdmissionMiddleware 在解析multipart之前按Content-Length完成
+    return await handle_image_upload(
+        request,
+        token,
+        filename=image.filename,
+        content_type=image.content_type,
+        read_content=lambda: read_upload_limited(image, MAX_FILE_SIZE),
+        api_endpoint="/upload/image",
+    )
+
+
+@router.post("/image/raw")
+async def upload_image_raw(
+        request: Request,
+        token: str = None,
+        filename: str = None
+):
+    """
+    以原始请求体上传并分析单张医疗图像，跳过multipart解析和临时文件，
+    供只发送一张图像的血压计/血糖仪网关使用
+
+    请求体为图像二进制数据，Content-Type为 image/* 或 application/octet-stream
+
+    参数:
+        token: 验证令牌（URL参数或 X-Token 请求头）
+        filename: 文件名（URL参数或 X-Filename 请求头，可选）
+    返回:
+        与 /upload/image 相同的JSON响应
+    """
+    if not token:
+        token = request.headers.get("x-token")
+
+    # 内存准入由 ImageAdmissionMiddleware 在读取请求体之前按Content-Length完成
+    return await handle_image_upload(
+        request,
+        token,
+        filename=filename or request.headers.get("x-filename") or "raw_upload",
+        content_type=request.headers.get("content-type", ""),
+        read_content=lambda: read_request_body_limited(request, MAX_FILE_SIZE),
+        api_endpoint="/upload/image/raw",
+        allow_octet_stream=True,
+    )
+
+
+async def handle_image_upload(
+        request: Request,
+        token: str,
+        filename: str,
+        content_type: str,
+        read_content: Callable[[], Awaitable[Tuple[bytes, str]]],
+        api_endpoint: str,
+        allow_octet_stream: bool = False
+):
+    """
+    图像识别主流程，/upload/image 与 /upload/image/raw 共用
+
+    参数:
+        request: 请求对象
+        token: 验证令牌
+        filename: 文件名
+        content_type: 上传内容的MIME类型
+        read_content: 读取文件内容的协程函数，返回(文件内容, SHA-256摘要)
+        api_endpoint: 实际调用的接口路径，记录日志和统计时使用
+        allow_octet_stream: 是否接受 application/octet-stream（真实格式由格式协商识别）
+    返回:
+        图像分析结果的JSON响应
+    """
     # 从URL参数获取token
     if not token:
         token = request.query_params.get('token')
@@ -97,14 +173,13 @@ async def upload_image(
     # 开始计时
     start_time = time.time()
 
-    file = image
     # 获取当前日期
     current_date = datetime.now().strftime("%Y-%m-%d")
     # 获取客户端IP地址
     client_ip = request.client.host if request.client else "unknown"
-    # 检查token是否有效
+    # 检查token是否有效，并原子地预留一次使用次数
     try:
-        verify_token(token)
+        reservation = await reserve_quota(token)
     except HTTPException as e:
         # 记录API日志 - token验证失败
         try:
@@ -114,17 +189,16 @@ async def upload_image(
             error_code = error_detail.get("errors", [{}])[0].get("extensions", {}).get("code",
                                                                                        "TOKEN_ERROR") if "errors" in error_detail else "TOKEN_ERROR"
 
-            # 获取token当前使用次数（验证失败时可能为0）
-            current_use_times = get_token_use_times(token)
-
-            APILogRepository.log_api_request(
+            # 验证失败时token不存在或次数已用完
+            await api_log_writer.log(
                 client_ip=client_ip,
                 token=token,
-                api_endpoint="/upload/image",
+                api_endpoint=api_endpoint,
+                center_id=await get_token_center_id(token),
                 status="failed",
                 error_message=error_message,
                 error_code=error_code,
-                token_usetimes=current_use_times
+                token_usetimes=0
             )
         except Exception as log_error:
             print(f"记录API日志失败: {str(log_error)}")
@@ -135,23 +209,60 @@ async def upload_image(
             content=e.detail
         )
 
+    # 未确认的预留（失败、超时、异常或识别结果无效）一律归还
+    try:
+        return await process_image_upload(
+            request, token, filename, content_type, read_content, api_endpoint, allow_octet_stream,
+            client_ip, current_date, start_time, reservation
+        )
+    finally:
+        await release_quota(reservation)
+
+
+async def process_image_upload(
+        request: Request,
+        token: str,
+        filename: str,
+        content_type: str,
+        read_content: Callable[[], Awaitable[Tuple[bytes, str]]],
+        api_endpoint: str,
+        allow_octet_stream: bool,
+        client_ip: str,
+        current_date: str,
+        start_time: float,
+        reservation: QuotaReservation
+):
+    """
+    token预留成功后的处理流程：读取、格式协商、质量检测、模型识别、结果整理
+
+    参数:
+        reservation: 本次请求预留的使用次数，识别成功时确认，其余情况由调用方归还
+        其余参数同 handle_image_upload
+    返回:
+        图像分析结果的JSON响应
+    """
     # 生成文件上传ID
     file_upload_id = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
 
     # 检查文件是否为图像
-    if not file.content_type.startswith("image/"):
+    content_type = content_type or ""
+    is_image = content_type.startswith("image/") or (
+        allow_octet_stream and content_type.startswith("application/octet-stream")
+    )
+    if not is_image:
         # 记录API日志 - 文件格式错误
         try:
             # 获取token当前使用次数
-            current_use_times = get_token_use_times(token)
+            current_use_times = reservation.use_times
 
-            APILogRepository.log_api_request(
+            await api_log_writer.log(
                 client_ip=client_ip,
                 token=token,
-                api_endpoint="/upload/image",
+                api_endpoint=api_endpoint,
+                center_id=reservation.center_id,
                 status="failed",
                 file_upload_id=file_upload_id,
-                file_name=file.filename,
+                file_name=filename,
                 error_message="唯有上载图像文件",
                 error_code="UPLOAD_FILE_FAIL",
                 token_usetimes=current_use_times
@@ -171,24 +282,25 @@ async def upload_image(
                 ]
             }
         )
-    # 读取文件内容
-    file_content = await file.read()
-
-    # 检查文件大小
-    if len(file_content) > MAX_FILE_SIZE:
+    # 分块读取文件内容，超过大小限制立即中止，同时计算摘要
+    try:
+        file_content, file_digest = await read_content()
+        request.state.file_digest = file_digest
+    except FileTooLargeError as size_error:
         # 记录API日志 - 文件大小超限
         try:
             # 获取token当前使用次数
-            current_use_times = get_token_use_times(token)
+            current_use_times = reservation.use_times
 
-            APILogRepository.log_api_request(
+            await api_log_writer.log(
                 client_ip=client_ip,
                 token=token,
-                api_endpoint="/upload/image",
+                api_endpoint=api_endpoint,
+                center_id=reservation.center_id,
                 status="failed",
                 file_upload_id=file_upload_id,
-                file_name=file.filename,
-                file_size=len(file_content),
+                file_name=filename,
+                file_size=size_error.size,
                 error_message="文件大小超过1mb限制",
                 error_code="UPLOAD_FILE_FAIL",
                 token_usetimes=current_use_times
@@ -218,22 +330,92 @@ async def upload_image(
         #     # 千问模型使用处理后的图像
         #     processed_image = process_image(file_content, MIN_PIXELS, MAX_PIXELS)
         #     image_for_analysis = processed_image
-        # elif model_type == "gemini":
-            # Gemini模型使用原始图像（不需要预处理）
-            image_for_analysis = file_content
-            
+
+        # 格式协商：原生支持的格式（JPEG/PNG/WebP）原样透传，仅对HEIC等格式转码
+        try:
+            image_for_analysis, image_mime_type = negotiate_image_format(file_content)
+        except ValueError as format_error:
+            # 记录API日志 - 图像格式不支持
+            try:
+                current_use_times = reservation.use_times
+
+                await api_log_writer.log(
+                    client_ip=client_ip,
+                    token=token,
+                    api_endpoint=api_endpoint,
+                    center_id=reservation.center_id,
+                    status="failed",
+                    file_upload_id=file_upload_id,
+                    file_name=filename,
+                    file_size=len(file_content),
+                    error_message=str(format_error),
+                    error_code="UPLOAD_FILE_FAIL",
+                    token_usetimes=current_use_times
+                )
+            except Exception as log_error:
+                print(f"记录API日志失败: {str(log_error)}")
+
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "errors": [
+                        {
+                            "messages": str(format_error),
+                            "extensions": {
+                                "code": "UPLOAD_FILE_FAIL"}
+                        }
+                    ]
+                }
+            )
+
+        # 本地质量检测：模糊、过暗、过曝的照片直接提示重拍，不再调用模型
+        quality_result = check_image_quality(image_for_analysis)
+        quality_metrics = quality_result["metrics"] if quality_result else None
+        if quality_result and not quality_result["passed"]:
+            # 记录API日志 - 图像质量不合格
+            try:
+                current_use_times = reservation.use_times
+
+                await api_log_writer.log(
+                    client_ip=client_ip,
+                    token=token,
+                    api_endpoint=api_endpoint,
+                    center_id=reservation.center_id,
+                    status="failed",
+                    file_upload_id=file_upload_id,
+                    file_name=filename,
+                    file_size=len(file_content),
+                    error_message=quality_result["message"],
+                    error_code="IMG_QUALITY_ERROR",
+                    token_usetimes=current_use_times
+                )
+            except Exception as log_error:
+                print(f"记录API日志失败: {str(log_error)}")
+
+            return JSONResponse(
+                content={
+                    "errors": [
+                        {
+                            "message": quality_result["message"],
+                            "extensions": {
+                                "code": "IMG_QUALITY_ERROR",
+                                "reason": quality_result["reason"]
+                            }
+                        }
+                    ]
+                }
+            )
+
+        if model_type == "gemini":
             # 为Gemini模型设置超时处理
             print(f"使用Gemini模型，超时设置为{API_TIMEOUT}秒")
-        else:
-            # OpenAI模型使用原始图像（在模型内部进行压缩）
-            image_for_analysis = file_content
 
         try:
             #对图像外围20%的像素进行覆盖
             # image_for_analysis = crop_and_compress_image(image_for_analysis, target_size_ratio=0.8)
 
             # 使用统一的OCR模型接口进行分析
-            ocr_dict, usage_info = ocr_model.analyze_image(image_for_analysis, file.filename)
+            ocr_dict, usage_info = ocr_model.analyze_image(image_for_analysis, filename, image_mime_type)
 
             # 检查是否有错误
             if "error" in ocr_dict:
@@ -250,46 +432,37 @@ async def upload_image(
                         ]
                     }
                     
-                    # 在后台记录日志，不阻塞响应
-                    def log_timeout_in_background():
-                        try:
-                            current_use_times = get_token_use_times(token)
-                            APILogRepository.log_api_request(
-                                client_ip=client_ip,
-                                token=token,
-                                api_endpoint="/upload/image",
-                                status="timeout",
-                                file_upload_id=file_upload_id,
-                                file_name=file.filename,
-                                file_size=len(file_content),
-                                error_message=ocr_dict["error"],
-                                error_code="OCR_TIMEOUT",
-                                token_usetimes=current_use_times
-                            )
-                        except Exception as log_error:
-                            print(f"记录API日志失败: {str(log_error)}")
-                    
-                    # 创建一个线程来处理日志记录
-                    import threading
-                    log_thread = threading.Thread(target=log_timeout_in_background)
-                    log_thread.daemon = True
-                    log_thread.start()
-                    
+                    # 日志放入写入队列，不阻塞响应
+                    api_log_writer.submit(
+                        client_ip=client_ip,
+                        token=token,
+                        api_endpoint=api_endpoint,
+                        center_id=reservation.center_id,
+                        status="timeout",
+                        file_upload_id=file_upload_id,
+                        file_name=filename,
+                        file_size=len(file_content),
+                        error_message=ocr_dict["error"],
+                        error_code="OCR_TIMEOUT",
+                        token_usetimes=reservation.use_times
+                    )
+
                     # 立即返回响应
                     return JSONResponse(content=response_data)
                 
                 # 其他错误的处理逻辑
                 try:
-                    current_use_times = get_token_use_times(token)
+                    current_use_times = reservation.use_times
                     error_code = "OCR_ERROR"
                     
-                    APILogRepository.log_api_request(
+                    await api_log_writer.log(
                         client_ip=client_ip,
                         token=token,
-                        api_endpoint="/upload/image",
+                        api_endpoint=api_endpoint,
+                        center_id=reservation.center_id,
                         status="failed",
                         file_upload_id=file_upload_id,
-                        file_name=file.filename,
+                        file_name=filename,
                         file_size=len(file_content),
                         error_message=ocr_dict["error"],
                         error_code="OCR_ERROR",
@@ -324,15 +497,16 @@ async def upload_image(
                 # 记录API日志 - 图像不相关
                 try:
                     # 获取token当前使用次数
-                    current_use_times = get_token_use_times(token)
+                    current_use_times = reservation.use_times
 
-                    APILogRepository.log_api_request(
+                    await api_log_writer.log(
                         client_ip=client_ip,
                         token=token,
-                        api_endpoint="/upload/image",
+                        api_endpoint=api_endpoint,
+                        center_id=reservation.center_id,
                         status="not_relevant",
                         file_upload_id=file_upload_id,
-                        file_name=file.filename,
+                        file_name=filename,
                         file_size=len(file_content),
                         ai_usage=ai_usage_value,
                         error_message="图像不相关",
@@ -365,22 +539,25 @@ async def upload_image(
                 # 检查数据有效性
                 error_response = check_blood_pressure_validity(
                     ocr_dict, current_date, client_ip, ai_usage_value,
-                    file_upload_id, file.filename, len(file_content), token
+                    file_upload_id, filename, len(file_content), token
                 )
                 if error_response:
+                    quality_stats.record_outcome(ocr_dict["data"].get("category"), quality_metrics, valid=False)
+
                     # 记录API日志 - 血压数据验证失败
                     try:
                         # 获取token当前使用次数
-                        current_use_times = get_token_use_times(token)
+                        current_use_times = reservation.use_times
                         device_type = ocr_dict["data"]["category"]
 
-                        APILogRepository.log_api_request(
+                        await api_log_writer.log(
                             client_ip=client_ip,
                             token=token,
-                            api_endpoint="/upload/image",
+                            api_endpoint=api_endpoint,
+                            center_id=reservation.center_id,
                             status="failed",
                             file_upload_id=file_upload_id,
-                            file_name=file.filename,
+                            file_name=filename,
                             file_size=len(file_content),
                             ai_usage=ai_usage_value,
                             error_message="数据验证失败",
@@ -392,7 +569,7 @@ async def upload_image(
                         print(f"记录API日志失败: {str(log_error)}")
                     return error_response
 
-
+                quality_stats.record_outcome(ocr_dict["data"].get("category"), quality_metrics, valid=True)
 
                 # 替换日期为当前日期
                 ocr_dict["data"]["measure_date"] = current_date
@@ -405,7 +582,7 @@ async def upload_image(
 
                 # 添加文件相关信息
                 ocr_dict["data"]["file_upload_id"] = file_upload_id
-                ocr_dict["data"]["file_name"] = file.filename
+                ocr_dict["data"]["file_name"] = filename
                 ocr_dict["data"]["file_size"] = len(file_content)
                 ocr_dict["data"]["token"] = token
 
@@ -542,8 +719,7 @@ async def upload_image(
             # 如果OCR识别成功，更新token使用次数
             if (ocr_dict.get("data") and
                     ocr_dict["data"].get("category") not in ["Not relevant", "error", None]):
-                update_token_usage(token)
-                print(f"Token使用次数已更新: {token}")
+                await commit_quota(reservation)
             else:
                 print(f"Token使用次数未更新，条件不满足: category={ocr_dict.get('data', {}).get('category')}")
 
@@ -556,18 +732,19 @@ async def upload_image(
                     log_status = "error"
 
                 # 获取token当前使用次数
-                current_use_times = get_token_use_times(token)
+                current_use_times = reservation.use_times
                 device_type = ocr_dict["data"]["category"]
                 api_execution_time = time.time() - start_time
                 processing_time = Decimal(api_execution_time).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
-                APILogRepository.log_api_request(
+                await api_log_writer.log(
                     client_ip=client_ip,
                     token=token,
-                    api_endpoint="/upload/image",
+                    api_endpoint=api_endpoint,
+                    center_id=reservation.center_id,
                     status=log_status,
                     file_upload_id=file_upload_id,
-                    file_name=file.filename,
+                    file_name=filename,
                     file_size=len(file_content),
                     ai_usage=ocr_dict["data"].get("ai_usage", 0),
                     token_usetimes=current_use_times,
@@ -594,15 +771,16 @@ async def upload_image(
             # 记录API日志 - 解析失败
             try:
                 # 获取token当前使用次数
-                current_use_times = get_token_use_times(token)
+                current_use_times = reservation.use_times
 
-                APILogRepository.log_api_request(
+                await api_log_writer.log(
                     client_ip=client_ip,
                     token=token,
-                    api_endpoint="/upload/image",
+                    api_endpoint=api_endpoint,
+                    center_id=reservation.center_id,
                     status="failed",
                     file_upload_id=file_upload_id,
-                    file_name=file.filename,
+                    file_name=filename,
                     file_size=len(file_content),
                     error_message=f"OCR解析失败: {str(parse_error)}",
                     error_code="OCR_PARSE_ERROR",
@@ -621,18 +799,17 @@ async def upload_image(
     except Exception as e:
         # 记录API日志 - 系统异常
         try:
-            # 获取token当前使用次数（如果token存在的话）
-            current_use_times = 0
-            if 'token' in locals() and token:
-                current_use_times = get_token_use_times(token)
+            # 获取token当前使用次数
+            current_use_times = reservation.use_times
 
-            APILogRepository.log_api_request(
+            await api_log_writer.log(
                 client_ip=client_ip if 'client_ip' in locals() else "unknown",
                 token=token if 'token' in locals() else "",
-                api_endpoint="/upload/image",
+                api_endpoint=api_endpoint,
+                center_id=reservation.center_id,
                 status="failed",
                 file_upload_id=file_upload_id if 'file_upload_id' in locals() else None,
-                file_name=file.filename if 'file' in locals() and file else None,
+                file_name=filename,
                 file_size=len(file_content) if 'file_content' in locals() else None,
                 error_message=f"系统异常: {str(e)}",
                 error_code="SYSTEM_ERROR",
@@ -646,21 +823,24 @@ async def upload_image(
         raise HTTPException(status_code=500, detail=f"UPLOAD_FILE_FAIL: {str(e)}")
 
 
-@router.post("/add_token")
-async def add_token(request: Request, token_data: dict):
-    """        
-    - token: 可選，使用者自填token，如果為空則自動生成
-    - use_times: 可選，token可使用次數，如果為空則預設為10次
-    - center_id: 必填，中心ID
+def generate_token() -> str:
+    """生成10位随机字母数字组合的token"""
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=10))
 
- 返回:
- 包含新建token資訊的字典
+
+async def authorize_token_admin(request: Request, token_data: dict, api_endpoint: str):
     """
-    # 查询数据库中的 IP 白名单
-    db = Database()
-    allowed_ips = db.get_allowed_ips()
-    ALLOWED_IPS = allowed_ips if allowed_ips else []
-    print("ALLOWED_IPS:", ALLOWED_IPS)
+    Token管理接口的公共校验：center_id必填且存在、客户端IP在白名单内
+
+    参数:
+        request: 请求对象
+        token_data: 请求体
+        api_endpoint: 记录日志用的接口路径
+    返回:
+        (错误响应或None, 客户端IP, center_id)
+    """
+    # IP白名单与中心列表的缓存快照（定期刷新）
+    access = await access_control.get_snapshot()
 
     # 获取客户端 IP
     client_ip = request.client.host if request.client else None
@@ -670,10 +850,10 @@ async def add_token(request: Request, token_data: dict):
     if "center_id" not in token_data:
         # 记录API日志 - center_id缺失
         try:
-            APILogRepository.log_api_request(
+            await api_log_writer.log(
                 client_ip=client_ip or "unknown",
                 token="",
-                api_endpoint="/upload/add_token",
+                api_endpoint=api_endpoint,
                 status="failed",
                 error_message="center_id为必填項",
                 error_code="FORBIDDEN",
@@ -692,16 +872,16 @@ async def add_token(request: Request, token_data: dict):
                     }
                 }]
             }
-        )
+        ), client_ip, None
 
     center_id = token_data["center_id"]
-    if not db.center_id_exists(center_id):
+    if not await access_control.center_exists(center_id):
         # 记录API日志 - center_id不存在
         try:
-            APILogRepository.log_api_request(
+            await api_log_writer.log(
                 client_ip=client_ip or "unknown",
                 token="",
-                api_endpoint="/upload/add_token",
+                api_endpoint=api_endpoint,
                 status="failed",
                 error_message="center_id不存在",
                 error_code="FORBIDDEN",
@@ -722,16 +902,16 @@ async def add_token(request: Request, token_data: dict):
                         }
                     }
                 ]
-            })
+            }), client_ip, None
 
-    # IP 验证：检查前三位是否匹配
+    # IP 验证：按白名单中的网段匹配（不带前缀长度的IPv4地址沿用前三位匹配）
     if not client_ip:
         # 记录API日志 - 无法获取IP
         try:
-            APILogRepository.log_api_request(
+            await api_log_writer.log(
                 client_ip="unknown",
                 token="",
-                api_endpoint="/upload/add_token",
+                api_endpoint=api_endpoint,
                 status="failed",
                 error_message="無法獲取客戶端 IP",
                 error_code="IP_DENY",
@@ -748,17 +928,15 @@ async def add_token(request: Request, token_data: dict):
                     "extensions": {"code": "IP_DENY"}
                 }]
             }
-        )
+        ), client_ip, None
 
-    client_prefix = get_ip_prefix(client_ip)
-    allowed_prefixes = [get_ip_prefix(ip) for ip in ALLOWED_IPS]
-    if client_prefix not in allowed_prefixes:
+    if not access.is_ip_allowed(client_ip):
         # 记录API日志 - IP受限
         try:
-            APILogRepository.log_api_request(
+            await api_log_writer.log(
                 client_ip=client_ip,
                 token="",
-                api_endpoint="/upload/add_token",
+                api_endpoint=api_endpoint,
                 status="failed",
                 error_message="IP 使用有限制",
                 error_code="IP_DENY",
@@ -775,19 +953,37 @@ async def add_token(request: Request, token_data: dict):
                     # "extensions": {"code": "IP_DENY", "reason": "请联系info@2dqy.com或bob@2dqy.com"}
                 }]
             }
-        )
+        ), client_ip, None
+
+    return None, client_ip, center_id
+
+
+@router.post("/add_token")
+async def add_token(request: Request, token_data: dict):
+    """        
+    - token: 可選，使用者自填token，如果為空則自動生成
+    - use_times: 可選，token可使用次數，如果為空則預設為10次
+    - center_id: 必填，中心ID
+
+ 返回:
+ 包含新建token資訊的字典
+    """
+    # 校验center_id与客户端IP
+    error_response, client_ip, center_id = await authorize_token_admin(request, token_data, "/upload/add_token")
+    if error_response:
+        return error_response
 
     # 获取并处理token参数
     token = token_data.get("token", '')
 
     # 如果token为空或不存在，生成10位随机字母数字组合的token
     if not token:
-        token = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
+        token = generate_token()
     # 如果token包含非字母数字字符，返回HTTP错误400
     elif not token.isalnum():
         # 记录API日志 - token格式无效
         try:
-            APILogRepository.log_api_request(
+            await api_log_writer.log(
                 client_ip=client_ip,
                 token=token,
                 api_endpoint="/upload/add_token",
@@ -815,10 +1011,10 @@ async def add_token(request: Request, token_data: dict):
     use_times = token_data.get("use_times", 10)
 
     # 检查 token 是否存在
-    if db.token_exists(token):
+    if await AsyncTokenRepository.token_exists(token):
         # 记录API日志 - token已存在
         try:
-            APILogRepository.log_api_request(
+            await api_log_writer.log(
                 client_ip=client_ip,
                 token=token,
                 api_endpoint="/upload/add_token",
@@ -846,11 +1042,12 @@ async def add_token(request: Request, token_data: dict):
 
     # 插入新token
     try:
-        db.add_token(token, use_times, center_id)
+        token_id = await AsyncTokenRepository.add_token(token, use_times, center_id)
+        token_filter.add(token)
     except ValueError as e:
         # 记录API日志 - 插入token失败
         try:
-            APILogRepository.log_api_request(
+            await api_log_writer.log(
                 client_ip=client_ip,
                 token=token,
                 api_endpoint="/upload/add_token",
@@ -878,7 +1075,7 @@ async def add_token(request: Request, token_data: dict):
 
     # 记录API日志 - 成功创建token
     try:
-        APILogRepository.log_api_request(
+        await api_log_writer.log(
             client_ip=client_ip,
             token=token,
             api_endpoint="/upload/add_token",
@@ -892,13 +1089,219 @@ async def add_token(request: Request, token_data: dict):
     # 返回成功创建的token信息
     return {
         "data": {
-            "id": db.cursor.lastrowid,
+            "id": token_id,
             "token": token,
             "use_times": use_times,
         }
     }
 
 
+def bulk_token_error(message: str) -> JSONResponse:
+    """批量创建token的请求格式错误"""
+    return JSONResponse(
+        status_code=400,
+        content={
+            "errors": [{
+                "message": message,
+                "extensions": {
+                    "code": "TOKEN_INVALID",
+                }
+            }]
+        }
+    )
+
+
+@router.post("/add_tokens")
+async def add_tokens(request: Request, token_data: dict):
+    """
+    批量创建同一中心的token，整批在一个事务中用多行INSERT写入
+
+    参数:
+        request: 请求对象
+        token_data: 请求体
+            - center_id: 必填，中心ID
+            - tokens: 可选，token列表，每项为 {"token": 可选, "use_times": 可选}
+            - count: 可选，未提供tokens时自动生成的token数量
+            - use_times: 可选，自动生成或未指定次数的token可使用次数，默认为10次
+    返回:
+        每个token的处理结果（created / exists / invalid / duplicate）
+    """
+    # 校验center_id与客户端IP（整批只校验一次）
+    error_response, client_ip, center_id = await authorize_token_admin(request, token_data, "/upload/add_tokens")
+    if error_response:
+        return error_response
+
+    default_use_times = token_data.get("use_times", 10)
+    token_specs = token_data.get("tokens")
+    count = token_data.get("count")
+    if (token_specs is None) == (count is None):
+        return bulk_token_error("tokens與count須提供其中一項")
+    if token_specs is not None and not isinstance(token_specs, list):
+        return bulk_token_error("tokens須為列表")
+    if count is not None and (not isinstance(count, int) or isinstance(count, bool)):
+        return bulk_token_error("count須為整數")
+    requested = len(token_specs) if token_specs is not None else count
+    if not 0 < requested <= MAX_BULK_TOKENS:
+        return bulk_token_error(f"單次可創建1至{MAX_BULK_TOKENS}個token")
+
+    # 逐项校验，格式无效或重复的token不参与插入
+    items = [item if isinstance(item, dict) else {"token": item} for item in token_specs or [{}] * count]
+    explicit = {item["token"] for item in items if isinstance(item.get("token"), str) and item["token"]}
+    results = []
+    pending = {}  # {token: 结果项}，等待插入的token
+    auto_generated = set()
+    for item in items:
+        token = item.get("token")
+        if not token:
+            token = generate_token()
+            while token in explicit or token in auto_generated:
+                token = generate_token()
+            auto_generated.add(token)
+        use_times = item.get("use_times", default_use_times)
+        result = {"token": token, "use_times": use_times}
+        results.append(result)
+        if not isinstance(token, str) or not token.isalnum():
+            result.update(status="invalid", message="Token只能包含字母和數字")
+        elif not isinstance(use_times, int) or isinstance(use_times, bool) or use_times < 0:
+            result.update(status="invalid", message="use_times須為非負整數")
+        elif token in pending:
+            result.update(status="duplicate", message="請求中的token重複")
+        else:
+            pending[token] = result
+
+    # 一个事务内查重并插入；自动生成的token与已有token冲突时换一个再插入（最多重试3轮）
+    try:
+        for _ in range(3):
+            if not pending:
+                break
+            created = await AsyncTokenRepository.add_tokens(
+                [(token, result["use_times"]) for token, result in pending.items()], center_id
+            )
+            retry = {}
+            for token, token_id in created.items():
+                result = pending[token]
+                if token_id is not None:
+                    result.update(status="created", id=token_id)
+                elif token in auto_generated:
+                    new_token = generate_token()
+                    while new_token in explicit or new_token in auto_generated:
+                        new_token = generate_token()
+                    auto_generated.add(new_token)
+                    result["token"] = new_token
+                    retry[new_token] = result
+                else:
+                    result.update(status="exists", message="Token已存在")
+            pending = retry
+        for result in pending.values():
+            result.update(status="exists", message="Token已存在")
+    except ValueError as e:
+        # 并发插入导致唯一键冲突，整批已回滚
+        try:
+            await api_log_writer.log(
+                client_ip=client_ip,
+                token="",
+                api_endpoint="/upload/add_tokens",
+                status="failed",
+                error_message=str(e),
+                error_code="TOKEN_EXIST",
+                center_id=center_id
+            )
+        except Exception as log_error:
+            print(f"记录API日志失败: {str(log_error)}")
+
+        return JSONResponse(
+            status_code=400,
+            content={
+                "errors": [{
+                    "message": str(e),
+                    "extensions": {
+                        "code": "TOKEN_EXIST"
+                    }
+                }]
+            }
+        )
+
+    created_count = 0
+    for result in results:
+        if result["status"] != "created":
+            continue
+        created_count += 1
+        token_filter.add(result["token"])
+
+        # 记录API日志 - 成功创建token（经批量写入器合并写库）
+        try:
+            await api_log_writer.log(
+                client_ip=client_ip,
+                token=result["token"],
+                api_endpoint="/upload/add_tokens",
+                status="success",
+                token_usetimes=result["use_times"],
+                center_id=center_id
+            )
+        except Exception as log_error:
+            print(f"记录API日志失败: {str(log_error)}")
+
+    return {
+        "data": {
+            "center_id": center_id,
+            "requested": requested,
+            "created": created_count,
+            "results": results,
+        }
+    }
+
+
+@router.post("/access_control/refresh")
+async def refresh_access_control(request: Request):
+    """IP白名单或中心列表变更后立即刷新缓存快照（仅白名单内的IP可调用）"""
+    client_ip = request.client.host if request.client else None
+    access = await access_control.get_snapshot()
+    if not access.is_ip_allowed(client_ip):
+        return JSONResponse(
+            status_code=403,
+            content={
+                "errors": [{
+                    "message": "IP 使用有限制",
+                    "extensions": {"code": "IP_DENY"}
+                }]
+            }
+        )
+
+    access_control.invalidate()
+    access = await access_control.get_snapshot()
+    return {
+        "data": {
+            "networks": len(access.allowlist),
+            "centers": len(access.centers),
+        }
+    }
+
+
+@router.get("/analytics")
+async def get_stream_analytics(request: Request, window: int = 300, top: int = 10, raw: bool = False):
+    """
+    最近 window 秒的近似Top-K（token、IP、错误代码、中心、接口）与 processing_time 分位数（仅白名单内的IP可调用）
+
+    数据来自进程内的流式统计，不查询数据库；raw=true 时返回可合并的摘要，
+    多worker部署时用 python -m app.services.stream_analytics_service 合并
+    """
+    client_ip = request.client.host if request.client else None
+    access = await access_control.get_snapshot()
+    if not access.is_ip_allowed(client_ip):
+        return JSONResponse(
+            status_code=403,
+            content={
+                "errors": [{
+                    "message": "IP 使用有限制",
+                    "extensions": {"code": "IP_DENY"}
+                }]
+            }
+        )
+
+    summary = stream_analytics.summary(max(window, 1))
+    return {"data": summary.to_dict() if raw else summary.report(max(1, min(top, summary.capacity)))}
+
+
 @router.get("/html")
 async def read_root():
     """返回HTML首页"""
@@ -913,6 +1316,24 @@ async def get_config():
         "api_base_url": settings.API_BASE_URL
     }
 
+@router.get("/quality_stats")
+async def get_quality_stats(request: Request):
+    """获取图像质量检测统计（按设备类型），用于调整各类型的阈值（仅白名单内的IP可调用）"""
+    client_ip = request.client.host if request.client else None
+    access = await access_control.get_snapshot()
+    if not access.is_ip_allowed(client_ip):
+        return JSONResponse(
+            status_code=403,
+            content={
+                "errors": [{
+                    "message": "IP 使用有限制",
+                    "extensions": {"code": "IP_DENY"}
+                }]
+            }
+        )
+
+    return quality_stats.snapshot()
+
 # 原来的健康检查接口改为新的路径
 
 @router.get("/email")
@@ -1,87 +1,281 @@
-# """
-# Dashboard API接口
-# """
-# from fastapi import APIRouter, HTTPException, Query
-# from fastapi.responses import JSONResponse
-# from typing import Optional
-# from app.services.dashboard_service import DashboardService
-# import logging
-#
-# # 设置日志
-# logging.basicConfig(level=logging.INFO)
-# logger = logging.getLogger(__name__)
-#
-# router = APIRouter(prefix="/dashboard")
-#
-#
-# @router.get("/data")
-# async def get_dashboard_data(year_month: Optional[str] = Query(None, description="年月格式 YYYY-MM，不提供则使用当前月份")):
-#     """
-#     获取Dashboard分析数据
-#
-#     参数:
-#         year_month: 年月格式，例如 "2025-01"，不提供则默认使用当前月份
-#
-#     返回:
-#         包含各种分析数据的JSON响应
-#     """
-#     try:
-#         # 如果没有提供year_month，使用当前月份
-#         if not year_month:
-#             year_month = DashboardService.get_current_month()
-#
-#         # 验证年月格式
-#         if len(year_month) != 7 or year_month[4] != '-':
-#             raise HTTPException(
-#                 status_code=400,
-#                 detail="年月格式错误，应为 YYYY-MM 格式，例如 2025-01"
-#             )
-#
-#         # 获取分析数据
-#         analysis_data = DashboardService.get_dashboard_analysis(year_month)
-#
-#         return JSONResponse(
-#             status_code=200,
-#             content={
-#                 "success": True,
-#                 "data": analysis_data
-#             }
-#         )
-#
-#     except Exception as e:
-#         logger.error(f"获取Dashboard数据失败: {str(e)}")
-#         raise HTTPException(
-#             status_code=500,
-#             detail=f"获取Dashboard数据失败: {str(e)}"
-#         )
-#
-#
-# @router.get("/months")
-# async def get_available_months():
-#     """
-#     获取有数据的月份列表
-#
-#     返回:
-#         可用月份列表和当前月份
-#     """
-#     try:
-#         months = DashboardService.get_available_months()
-#         current_month = DashboardService.get_current_month()
-#
-#         return JSONResponse(
-#             status_code=200,
-#             content={
-#                 "success": True,
-#                 "data": {
-#                     "months": months,
-#                     "current_month": current_month
-#                 }
-#             }
-#         )
-#
-#     except Exception as e:
-#         logger.error(f"获取可用月份失败: {str(e)}")
-#         raise HTTPException(
-#             status_code=500,
-#             detail=f"获取可用月份失败: {str(e)}"
-#         )
\ No newline at end of file
+"""
+Dashboard API接口
+"""
+import asyncio
+import os
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Optional
+from app.services.dashboard_service import DashboardService, MAX_LOG_PAGE_SIZE
+from app.services.dashboard_cache_service import dashboard_cache, etag_matches
+from app.services.log_export_service import LOG_EXPORT_FORMATS, log_exporter
+from app.services.dashboard_events_service import SubscriberLimitError, dashboard_events
+from app.services.access_control_service import access_control
+from app.models.database import month_range
+import logging
+
+# 设置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/dashboard")
+
+# SSE心跳间隔（秒）：没有增量时定期发送注释行，防止代理因空闲断开连接，同时检查客户端是否已断开
+DASHBOARD_EVENTS_HEARTBEAT = float(os.getenv("DASHBOARD_EVENTS_HEARTBEAT", "15"))
+
+
+def validate_year_month(year_month: str):
+    """验证年月格式，错误时抛出400"""
+    try:
+        valid = len(year_month) == 7 and bool(datetime.strptime(year_month, '%Y-%m'))
+    except ValueError:
+        valid = False
+    if not valid:
+        raise HTTPException(
+            status_code=400,
+            detail="年月格式错误，应为 YYYY-MM 格式，例如 2025-01"
+        )
+
+
+@router.get("/data")
+async def get_dashboard_data(request: Request,
+                             year_month: Optional[str] = Query(None, description="年月格式 YYYY-MM，不提供则使用当前月份")):
+    """
+    获取Dashboard分析数据（结果按月份缓存，带ETag，内容未变时返回304）
+
+    参数:
+        year_month: 年月格式，例如 "2025-01"，不提供则默认使用当前月份
+
+    返回:
+        包含各种分析数据的JSON响应
+    """
+    try:
+        # 如果没有提供year_month，使用当前月份
+        if not year_month:
+            year_month = DashboardService.get_current_month()
+
+        # 验证年月格式
+        validate_year_month(year_month)
+
+        # 获取分析数据（缓存未命中时在线程池中计算，同一月份同时只计算一次）
+        entry = await dashboard_cache.get(year_month, DashboardService.get_dashboard_analysis)
+        headers = {"ETag": entry.etag, "Cache-Control": entry.cache_control}
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            dashboard_cache.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取Dashboard数据失败: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取Dashboard数据失败: {str(e)}"
+        )
+
+
+@router.get("/logs")
+async def get_logs(year_month: Optional[str] = Query(None, description="年月格式 YYYY-MM，不提供则使用当前月份"),
+                   limit: int = Query(50, ge=1, le=MAX_LOG_PAGE_SIZE, description="每页条数"),
+                   cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+                   sort: str = Query("timestamp", description="排序列：timestamp、processing_time、file_size"),
+                   order: str = Query("desc", description="排序方向：desc 或 asc"),
+                   center_id: Optional[str] = Query(None),
+                   token: Optional[str] = Query(None),
+                   status: Optional[str] = Query(None),
+                   device_type: Optional[str] = Query(None),
+                   error_code: Optional[str] = Query(None),
+                   with_total: bool = Query(False, description="是否返回符合条件的总条数")):
+    """
+    分页获取原始日志（按排序键和id做键集分页，用 next_cursor 翻到下一页）
+
+    参数:
+        year_month: 年月格式，例如 "2025-01"，不提供则默认使用当前月份
+        limit: 每页条数
+        cursor: 上一页返回的 next_cursor，第一页不传；排序参数改变后需从第一页重新开始
+        sort/order: 排序列与方向
+        center_id/token/status/device_type/error_code: 筛选条件
+        with_total: 是否返回总条数（需要额外的计数查询）
+
+    返回:
+        {"success": true, "data": {"rows": [...], "next_cursor": "...", "total": ...}}
+    """
+    try:
+        if not year_month:
+            year_month = DashboardService.get_current_month()
+        validate_year_month(year_month)
+
+        filters = {
+            "center_id": center_id,
+            "token": token,
+            "status": status,
+            "device_type": device_type,
+            "error_code": error_code,
+        }
+        filters = {column: value for column, value in filters.items() if value}
+        try:
+            data = await asyncio.to_thread(
+                DashboardService.get_logs, year_month, filters, sort, order, cursor, limit, with_total
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        return JSONResponse(
+            status_code=200,
+            content={
+                "success": True,
+                "data": data
+            }
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取原始日志失败: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取原始日志失败: {str(e)}"
+        )
+
+
+@router.get("/export")
+async def export_logs(request: Request,
+                      year_month: Optional[str] = Query(None, description="年月格式 YYYY-MM，不提供则使用当前月份"),
+                      start: Optional[str] = Query(None, description="开始日期 YYYY-MM-DD（包含），与end一起代替year_month"),
+                      end: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD（不包含）"),
+                      format: str = Query("csv", description="导出格式：csv 或 ndjson"),
+                      gzip: bool = Query(False, description="是否gzip压缩"),
+                      center_id: Optional[str] = Query(None),
+                      token: Optional[str] = Query(None),
+                      api_endpoint: Optional[str] = Query(None),
+                      status: Optional[str] = Query(None)):
+    """
+    导出时间范围内的API日志（关联tokens），边查询边输出，不在内存中保存整个结果（仅白名单内的IP可调用，token只保留首尾各4位）
+
+    参数:
+        year_month: 导出整月，例如 "2025-01"
+        start/end: 导出 [start, end) 日期范围，提供时忽略 year_month
+        format: csv 或 ndjson
+        gzip: 是否gzip压缩（文件名带 .gz）
+        center_id/token/api_endpoint/status: 过滤条件
+
+    返回:
+        以附件形式下载的CSV/NDJSON文件
+    """
+    client_ip = request.client.host if request.client else None
+    access = await access_control.get_snapshot()
+    if not access.is_ip_allowed(client_ip):
+        return JSONResponse(
+            status_code=403,
+            content={
+                "errors": [{
+                    "message": "IP 使用有限制",
+                    "extensions": {"code": "IP_DENY"}
+                }]
+            }
+        )
+
+    if format not in LOG_EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="导出格式错误，应为 csv 或 ndjson")
+
+    if start or end:
+        try:
+            range_start = datetime.strptime(start or "", '%Y-%m-%d')
+            range_end = datetime.strptime(end or "", '%Y-%m-%d')
+        except ValueError:
+            raise HTTPException(status_code=400, detail="日期格式错误，start 和 end 应为 YYYY-MM-DD 格式")
+        if range_start >= range_end:
+            raise HTTPException(status_code=400, detail="start 应早于 end")
+    else:
+        if not year_month:
+            year_month = DashboardService.get_current_month()
+        validate_year_month(year_month)
+        range_start, range_end = month_range(year_month)
+
+    filename = log_exporter.filename(range_start, range_end, format, gzip, center_id)
+    # 同步生成器由Starlette逐块放到线程池中读取，不阻塞事件循环
+    chunks = log_exporter.iter_export(
+        range_start, range_end, format, gzip,
+        center_id=center_id, token=token, api_endpoint=api_endpoint, status=status,
+    )
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if gzip else LOG_EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/events")
+async def dashboard_event_stream(request: Request):
+    """
+    Dashboard实时增量（Server-Sent Events）
+
+    每隔几秒推送一条 delta 事件，内容为这段时间内新增的请求数、成功/失败数、处理时间直方图
+    以及按中心、设备类型、错误代码的计数，页面在已加载的当月统计上累加
+
+    返回:
+        text/event-stream
+    """
+    try:
+        queue = dashboard_events.subscribe()
+    except SubscriberLimitError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def stream():
+        try:
+            # 断开后浏览器5秒后自动重连
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=DASHBOARD_EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    # 被总线断开（积压过多或应用退出）
+                    break
+                yield f"event: delta\ndata: {message}\n\n"
+        finally:
+            dashboard_events.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/months")
+async def get_available_months():
+    """
+    获取有数据的月份列表
+
+    返回:
+        可用月份列表和当前月份
+    """
+    try:
+        months = await asyncio.to_thread(DashboardService.get_available_months)
+        current_month = DashboardService.get_current_month()
+
+        return JSONResponse(
+            status_code=200,
+            content={
+                "success": True,
+                "data": {
+                    "months": months,
+                    "current_month": current_month
+                }
+            }
+        )
+
+    except Exception as e:
+        logger.error(f"获取可用月份失败: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取可用月份失败: {str(e)}"
+        )
@@ -0,0 +1,143 @@
+"""
+按内存占用（而非请求数）进行准入控制
+
+每个上传在处理过程中会持有多份图像数据（文件内容、模型请求、转码副本等），
+按估算的峰值内存占用从全局字节预算中申请额度，预算不足时短暂排队，
+超时后返回503并带上Retry-After
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from app.core.metrics import Metric, metrics_registry
+
+# 图像处理流程的全局内存预算（字节）
+IMAGE_MEMORY_BUDGET = int(os.getenv("IMAGE_MEMORY_BUDGET", 128 * 1024 * 1024))
+# 峰值内存 ≈ 文件大小 × 系数 + 固定开销
+IMAGE_MEMORY_FACTOR = float(os.getenv("IMAGE_MEMORY_FACTOR", "4"))
+IMAGE_MEMORY_OVERHEAD = int(os.getenv("IMAGE_MEMORY_OVERHEAD", 1024 * 1024))
+# 预算不足时最长排队时间（秒）
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
+# 拒绝时建议客户端重试的间隔（秒）
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+
+class AdmissionRejected(Exception):
+    """排队超时仍未获得内存额度"""
+
+    def __init__(self, requested: int, retry_after: int):
+        super().__init__(f"内存预算不足: 需要 {requested} bytes")
+        self.requested = requested
+        self.retry_after = retry_after
+
+
+def estimate_peak_memory(file_size: int) -> int:
+    """
+    估算处理一个上传所需的峰值内存
+
+    Args:
+        file_size: 文件大小（字节）
+
+    Returns:
+        估算的峰值内存（字节）
+    """
+    return int(file_size * IMAGE_MEMORY_FACTOR) + IMAGE_MEMORY_OVERHEAD
+
+
+class ByteBudget:
+    """字节预算信号量：按字节数而非请求数准入"""
+
+    def __init__(self, capacity: int, queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+                 retry_after: int = ADMISSION_RETRY_AFTER):
+        self.capacity = capacity
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.waiting = 0
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.wait_seconds_total = 0.0
+        self._condition = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # 延迟创建，保证绑定到运行中的事件循环
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self, nbytes: int) -> int:
+        """
+        申请额度，预算不足时最多排队queue_timeout秒
+
+        Args:
+            nbytes: 申请的字节数（超过总预算时按总预算计，保证能单独运行）
+
+        Returns:
+            实际占用的字节数，释放时传回release
+
+        Raises:
+            AdmissionRejected: 排队超时
+        """
+        nbytes = max(0, min(nbytes, self.capacity))
+        condition = self._get_condition()
+        start = time.monotonic()
+        async with condition:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(
+                    condition.wait_for(lambda: self.in_flight + nbytes <= self.capacity),
+                    timeout=self.queue_timeout,
+                )
+            except asyncio.TimeoutError:
+                self.rejected_total += 1
+                raise AdmissionRejected(nbytes, self.retry_after)
+            finally:
+                self.waiting -= 1
+                self.wait_seconds_total += time.monotonic() - start
+
+            self.in_flight += nbytes
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.admitted_total += 1
+        return nbytes
+
+    async def release(self, nbytes: int):
+        """释放额度并唤醒排队的请求"""
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= nbytes
+            condition.notify_all()
+
+    @asynccontextmanager
+    async def admit(self, nbytes: int):
+        """在上下文内占用nbytes额度"""
+        acquired = await self.acquire(nbytes)
+        try:
+            yield acquired
+        finally:
+            await self.release(acquired)
+
+    def collect_metrics(self):
+        """导出指标"""
+        return [
+            Metric("ocr_image_bytes_in_flight", "gauge", "图像处理流程当前占用的估算内存（字节）",
+                   [({}, self.in_flight)]),
+            Metric("ocr_image_bytes_in_flight_peak", "gauge", "图像处理流程估算内存占用峰值（字节）",
+                   [({}, self.peak_in_flight)]),
+            Metric("ocr_image_bytes_budget", "gauge", "图像处理流程内存预算（字节）",
+                   [({}, self.capacity)]),
+            Metric("ocr_admission_waiting", "gauge", "正在排队等待内存额度的请求数",
+                   [({}, self.waiting)]),
+            Metric("ocr_admission_admitted_total", "counter", "获得准入的请求总数",
+                   [({}, self.admitted_total)]),
+            Metric("ocr_admission_rejected_total", "counter", "因内存预算不足被拒绝（503）的请求总数",
+                   [({}, self.rejected_total)]),
+            Metric("ocr_admission_wait_seconds_total", "counter", "等待内存额度的累计时间（秒）",
+                   [({}, round(self.wait_seconds_total, 6))]),
+        ]
+
+
+# 全局图像处理内存预算
+image_memory_budget = ByteBudget(IMAGE_MEMORY_BUDGET)
+metrics_registry.register(image_memory_budget.collect_metrics)
@@ -27,6 +27,8 @@ class Settings(BaseSettings):
     MIN_PIXELS: int = int(os.getenv("MIN_PIXELS"))
     MAX_PIXELS: int = int(os.getenv("MAX_PIXELS"))
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE"))
+    # multipart边界、表单头等额外开销，请求体超过 MAX_FILE_SIZE + 此值时直接拒绝
+    UPLOAD_MULTIPART_OVERHEAD: int = int(os.getenv("UPLOAD_MULTIPART_OVERHEAD", 16 * 1024))
     
     class Config:
         case_sensitive = True
@@ -0,0 +1,62 @@
+"""
+进程内指标注册表，以Prometheus文本格式通过 /metrics 导出
+"""
+import threading
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+
+class Metric(NamedTuple):
+    """一项指标及其采样值"""
+    name: str
+    type: str  # "gauge" 或 "counter"
+    help: str
+    samples: List[Tuple[Dict[str, str], float]]
+
+
+class MetricsRegistry:
+    """指标注册表：各模块注册采集函数，导出时统一调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collectors: List[Callable[[], Iterable[Metric]]] = []
+
+    def register(self, collector: Callable[[], Iterable[Metric]]):
+        """
+        注册采集函数
+
+        Args:
+            collector: 无参函数，返回Metric列表
+        """
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def collect(self) -> List[Metric]:
+        """调用所有采集函数"""
+        with self._lock:
+            collectors = list(self._collectors)
+        metrics = []
+        for collector in collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                print(f"采集指标失败: {str(e)}")
+        return metrics
+
+    def render_prometheus(self) -> str:
+        """渲染为Prometheus文本格式"""
+        lines = []
+        for metric in self.collect():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for labels, value in metric.samples:
+                if labels:
+                    label_str = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                    lines.append(f"{metric.name}{{{label_str}}} {value}")
+                else:
+                    lines.append(f"{metric.name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics_registry = MetricsRegistry()
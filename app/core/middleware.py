@@ -0,0 +1,137 @@
+"""
+ASGI中间件
+"""
+from typing import Iterable
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app.core.admission import image_memory_budget, estimate_peak_memory, AdmissionRejected
+
+
+class UploadTooLargeError(HTTPException):
+    """上传请求体超过大小限制"""
+
+    def __init__(self):
+        super().__init__(
+            status_code=413,
+            detail={
+                "errors": [
+                    {
+                        "messages": "文件大小超过限制",
+                        "extensions": {
+                            "code": "UPLOAD_FILE_FAIL"}
+                    }
+                ]
+            }
+        )
+
+
+async def upload_too_large_handler(request, exc: UploadTooLargeError):
+    """将UploadTooLargeError转换为与其他上传错误一致的响应格式"""
+    return JSONResponse(status_code=exc.status_code, content=exc.detail)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    上传大小限制中间件
+
+    在解析multipart之前先检查Content-Length，超限直接返回413；
+    没有Content-Length（分块传输）时边接收边计数，超限立即中止，
+    避免超大或恶意上传被完整读入内存/临时文件
+    """
+
+    def __init__(self, app, max_body_size: int, paths: Iterable[str] = ("/upload/image", "/upload/image/raw")):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    break
+                if content_length > self.max_body_size:
+                    print(f"上传被拒绝: Content-Length={content_length} 超过 {self.max_body_size}")
+                    error = UploadTooLargeError()
+                    response = JSONResponse(status_code=error.status_code, content=error.detail)
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received = 0
+        max_body_size = self.max_body_size
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_size:
+                    print(f"上传被中止: 已接收 {received} bytes 超过 {max_body_size}")
+                    raise UploadTooLargeError()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def server_busy_response(error: AdmissionRejected) -> JSONResponse:
+    """内存预算不足时的503响应"""
+    print(f"请求被拒绝: {str(error)}")
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(error.retry_after)},
+        content={
+            "errors": [{
+                "message": "服务器繁忙，请稍后重试",
+                "extensions": {
+                    "code": "SERVER_BUSY"
+                }
+            }]
+        }
+    )
+
+
+class ImageAdmissionMiddleware:
+    """
+    图像上传的内存准入中间件
+
+    在读取请求体（解析multipart、写临时文件）之前按Content-Length估算峰值内存并申请额度，
+    响应发送完毕后释放；没有Content-Length（分块传输）时按最大文件大小估算。
+    预算不足时排队，超时返回503，请求体不会被读取
+    """
+
+    def __init__(self, app, max_file_size: int, paths: Iterable[str] = ("/upload/image", "/upload/image/raw")):
+        self.app = app
+        self.max_file_size = max_file_size
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        declared_size = self.max_file_size
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit():
+                    declared_size = int(value)
+                break
+
+        try:
+            acquired = await image_memory_budget.acquire(
+                estimate_peak_memory(min(declared_size, self.max_file_size))
+            )
+        except AdmissionRejected as e:
+            await server_busy_response(e)(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await image_memory_budget.release(acquired)
@@ -0,0 +1,156 @@
+"""
+可合并的流式摘要：固定内存的近似Top-K计数和延迟分位数
+
+- SpaceSaving：最多跟踪 capacity 个键，计数是上界，误差不超过 总数/capacity
+- LatencySketch：按对数分桶的直方图（与HDR直方图同类），分位数的相对误差不超过 relative_accuracy
+
+两者都可以合并（多个时间片、多个worker），并可序列化为JSON。
+"""
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class SpaceSaving:
+    """Space-Saving 近似Top-K计数"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.total = 0
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def _min_count(self) -> int:
+        """未被跟踪的键的计数上界：满时为最小计数，否则为0"""
+        return min(self._counts.values()) if len(self._counts) >= self.capacity else 0
+
+    def add(self, key: str, weight: int = 1):
+        """累加一个键"""
+        self.total += weight
+        if key in self._counts:
+            self._counts[key] += weight
+        elif len(self._counts) < self.capacity:
+            self._counts[key] = weight
+            self._errors[key] = 0
+        else:
+            # 替换计数最小的键，新键继承其计数作为误差
+            victim = min(self._counts, key=self._counts.__getitem__)
+            floor = self._counts.pop(victim)
+            del self._errors[victim]
+            self._counts[key] = floor + weight
+            self._errors[key] = floor
+
+    def merge(self, other: "SpaceSaving"):
+        """合并另一个摘要（一侧未跟踪的键按该侧的最小计数估计），保留计数最大的 capacity 个键"""
+        self_floor, other_floor = self._min_count(), other._min_count()
+        counts, errors = {}, {}
+        for key in self._counts.keys() | other._counts.keys():
+            counts[key] = self._counts.get(key, self_floor) + other._counts.get(key, other_floor)
+            errors[key] = self._errors.get(key, self_floor) + other._errors.get(key, other_floor)
+        keep = sorted(counts, key=counts.__getitem__, reverse=True)[:self.capacity]
+        self._counts = {key: counts[key] for key in keep}
+        self._errors = {key: errors[key] for key in keep}
+        self.total += other.total
+
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        """
+        计数最大的 n 个键
+
+        返回:
+            [(键, 计数上界, 误差)]，真实计数在 [计数-误差, 计数] 之间
+        """
+        keys = sorted(self._counts, key=self._counts.__getitem__, reverse=True)[:n]
+        return [(key, self._counts[key], self._errors[key]) for key in keys]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "total": self.total,
+                "items": [[key, count, self._errors[key]] for key, count in self._counts.items()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpaceSaving":
+        sketch = cls(data["capacity"])
+        sketch.total = data["total"]
+        for key, count, error in data["items"]:
+            sketch._counts[key] = count
+            sketch._errors[key] = error
+        return sketch
+
+
+class LatencySketch:
+    """对数分桶的延迟直方图：桶 i 覆盖 (gamma^(i-1), gamma^i]，按桶的中点估计分位数"""
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-3):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value  # 不大于此值的样本计入零桶
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float, weight: int = 1):
+        """记录一个样本（秒）"""
+        if value <= self.min_value:
+            self.zero_count += weight
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self._buckets[index] = self._buckets.get(index, 0) + weight
+        self.count += weight
+        self.sum += value * weight
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LatencySketch"):
+        """合并另一个直方图（两者精度必须相同）"""
+        if (other.relative_accuracy, other.min_value) != (self.relative_accuracy, self.min_value):
+            raise ValueError("精度不同的延迟直方图不能合并")
+        for index, count in other._buckets.items():
+            self._buckets[index] = self._buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        分位数（0 <= q <= 1）
+
+        返回:
+            估计值（相对误差不超过 relative_accuracy），没有样本时为None
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return self.min
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if rank < seen:
+                value = 2 * self._gamma ** index / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"relative_accuracy": self.relative_accuracy, "min_value": self.min_value,
+                "buckets": [[index, count] for index, count in self._buckets.items()],
+                "zero_count": self.zero_count, "count": self.count, "sum": self.sum,
+                "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencySketch":
+        sketch = cls(data["relative_accuracy"], data["min_value"])
+        sketch._buckets = {int(index): count for index, count in data["buckets"]}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        sketch.min = data["min"]
+        sketch.max = data["max"]
+        return sketch
@@ -0,0 +1,89 @@
+"""
+异步数据库会话：基于aiomysql的独立连接池，供请求处理路径使用，不阻塞事件循环
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Optional
+
+import aiomysql
+
+from app.core.metrics import Metric, metrics_registry
+from app.db.database import DatabaseConfig
+
+
+class AsyncDatabaseSession:
+    """异步数据库会话管理类"""
+
+    def __init__(self):
+        self._pool: Optional[aiomysql.Pool] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get_pool(self) -> aiomysql.Pool:
+        """获取连接池（首次使用时在当前事件循环中创建）"""
+        if self._pool is not None:
+            return self._pool
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._pool is None:
+                self._pool = await aiomysql.create_pool(
+                    host=DatabaseConfig.HOST,
+                    user=DatabaseConfig.USER,
+                    password=DatabaseConfig.PASSWORD,
+                    db=DatabaseConfig.DATABASE,
+                    port=DatabaseConfig.PORT,
+                    minsize=0,
+                    maxsize=DatabaseConfig.POOL_SIZE,
+                    pool_recycle=int(DatabaseConfig.POOL_MAX_LIFETIME),
+                    cursorclass=aiomysql.DictCursor,  # 使用字典游标
+                )
+        return self._pool
+
+    @asynccontextmanager
+    async def get_cursor(self) -> AsyncGenerator[aiomysql.DictCursor, None]:
+        """
+        获取异步数据库游标的上下文管理器
+
+        使用示例:
+        ```python
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute("SELECT * FROM table")
+            result = await cursor.fetchall()
+        ```
+        """
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            cursor = await conn.cursor()
+            try:
+                yield cursor
+                await conn.commit()
+            except Exception as e:
+                await conn.rollback()
+                raise e
+            finally:
+                await cursor.close()
+
+    async def close(self):
+        """关闭连接池"""
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    def collect_metrics(self):
+        """导出指标"""
+        pool = self._pool
+        size = pool.size if pool else 0
+        free = pool.freesize if pool else 0
+        maxsize = DatabaseConfig.POOL_SIZE
+        return [
+            Metric("db_async_pool_size", "gauge", "异步连接池当前连接数", [({}, size)]),
+            Metric("db_async_pool_in_use", "gauge", "异步连接池借出中的连接数", [({}, size - free)]),
+            Metric("db_async_pool_utilization", "gauge", "异步连接池使用率（借出数/最大连接数）",
+                   [({}, round((size - free) / maxsize, 4) if maxsize else 0)]),
+        ]
+
+
+# 创建全局异步数据库会话实例
+async_db_session = AsyncDatabaseSession()
+metrics_registry.register(async_db_session.collect_metrics)
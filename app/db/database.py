@@ -1,11 +1,18 @@
 import sqlite3
-from typing import Optional
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional, Dict, Any
 import pymysql
+from pymysql.constants import SERVER_STATUS
 from contextlib import contextmanager
 from typing import Generator
 import os
 from dotenv import load_dotenv
 
+from app.core.metrics import Metric, metrics_registry
+
 # 加载环境变量
 load_dotenv()
 
@@ -17,25 +24,294 @@ class DatabaseConfig:
     DATABASE: str = os.getenv('DB_NAME', 'ocr')
     PORT: int = int(os.getenv('DB_PORT', 3306))
 
+    # 连接池配置
+    POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', 10))  # 最大连接数
+    POOL_TIMEOUT: float = float(os.getenv('DB_POOL_TIMEOUT', 5))  # 获取连接的最长等待时间（秒）
+    POOL_MAX_LIFETIME: float = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))  # 连接最长存活时间（秒），超过后回收
+    POOL_HEALTH_CHECK_INTERVAL: float = float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30))  # 空闲超过此秒数，取出时先ping
+    POOL_LEAK_THRESHOLD: float = float(os.getenv('DB_POOL_LEAK_THRESHOLD', 60))  # 连接被借出超过此秒数视为泄漏
+
+    # 流式查询（无缓冲游标）连接的 net_write_timeout（秒）：客户端读得慢时服务器等待的最长时间
+    STREAM_NET_WRITE_TIMEOUT: int = int(os.getenv('DB_STREAM_NET_WRITE_TIMEOUT', 600))
+
+
+class PoolTimeoutError(Exception):
+    """等待连接池连接超时"""
+
+
+class PooledConnection:
+    """连接池中的一个连接"""
+
+    def __init__(self, conn: pymysql.connections.Connection):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.checked_out_at: Optional[float] = None
+        self.checkout_stack: Optional[str] = None
+        self.leak_reported = False
+
+
+class ConnectionPool:
+    """
+    线程安全的有界MySQL连接池
+
+    - 取出时对空闲较久的连接做健康检查（ping），失效则重建
+    - 连接超过最长存活时间后回收重建
+    - 借出时间超过阈值的连接记录为泄漏，并打印借出位置
+    - 导出等待时间、使用率等指标
+    """
+
+    def __init__(self, create_connection, max_size: int = DatabaseConfig.POOL_SIZE,
+                 timeout: float = DatabaseConfig.POOL_TIMEOUT,
+                 max_lifetime: float = DatabaseConfig.POOL_MAX_LIFETIME,
+                 health_check_interval: float = DatabaseConfig.POOL_HEALTH_CHECK_INTERVAL,
+                 leak_threshold: float = DatabaseConfig.POOL_LEAK_THRESHOLD):
+        self._create_connection = create_connection
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.leak_threshold = leak_threshold
+
+        self._condition = threading.Condition()
+        self._idle = deque()
+        self._in_use: Dict[int, PooledConnection] = {}
+        self._size = 0
+
+        # 指标
+        self.acquire_total = 0
+        self.timeout_total = 0
+        self.wait_seconds_total = 0.0
+        self.created_total = 0
+        self.recycled_total = 0
+        self.health_check_failed_total = 0
+        self.leaked_total = 0
+
+    def _expired(self, pooled: PooledConnection, now: float) -> bool:
+        return now - pooled.created_at > self.max_lifetime
+
+    def _close_quietly(self, pooled: PooledConnection):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _new_connection(self) -> PooledConnection:
+        """在已预留名额的前提下创建新连接，失败时归还名额"""
+        try:
+            pooled = PooledConnection(self._create_connection())
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self.created_total += 1
+        return pooled
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """
+        从连接池取出一个连接
+
+        Args:
+            timeout: 最长等待时间（秒），默认使用连接池配置
+
+        Returns:
+            PooledConnection，用完后必须调用release归还
+
+        Raises:
+            PoolTimeoutError: 等待超时
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        self._detect_leaks(start)
+
+        while True:
+            pooled = None
+            create = False
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    while self._idle:
+                        candidate = self._idle.pop()
+                        if self._expired(candidate, now):
+                            self._size -= 1
+                            self.recycled_total += 1
+                            self._close_quietly(candidate)
+                            continue
+                        pooled = candidate
+                        break
+                    if pooled is not None:
+                        break
+                    if self._size < self.max_size:
+                        # 预留名额，在锁外创建连接
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.timeout_total += 1
+                        self.wait_seconds_total += now - start
+                        raise PoolTimeoutError(f"获取数据库连接超时（{timeout}秒）")
+                    self._condition.wait(remaining)
+
+            if create:
+                pooled = self._new_connection()
+            elif time.monotonic() - pooled.last_used_at > self.health_check_interval:
+                # 空闲较久的连接先做健康检查
+                try:
+                    pooled.conn.ping(reconnect=False)
+                except Exception:
+                    with self._condition:
+                        self.health_check_failed_total += 1
+                        self._size -= 1
+                        self._condition.notify()
+                    self._close_quietly(pooled)
+                    continue
+            break
+
+        now = time.monotonic()
+        pooled.checked_out_at = now
+        pooled.leak_reported = False
+        pooled.checkout_stack = "".join(traceback.format_stack(limit=8)[:-1])
+        with self._condition:
+            self._in_use[id(pooled)] = pooled
+            self.acquire_total += 1
+            self.wait_seconds_total += now - start
+        return pooled
+
+    def release(self, pooled: PooledConnection, discard: bool = False):
+        """
+        归还连接
+
+        Args:
+            pooled: acquire取出的连接
+            discard: 是否丢弃该连接（例如连接已出错）
+        """
+        now = time.monotonic()
+        if not discard:
+            try:
+                # 未提交的事务（包括只读查询开启的快照）必须回滚，避免下一个使用者读到旧数据
+                if pooled.conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    pooled.conn.rollback()
+            except Exception:
+                discard = True
+        if not discard and self._expired(pooled, now):
+            discard = True
+            self.recycled_total += 1
+
+        with self._condition:
+            if self._in_use.pop(id(pooled), None) is None:
+                # 重复归还
+                return
+            pooled.checked_out_at = None
+            pooled.checkout_stack = None
+            pooled.last_used_at = now
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append(pooled)
+            self._condition.notify()
+        if discard:
+            self._close_quietly(pooled)
+
+    @contextmanager
+    def connection(self) -> Generator[pymysql.connections.Connection, None, None]:
+        """借出连接的上下文管理器，异常时丢弃连接"""
+        pooled = self.acquire()
+        try:
+            yield pooled.conn
+        except (pymysql.OperationalError, pymysql.InterfaceError):
+            self.release(pooled, discard=True)
+            raise
+        except BaseException:
+            self.release(pooled)
+            raise
+        else:
+            self.release(pooled)
+
+    def _detect_leaks(self, now: float):
+        """检查借出时间过长的连接"""
+        with self._condition:
+            leaked = [
+                pooled for pooled in self._in_use.values()
+                if not pooled.leak_reported and pooled.checked_out_at is not None
+                and now - pooled.checked_out_at > self.leak_threshold
+            ]
+            for pooled in leaked:
+                pooled.leak_reported = True
+                self.leaked_total += 1
+        for pooled in leaked:
+            print(f"数据库连接疑似泄漏: 已借出 {now - pooled.checked_out_at:.1f} 秒，借出位置:\n{pooled.checkout_stack}")
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for pooled in idle:
+            self._close_quietly(pooled)
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池状态"""
+        with self._condition:
+            in_use = len(self._in_use)
+            return {
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "utilization": round(in_use / self.max_size, 4) if self.max_size else 0,
+                "acquire_total": self.acquire_total,
+                "timeout_total": self.timeout_total,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "created_total": self.created_total,
+                "recycled_total": self.recycled_total,
+                "health_check_failed_total": self.health_check_failed_total,
+                "leaked_total": self.leaked_total,
+            }
+
+    def collect_metrics(self):
+        """导出指标"""
+        self._detect_leaks(time.monotonic())
+        stats = self.stats()
+        return [
+            Metric("db_pool_max_size", "gauge", "连接池最大连接数", [({}, stats["max_size"])]),
+            Metric("db_pool_size", "gauge", "连接池当前连接数", [({}, stats["size"])]),
+            Metric("db_pool_in_use", "gauge", "借出中的连接数", [({}, stats["in_use"])]),
+            Metric("db_pool_idle", "gauge", "空闲连接数", [({}, stats["idle"])]),
+            Metric("db_pool_utilization", "gauge", "连接池使用率（借出数/最大连接数）", [({}, stats["utilization"])]),
+            Metric("db_pool_acquire_total", "counter", "取出连接总次数", [({}, stats["acquire_total"])]),
+            Metric("db_pool_wait_seconds_total", "counter", "等待连接的累计时间（秒）", [({}, stats["wait_seconds_total"])]),
+            Metric("db_pool_timeout_total", "counter", "等待连接超时次数", [({}, stats["timeout_total"])]),
+            Metric("db_pool_created_total", "counter", "新建连接总数", [({}, stats["created_total"])]),
+            Metric("db_pool_recycled_total", "counter", "超过最长存活时间被回收的连接数", [({}, stats["recycled_total"])]),
+            Metric("db_pool_health_check_failed_total", "counter", "健康检查失败的连接数", [({}, stats["health_check_failed_total"])]),
+            Metric("db_pool_leaked_total", "counter", "疑似泄漏的连接数", [({}, stats["leaked_total"])]),
+        ]
+
+
 class DatabaseSession:
     """数据库会话管理类"""
-    
+
     @staticmethod
-    def get_connection():
-        """获取数据库连接"""
+    def get_connection(cursorclass=pymysql.cursors.DictCursor):
+        """新建数据库连接（供连接池使用）"""
         return pymysql.connect(
             host=DatabaseConfig.HOST,
             user=DatabaseConfig.USER,
             password=DatabaseConfig.PASSWORD,
             database=DatabaseConfig.DATABASE,
             port=DatabaseConfig.PORT,
-            cursorclass=pymysql.cursors.DictCursor  # 使用字典游标
+            cursorclass=cursorclass  # 默认使用字典游标
         )
 
     @contextmanager
     def get_cursor(self) -> Generator[pymysql.cursors.DictCursor, None, None]:
         """
-        获取数据库游标的上下文管理器
+        获取数据库游标的上下文管理器（连接来自连接池）
         
         使用示例:
         ```python
@@ -44,18 +320,46 @@ class DatabaseSession:
             result = cursor.fetchall()
         ```
         """
-        conn = self.get_connection()
+        with connection_pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def get_streaming_cursor(self) -> Generator[pymysql.cursors.SSDictCursor, None, None]:
+        """
+        获取无缓冲游标的上下文管理器：结果集逐批从服务器读取，不整体加载到内存
+
+        使用独立连接而不是连接池中的连接：结果读完之前连接不能执行其他语句，
+        长时间的导出也不应占用连接池。用完直接关闭连接，不调用 cursor.close()
+        （无缓冲游标关闭时会先读完剩余的结果，中途放弃时等于把剩余的行全部读一遍）。
+
+        使用示例:
+        ```python
+        with db_session.get_streaming_cursor() as cursor:
+            cursor.execute("SELECT * FROM api_logs")
+            while rows := cursor.fetchmany(1000):
+                ...
+        ```
+        """
+        conn = self.get_connection(cursorclass=pymysql.cursors.SSDictCursor)
         try:
             cursor = conn.cursor()
+            cursor.execute("SET SESSION net_write_timeout = %s", (DatabaseConfig.STREAM_NET_WRITE_TIMEOUT,))
             yield cursor
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
         finally:
-            cursor.close()
             conn.close()
 
+# 全局连接池（连接按需创建）
+connection_pool = ConnectionPool(DatabaseSession.get_connection)
+metrics_registry.register(connection_pool.collect_metrics)
+
 # 创建全局数据库会话实例
 db_session = DatabaseSession()
 
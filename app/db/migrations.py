@@ -0,0 +1,275 @@
+"""
+数据库结构迁移
+
+每个迁移有递增的版本号，执行过的版本记录在 schema_migrations 表中，只执行一次；
+每一步执行前先检查列或索引是否已存在，库中已有部分结构（手工建过索引、旧版本启动时补过列）
+时重复执行也是安全的。多个进程同时启动时用 GET_LOCK 保证同一时刻只有一个进程在迁移。
+
+迁移只包含结构变更和少量数据的改动，启动时在迁移锁内很快完成；需要更新大量日志的数据补写
+（如迁移5登记的历史日志中心补写）按日志ID记录进度，由汇总任务在后台分批完成，也可用命令行执行。
+
+用法:
+    python -m app.db.migrations                        执行尚未执行的迁移
+    python -m app.db.migrations --status               查看各版本的执行情况
+    python -m app.db.migrations --backfill-center-ids  补写完历史日志的中心（未启用汇总任务时使用）
+"""
+import argparse
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Set, Tuple
+
+from app.db.async_database import async_db_session
+from app.models.async_database import AsyncAPILogRollupRepository
+from app.models.database import (
+    API_LOG_ROLLUP_TABLES, API_LOG_ROLLUP_STATE_DDL, API_LOG_ROLLUP_STATE_NAME, API_LOG_ROLLUP_REBUILD_NAME,
+    API_LOG_CENTER_BACKFILL_NAME, api_log_rollup_ddl
+)
+
+# 启动时是否自动执行迁移（关闭时需手动运行 python -m app.db.migrations）
+RUN_MIGRATIONS_ON_STARTUP = os.getenv("RUN_MIGRATIONS_ON_STARTUP", "true").lower() == "true"
+# 等待其他进程迁移完成的最长时间（秒）
+MIGRATION_LOCK_TIMEOUT = int(os.getenv("MIGRATION_LOCK_TIMEOUT", "600"))
+# 补写历史日志的中心时每个事务更新的日志ID跨度（汇总任务与命令行共用）
+MIGRATION_BACKFILL_BATCH = int(os.getenv("MIGRATION_BACKFILL_BATCH", "50000"))
+
+MIGRATION_LOCK_NAME = "ocr_schema_migrations"
+
+SCHEMA_MIGRATIONS_DDL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT NOT NULL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# api_logs 的复合索引：等值列在前、timestamp在后，按时间范围查询和按时间排序都能走索引。
+# center_id 由上传接口按token所属中心写入，历史日志由迁移5登记的补写任务在后台补上，(center_id, timestamp) 才有选择性
+API_LOG_INDEXES: Dict[str, Tuple[str, ...]] = {
+    "idx_api_logs_endpoint_ts": ("api_endpoint", "timestamp"),
+    "idx_api_logs_token_ts": ("token", "timestamp"),
+    "idx_api_logs_center_ts": ("center_id", "timestamp"),
+}
+
+# 按时间范围归档/导出不带其他条件时使用的单列索引
+API_LOG_TIMESTAMP_INDEX = "idx_api_logs_ts"
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[..., Awaitable[None]]
+
+
+async def _table_columns(cursor, table: str) -> Set[str]:
+    await cursor.execute(
+        "SELECT COLUMN_NAME AS name FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (table,)
+    )
+    return {row['name'] for row in await cursor.fetchall()}
+
+
+async def _table_indexes(cursor, table: str) -> Set[str]:
+    await cursor.execute(
+        "SELECT DISTINCT INDEX_NAME AS name FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (table,)
+    )
+    return {row['name'] for row in await cursor.fetchall()}
+
+
+async def _add_api_log_columns(cursor):
+    """record_uuid（唯一索引，重放暂存日志时去重）、repeat_count 与 last_seen（重复失败合并）"""
+    columns = await _table_columns(cursor, "api_logs")
+    indexes = await _table_indexes(cursor, "api_logs")
+    alters = []
+    if 'record_uuid' not in columns:
+        alters.append("ADD COLUMN record_uuid CHAR(32) NULL")
+    if 'uk_api_logs_record_uuid' not in indexes:
+        alters.append("ADD UNIQUE KEY uk_api_logs_record_uuid (record_uuid)")
+    if 'repeat_count' not in columns:
+        alters.append("ADD COLUMN repeat_count INT NOT NULL DEFAULT 1")
+    if 'last_seen' not in columns:
+        alters.append("ADD COLUMN last_seen DATETIME NULL")
+    if alters:
+        await cursor.execute(f"ALTER TABLE api_logs {', '.join(alters)}")
+
+
+async def _add_api_log_indexes(cursor):
+    """按端点/token/中心加时间范围查询的复合索引，一条ALTER在线建完（不阻塞写入）"""
+    indexes = await _table_indexes(cursor, "api_logs")
+    alters = [
+        f"ADD INDEX {name} ({', '.join(columns)})"
+        for name, columns in API_LOG_INDEXES.items() if name not in indexes
+    ]
+    if alters:
+        await cursor.execute(f"ALTER TABLE api_logs {', '.join(alters)}, ALGORITHM=INPLACE, LOCK=NONE")
+
+
+async def _create_api_log_rollups(cursor):
+    """按小时/按天的日志汇总表，以及记录已汇总到哪条日志的进度表"""
+    for table, bucket_type, _ in API_LOG_ROLLUP_TABLES.values():
+        await cursor.execute(api_log_rollup_ddl(table, bucket_type))
+    await cursor.execute(API_LOG_ROLLUP_STATE_DDL)
+
+
+async def _add_api_log_timestamp_index(cursor):
+    """timestamp单列索引：归档任务按月读取和删除旧日志、查找最早的日志时不扫描全表"""
+    if API_LOG_TIMESTAMP_INDEX not in await _table_indexes(cursor, "api_logs"):
+        await cursor.execute(
+            f"ALTER TABLE api_logs ADD INDEX {API_LOG_TIMESTAMP_INDEX} (timestamp), ALGORITHM=INPLACE, LOCK=NONE"
+        )
+
+
+async def _register_center_backfill(cursor):
+    """
+    历史上传日志没有记录中心（只在token管理接口的日志中有）：登记按token补写中心的任务，
+    然后清空汇总表从头重建（汇总时按 tokens 补上中心，不依赖补写的进度）。
+    补写要更新整张 api_logs，不在迁移锁内执行，由汇总任务或 --backfill-center-ids 按进度分批完成
+    """
+    await cursor.execute(
+        "INSERT IGNORE INTO api_log_rollup_state (name, last_id) VALUES (%s, 0)", (API_LOG_CENTER_BACKFILL_NAME,)
+    )
+
+    # 锁住进度行后清空汇总表、进度归零；汇总任务从头重新累加，进度追上重建目标前Dashboard读原始日志
+    await cursor.execute(
+        "INSERT IGNORE INTO api_log_rollup_state (name, last_id) VALUES (%s, 0)", (API_LOG_ROLLUP_STATE_NAME,)
+    )
+    await cursor.execute(
+        "SELECT last_id FROM api_log_rollup_state WHERE name=%s FOR UPDATE", (API_LOG_ROLLUP_STATE_NAME,)
+    )
+    await cursor.execute("SELECT MAX(id) AS max_id FROM api_logs")
+    rebuild_id = (await cursor.fetchone())['max_id'] or 0
+    for table, _, _ in API_LOG_ROLLUP_TABLES.values():
+        await cursor.execute(f"DELETE FROM {table}")
+    await cursor.execute(
+        "UPDATE api_log_rollup_state SET last_id=0 WHERE name=%s", (API_LOG_ROLLUP_STATE_NAME,)
+    )
+    await cursor.execute(
+        "INSERT INTO api_log_rollup_state (name, last_id) VALUES (%s, %s) "
+        "ON DUPLICATE KEY UPDATE last_id=VALUES(last_id)",
+        (API_LOG_ROLLUP_REBUILD_NAME, rebuild_id)
+    )
+
+
+# 按版本号顺序执行；已发布的迁移不要修改，结构变更追加新版本
+MIGRATIONS: List[Migration] = [
+    Migration(1, "api_logs batch write columns", _add_api_log_columns),
+    Migration(2, "api_logs time range indexes", _add_api_log_indexes),
+    Migration(3, "api_logs hourly and daily rollups", _create_api_log_rollups),
+    Migration(4, "api_logs timestamp index", _add_api_log_timestamp_index),
+    Migration(5, "api_logs center backfill and rollup rebuild", _register_center_backfill),
+]
+
+LATEST_VERSION = max(migration.version for migration in MIGRATIONS)
+
+_schema_version = 0
+
+
+async def _applied_versions(cursor) -> Set[int]:
+    await cursor.execute(SCHEMA_MIGRATIONS_DDL)
+    await cursor.execute("SELECT version FROM schema_migrations")
+    return {row['version'] for row in await cursor.fetchall()}
+
+
+async def migrate() -> List[int]:
+    """
+    执行尚未执行的迁移
+
+    返回:
+        本次执行的版本号列表
+    """
+    global _schema_version
+    applied_now = []
+    async with async_db_session.get_cursor() as cursor:
+        await cursor.execute("SELECT GET_LOCK(%s, %s) AS locked", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT))
+        if not (await cursor.fetchone())['locked']:
+            raise RuntimeError("等待其他进程执行数据库迁移超时")
+        try:
+            applied = await _applied_versions(cursor)
+            for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+                if migration.version in applied:
+                    continue
+                print(f"执行数据库迁移 {migration.version}: {migration.name}")
+                await migration.apply(cursor)
+                await cursor.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (migration.version, migration.name)
+                )
+                await cursor.connection.commit()
+                applied_now.append(migration.version)
+        finally:
+            await cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+    _schema_version = LATEST_VERSION
+    return applied_now
+
+
+async def ensure_schema():
+    """确保数据库结构为最新版本（本进程已确认过时直接返回）；关闭自动迁移时只检查、不执行"""
+    global _schema_version
+    if _schema_version >= LATEST_VERSION:
+        return
+    if RUN_MIGRATIONS_ON_STARTUP:
+        await migrate()
+        return
+    missing = [row['version'] for row in await migration_status() if not row['applied']]
+    if missing:
+        raise RuntimeError(f"数据库迁移 {missing} 尚未执行，请运行 python -m app.db.migrations")
+    _schema_version = LATEST_VERSION
+
+
+async def migration_status() -> List[Dict[str, object]]:
+    """
+    各版本的执行情况
+
+    返回:
+        [{"version", "name", "applied"}]
+    """
+    async with async_db_session.get_cursor() as cursor:
+        applied = await _applied_versions(cursor)
+    return [
+        {"version": m.version, "name": m.name, "applied": m.version in applied}
+        for m in sorted(MIGRATIONS, key=lambda m: m.version)
+    ]
+
+
+async def backfill_center_ids(upper_id: int, batch: int = MIGRATION_BACKFILL_BATCH) -> int:
+    """
+    分批补写历史日志的中心，直到进度到达 upper_id（中断后从记录的进度继续）
+
+    参数:
+        upper_id: 补写到的日志ID
+        batch: 每个事务的日志ID跨度
+    返回:
+        本次推进的日志ID跨度
+    """
+    total = 0
+    while True:
+        advanced = await AsyncAPILogRollupRepository.backfill_center_ids(upper_id, batch)
+        if not advanced:
+            return total
+        total += advanced
+
+
+async def _main(show_status: bool, backfill: bool):
+    try:
+        if backfill:
+            await ensure_schema()
+            upper_id = await AsyncAPILogRollupRepository.get_max_log_id()
+            print(f"已补写日志ID跨度: {await backfill_center_ids(upper_id)}")
+        elif show_status:
+            for row in await migration_status():
+                print(f"{row['version']:>4}  {'已执行' if row['applied'] else '未执行'}  {row['name']}")
+        else:
+            applied = await migrate()
+            print(f"已执行迁移: {applied}" if applied else "数据库结构已是最新版本")
+    finally:
+        await async_db_session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--status", action="store_true", help="只查看执行情况")
+    parser.add_argument("--backfill-center-ids", action="store_true", help="补写完历史日志的中心")
+    args = parser.parse_args()
+    asyncio.run(_main(args.status, args.backfill_center_ids))
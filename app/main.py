@@ -1,11 +1,25 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 
 from app.core.config import settings
+from app.core.metrics import metrics_registry
+from app.core.middleware import (
+    ImageAdmissionMiddleware, UploadSizeLimitMiddleware, UploadTooLargeError, upload_too_large_handler
+)
 from app.api.v1.app import router as v1_router  # 引入定义的router
-# from app.api.v1.dashboard import router as dashboard_router  # 引入Dashboard router
+from app.db.async_database import async_db_session
+from app.services.token_cache_service import token_state_cache
+from app.services.token_shard_service import token_shard_registry
+from app.services.log_writer_service import api_log_writer
+from app.services.log_spool_service import log_spool
+from app.services.token_filter_service import token_filter
+from app.services.log_rollup_service import api_log_rollup
+from app.services.dashboard_events_service import dashboard_events
+from app.services.log_archive_service import log_archiver
+from app.db.migrations import migrate, RUN_MIGRATIONS_ON_STARTUP
+from app.api.v1.dashboard import router as dashboard_router  # 引入Dashboard router
 
 from pathlib import Path
 
@@ -25,12 +39,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 图像上传的内存准入：读取请求体之前按Content-Length申请额度（在大小限制之后执行）
+app.add_middleware(ImageAdmissionMiddleware, max_file_size=settings.MAX_FILE_SIZE)
+
+# 上传大小限制：解析multipart之前按Content-Length拒绝，分块传输时边收边计数
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_size=settings.MAX_FILE_SIZE + settings.UPLOAD_MULTIPART_OVERHEAD,
+)
+app.add_exception_handler(UploadTooLargeError, upload_too_large_handler)
+
 # 挂载静态文件目录
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 # 注册接口
 app.include_router(v1_router)
-# app.include_router(dashboard_router)  # 注册Dashboard API
+app.include_router(dashboard_router)  # 注册Dashboard API
+
+@app.on_event("startup")
+async def run_schema_migrations():
+    """执行尚未执行的数据库迁移（api_logs的列与索引等）"""
+    if not RUN_MIGRATIONS_ON_STARTUP:
+        return
+    try:
+        await migrate()
+    except Exception as e:
+        # 数据库暂不可用时日志先进入暂存，重放前会再次执行
+        print(f"执行数据库迁移失败: {str(e)}")
+
+@app.on_event("startup")
+async def start_token_sharding():
+    """启用分片计数时拆分热点token并启动压缩任务"""
+    try:
+        await token_shard_registry.start()
+    except Exception as e:
+        print(f"Token分片初始化失败: {str(e)}")
+
+@app.on_event("startup")
+async def start_api_log_spool():
+    """启动暂存日志的重放任务"""
+    log_spool.start()
+
+@app.on_event("startup")
+async def start_token_filter():
+    """后台构建未知token的布隆过滤器，建好之前所有token照常查库"""
+    token_filter.start()
+
+@app.on_event("startup")
+async def start_api_log_rollup():
+    """启动api_logs汇总表的增量维护任务（首次运行时分批汇总历史日志）"""
+    api_log_rollup.start()
+
+@app.on_event("startup")
+async def start_api_log_archiver():
+    """启动旧日志归档任务（ENABLE_LOG_ARCHIVE=true 时）"""
+    log_archiver.start()
+
+@app.on_event("shutdown")
+async def close_database_pools():
+    """写完队列中的API日志和token缓存中未落库的扣减，然后关闭数据库连接池"""
+    await dashboard_events.close()
+    await token_filter.close()
+    await log_archiver.close()
+    await api_log_rollup.close()
+    await api_log_writer.close()
+    await log_spool.close()
+    await token_shard_registry.close()
+    await token_state_cache.close()
+    await async_db_session.close()
 
 @app.get("/")
 async def health_check():
@@ -40,6 +116,11 @@ async def health_check():
         "server_time": datetime.utcnow().isoformat()
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """导出进程内指标（Prometheus文本格式）"""
+    return PlainTextResponse(metrics_registry.render_prometheus())
+
 @app.get("/dashboard")
 async def read_root():
     """返回HTML首页"""
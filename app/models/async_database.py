@@ -0,0 +1,708 @@
+"""
+异步Repository：方法与 app/models/database.py 中的同名同步类一致，
+供API请求处理路径await使用；同步版本保留给脚本和后台线程
+"""
+import pymysql
+import random
+from typing import List, Optional, Dict, Any, Tuple
+from decimal import Decimal
+
+from app.db.async_database import async_db_session
+from app.models.database import (
+    TOKEN_SHARDS_DDL, API_LOG_COLUMNS, API_LOG_ROLLUP_TABLES, API_LOG_ROLLUP_STATE_NAME,
+    API_LOG_CENTER_BACKFILL_NAME, distribute_use_times, api_log_rollup_sql
+)
+
+
+class AsyncTokenRepository:
+    """Token相关的异步数据库操作类"""
+
+    @staticmethod
+    async def add_token(token: str, use_times: int, center_id: str) -> int:
+        """
+        添加新token
+
+        Args:
+            token: token字符串
+            use_times: 可使用次数
+            center_id: 中心ID
+
+        Returns:
+            新创建的token ID
+
+        Raises:
+            ValueError: 当token已存在时抛出
+        """
+        try:
+            async with async_db_session.get_cursor() as cursor:
+                await cursor.execute(
+                    "INSERT INTO tokens (token, use_times, center_id) VALUES (%s, %s, %s)",
+                    (token, use_times, center_id)
+                )
+                return cursor.lastrowid
+        except pymysql.IntegrityError:
+            raise ValueError("Token已存在")
+
+    @staticmethod
+    async def add_tokens(specs: List[Tuple[str, int]], center_id: str) -> Dict[str, Optional[int]]:
+        """
+        批量添加token（一个事务：一次查重、一条多行INSERT、一次取回ID）
+
+        Args:
+            specs: [(token, use_times)]，token不能重复
+            center_id: 中心ID
+
+        Returns:
+            {token: 新创建的token ID}，已存在的token对应None
+
+        Raises:
+            ValueError: 并发插入导致唯一键冲突时抛出（整批回滚）
+        """
+        if not specs:
+            return {}
+        tokens = [token for token, _ in specs]
+        placeholders = ", ".join(["%s"] * len(tokens))
+        try:
+            async with async_db_session.get_cursor() as cursor:
+                await cursor.execute(f"SELECT token FROM tokens WHERE token IN ({placeholders})", tokens)
+                existing = {row['token'] for row in await cursor.fetchall()}
+                new_specs = [(token, use_times, center_id) for token, use_times in specs if token not in existing]
+                if new_specs:
+                    await cursor.executemany(
+                        "INSERT INTO tokens (token, use_times, center_id) VALUES (%s, %s, %s)",
+                        new_specs
+                    )
+                    new_tokens = [spec[0] for spec in new_specs]
+                    await cursor.execute(
+                        f"SELECT id, token FROM tokens WHERE token IN ({', '.join(['%s'] * len(new_tokens))})",
+                        new_tokens
+                    )
+                    ids = {row['token']: row['id'] for row in await cursor.fetchall()}
+                else:
+                    ids = {}
+        except pymysql.IntegrityError:
+            raise ValueError("Token已存在")
+        return {token: ids.get(token) for token in tokens}
+
+    @staticmethod
+    async def token_exists(token: str) -> bool:
+        """
+        检查token是否存在
+
+        Args:
+            token: 要检查的token
+
+        Returns:
+            token是否存在
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute("SELECT token FROM tokens WHERE token=%s", (token,))
+            return bool(await cursor.fetchone())
+
+    @staticmethod
+    async def list_tokens_after(last_id: int, limit: int) -> List[Dict[str, Any]]:
+        """
+        按id顺序分批获取token
+
+        Args:
+            last_id: 上一批最后一条的id（首批传0）
+            limit: 每批条数
+
+        Returns:
+            包含id和token的记录列表
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(
+                "SELECT id, token FROM tokens WHERE id > %s ORDER BY id LIMIT %s",
+                (last_id, limit)
+            )
+            return list(await cursor.fetchall())
+
+    @staticmethod
+    async def get_token_info(token: str) -> Optional[Dict[str, Any]]:
+        """
+        获取token信息
+
+        Args:
+            token: token字符串
+
+        Returns:
+            token信息字典，如果不存在则返回None
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(
+                "SELECT id, token, use_times, center_id FROM tokens WHERE token=%s",
+                (token,)
+            )
+            return await cursor.fetchone()
+
+    @staticmethod
+    async def update_token_usage(token: str) -> bool:
+        """
+        更新token使用次数（减1）
+
+        Args:
+            token: 要更新的token
+
+        Returns:
+            更新是否成功
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(
+                "UPDATE tokens SET use_times = use_times - 1 WHERE token=%s AND use_times > 0",
+                (token,)
+            )
+            return cursor.rowcount > 0
+
+    @staticmethod
+    async def reserve_usage(token: str) -> Optional[int]:
+        """
+        预留一次使用次数：一条带条件的UPDATE完成检查和扣减，并通过LAST_INSERT_ID返回剩余次数
+
+        Args:
+            token: token字符串
+
+        Returns:
+            扣减后的剩余次数，次数不足或token不存在时返回None
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(
+                "UPDATE tokens SET use_times = LAST_INSERT_ID(use_times - 1) WHERE token=%s AND use_times > 0",
+                (token,)
+            )
+            return cursor.lastrowid if cursor.rowcount > 0 else None
+
+    @staticmethod
+    async def release_usage(token: str) -> Optional[int]:
+        """
+        归还一次预留的使用次数
+
+        Args:
+            token: token字符串
+
+        Returns:
+            归还后的剩余次数，token不存在时返回None
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(
+                "UPDATE tokens SET use_times = LAST_INSERT_ID(use_times + 1) WHERE token=%s",
+                (token,)
+            )
+            return cursor.lastrowid if cursor.rowcount > 0 else None
+
+    @staticmethod
+    async def apply_usage_deltas(deltas: Dict[str, int]) -> int:
+        """
+        批量扣减多个token的使用次数（一条UPDATE语句完成）
+
+        Args:
+            deltas: {token: 扣减次数}
+
+        Returns:
+            受影响的行数
+        """
+        if not deltas:
+            return 0
+        tokens = list(deltas.keys())
+        case_sql = " ".join(["WHEN %s THEN %s"] * len(tokens))
+        placeholders = ", ".join(["%s"] * len(tokens))
+        params = []
+        for token in tokens:
+            params.extend([token, deltas[token]])
+        params.extend(tokens)
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(
+                f"UPDATE tokens SET use_times = GREATEST(use_times - CASE token {case_sql} END, 0) "
+                f"WHERE token IN ({placeholders})",
+                params
+            )
+            return cursor.rowcount
+
+
+class AsyncTokenShardRepository:
+    """热点token分片计数的异步数据库操作类（与 TokenShardRepository 一致）"""
+
+    @staticmethod
+    async def ensure_table():
+        """创建分片表（已存在时忽略）"""
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(TOKEN_SHARDS_DDL)
+
+    @staticmethod
+    async def list_sharded_tokens() -> Dict[str, int]:
+        """
+        获取所有已分片的token
+
+        Returns:
+            {token: 分片数}
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute("SELECT token, COUNT(*) AS shards FROM token_usage_shards GROUP BY token")
+            return {row['token']: row['shards'] for row in await cursor.fetchall()}
+
+    @staticmethod
+    async def get_total_use_times(token: str) -> Optional[int]:
+        """
+        获取分片token的总剩余次数
+
+        Args:
+            token: token字符串
+
+        Returns:
+            总剩余次数，token不存在时返回None
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(
+                "SELECT t.use_times + COALESCE((SELECT SUM(s.use_times) FROM token_usage_shards s "
+                "WHERE s.token = t.token), 0) AS use_times FROM tokens t WHERE t.token=%s",
+                (token,)
+            )
+            row = await cursor.fetchone()
+            return int(row['use_times']) if row else None
+
+    @staticmethod
+    async def decrement(token: str, shard_count: int) -> bool:
+        """
+        扣减一次：先随机选一个分片，该分片为0时取剩余最多的分片，最后才扣 tokens 表本身
+
+        Args:
+            token: token字符串
+            shard_count: 分片数
+
+        Returns:
+            是否扣减成功（总次数不足时返回False）
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(
+                "UPDATE token_usage_shards SET use_times = use_times - 1 "
+                "WHERE token=%s AND shard=%s AND use_times > 0",
+                (token, random.randrange(shard_count))
+            )
+            if cursor.rowcount > 0:
+                return True
+            await cursor.execute(
+                "UPDATE token_usage_shards SET use_times = use_times - 1 "
+                "WHERE token=%s AND use_times > 0 ORDER BY use_times DESC LIMIT 1",
+                (token,)
+            )
+            if cursor.rowcount > 0:
+                return True
+            await cursor.execute(
+                "UPDATE tokens SET use_times = use_times - 1 WHERE token=%s AND use_times > 0",
+                (token,)
+            )
+            return cursor.rowcount > 0
+
+    @staticmethod
+    async def increment(token: str, shard_count: int, amount: int = 1) -> bool:
+        """
+        归还次数：加到随机一个分片上
+
+        Args:
+            token: token字符串
+            shard_count: 分片数
+            amount: 归还的次数
+
+        Returns:
+            分片是否存在
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(
+                "UPDATE token_usage_shards SET use_times = use_times + %s WHERE token=%s AND shard=%s",
+                (amount, token, random.randrange(shard_count))
+            )
+            return cursor.rowcount > 0
+
+    @staticmethod
+    async def apply_usage_delta(token: str, delta: int) -> int:
+        """
+        批量扣减分片token的次数：从剩余最多的分片开始依次扣，不足部分扣 tokens 表
+
+        Args:
+            token: token字符串
+            delta: 扣减次数
+
+        Returns:
+            实际扣减的次数
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(
+                "SELECT shard, use_times FROM token_usage_shards WHERE token=%s AND use_times > 0 "
+                "ORDER BY use_times DESC FOR UPDATE",
+                (token,)
+            )
+            remaining = delta
+            updates = []
+            for row in await cursor.fetchall():
+                if remaining <= 0:
+                    break
+                take = min(row['use_times'], remaining)
+                updates.append((take, token, row['shard']))
+                remaining -= take
+            if updates:
+                await cursor.executemany(
+                    "UPDATE token_usage_shards SET use_times = use_times - %s WHERE token=%s AND shard=%s",
+                    updates
+                )
+            if remaining > 0:
+                await cursor.execute(
+                    "UPDATE tokens SET use_times = GREATEST(use_times - %s, 0) WHERE token=%s",
+                    (remaining, token)
+                )
+            return delta - remaining
+
+    @staticmethod
+    async def compact(token: str) -> bool:
+        """
+        压缩分片：把 tokens 表上新增的次数并入分片，并把各分片重新平均分配
+
+        Args:
+            token: token字符串
+
+        Returns:
+            是否做了调整（已经均衡时返回False）
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute("SELECT use_times FROM tokens WHERE token=%s FOR UPDATE", (token,))
+            token_row = await cursor.fetchone()
+            if not token_row:
+                return False
+            await cursor.execute(
+                "SELECT shard, use_times FROM token_usage_shards WHERE token=%s ORDER BY shard FOR UPDATE",
+                (token,)
+            )
+            shards = await cursor.fetchall()
+            if not shards:
+                return False
+            values = [row['use_times'] for row in shards]
+            if token_row['use_times'] == 0 and max(values) - min(values) <= 1:
+                return False
+            total = token_row['use_times'] + sum(values)
+            await cursor.executemany(
+                "UPDATE token_usage_shards SET use_times = %s WHERE token=%s AND shard=%s",
+                [(n, token, row['shard']) for row, n in zip(shards, distribute_use_times(total, len(shards)))]
+            )
+            await cursor.execute("UPDATE tokens SET use_times = 0 WHERE token=%s", (token,))
+            return True
+
+    @staticmethod
+    async def shard_token(token: str, shard_count: int) -> bool:
+        """
+        把token的剩余次数平均分到shard_count个分片
+
+        Args:
+            token: token字符串
+            shard_count: 分片数
+
+        Returns:
+            是否分片成功（token不存在或已分片时返回False）
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute("SELECT use_times FROM tokens WHERE token=%s FOR UPDATE", (token,))
+            row = await cursor.fetchone()
+            if not row:
+                return False
+            await cursor.execute("SELECT 1 FROM token_usage_shards WHERE token=%s LIMIT 1", (token,))
+            if await cursor.fetchone():
+                return False
+            await cursor.executemany(
+                "INSERT INTO token_usage_shards (token, shard, use_times) VALUES (%s, %s, %s)",
+                [(token, i, n) for i, n in enumerate(distribute_use_times(row['use_times'], shard_count))]
+            )
+            await cursor.execute("UPDATE tokens SET use_times = 0 WHERE token=%s", (token,))
+            return True
+
+
+class AsyncCenterRepository:
+    """中心相关的异步数据库操作类"""
+
+    @staticmethod
+    async def center_exists(center_id: str) -> bool:
+        """
+        检查中心ID是否存在
+
+        Args:
+            center_id: 要检查的中心ID
+
+        Returns:
+            中心ID是否存在
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute("SELECT center_id FROM centers WHERE center_id=%s", (center_id,))
+            return bool(await cursor.fetchone())
+
+    @staticmethod
+    async def list_centers() -> List[str]:
+        """
+        获取所有中心ID
+
+        Returns:
+            中心ID列表
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute("SELECT center_id FROM centers")
+            return [row['center_id'] for row in await cursor.fetchall()]
+
+    @staticmethod
+    async def add_center(center_id: str) -> bool:
+        """
+        添加新的中心
+
+        Args:
+            center_id: 中心ID
+
+        Returns:
+            添加是否成功
+        """
+        try:
+            async with async_db_session.get_cursor() as cursor:
+                await cursor.execute(
+                    "INSERT INTO centers (center_id) VALUES (%s)",
+                    (center_id,)
+                )
+                return True
+        except pymysql.IntegrityError:
+            return False
+
+
+class AsyncIPRepository:
+    """IP白名单相关的异步数据库操作类"""
+
+    @staticmethod
+    async def get_allowed_ips() -> List[str]:
+        """
+        获取允许的IP列表
+
+        Returns:
+            允许的IP地址列表
+        """
+        try:
+            async with async_db_session.get_cursor() as cursor:
+                await cursor.execute("SELECT ip FROM ip")
+                results = await cursor.fetchall()
+                return [row['ip'] for row in results]
+        except pymysql.OperationalError:
+            return []
+
+
+class AsyncAPILogRepository:
+    """API日志相关的异步数据库操作类"""
+
+    @staticmethod
+    async def log_api_request(
+            client_ip: str,
+            token: str,
+            api_endpoint: str,
+            status: str,
+            file_upload_id: Optional[str] = None,
+            file_name: Optional[str] = None,
+            file_size: Optional[int] = None,
+            ai_usage: Optional[int] = None,
+            error_message: Optional[str] = None,
+            error_code: Optional[str] = None,
+            token_usetimes: Optional[int] = None,
+            center_id: Optional[str] = None,
+            device_type: Optional[str] = None,
+            processing_time: Optional[Decimal] = None,
+    ) -> int:
+        """
+        记录API请求日志
+
+        Args:
+            与 APILogRepository.log_api_request 相同
+
+        Returns:
+            新创建的日志记录ID
+        """
+        try:
+            async with async_db_session.get_cursor() as cursor:
+                await cursor.execute("""
+                    INSERT INTO api_logs (
+                        client_ip, token, api_endpoint, file_upload_id, 
+                        file_name, file_size, ai_usage, status, 
+                        error_message, error_code, token_usetimes, center_id,
+                        device_type, processing_time
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (
+                    client_ip, token, api_endpoint, file_upload_id,
+                    file_name, file_size, ai_usage, status,
+                    error_message, error_code, token_usetimes, center_id,
+                    device_type, processing_time
+                ))
+                return cursor.lastrowid
+        except Exception as e:
+            print(f"记录API日志失败: {str(e)}")
+            return 0
+
+    @staticmethod
+    async def log_api_requests(records: List[tuple], ignore_duplicates: bool = False) -> int:
+        """
+        批量记录API请求日志（executemany合并为一条多行INSERT）
+
+        Args:
+            records: 按 API_LOG_COLUMNS 顺序排列的记录元组列表
+            ignore_duplicates: 是否跳过record_uuid已存在的记录（重放暂存日志时使用）
+
+        Returns:
+            写入的行数
+        """
+        if not records:
+            return 0
+        columns = ", ".join(API_LOG_COLUMNS)
+        placeholders = ", ".join(["%s"] * len(API_LOG_COLUMNS))
+        insert = "INSERT IGNORE" if ignore_duplicates else "INSERT"
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.executemany(
+                f"{insert} INTO api_logs ({columns}) VALUES ({placeholders})",
+                records
+            )
+            return cursor.rowcount
+
+    @staticmethod
+    async def get_api_logs(
+            limit: int = 100,
+            token: Optional[str] = None,
+            api_endpoint: Optional[str] = None,
+            status: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        获取API日志记录
+
+        Args:
+            limit: 返回记录数限制
+            token: 按token过滤（可选）
+            api_endpoint: 按API端点过滤（可选）
+            status: 按状态过滤（可选）
+
+        Returns:
+            日志记录列表
+        """
+        try:
+            async with async_db_session.get_cursor() as cursor:
+                where_conditions = []
+                params = []
+
+                if token:
+                    where_conditions.append("token = %s")
+                    params.append(token)
+
+                if api_endpoint:
+                    where_conditions.append("api_endpoint = %s")
+                    params.append(api_endpoint)
+
+                if status:
+                    where_conditions.append("status = %s")
+                    params.append(status)
+
+                where_clause = ""
+                if where_conditions:
+                    where_clause = "WHERE " + " AND ".join(where_conditions)
+
+                params.append(limit)
+
+                await cursor.execute(f"""
+                    SELECT * FROM api_logs 
+                    {where_clause}
+                    ORDER BY timestamp DESC 
+                    LIMIT %s
+                """, params)
+
+                return await cursor.fetchall()
+        except Exception as e:
+            print(f"获取API日志失败: {str(e)}")
+            return []
+
+
+class AsyncAPILogRollupRepository:
+    """api_logs 汇总表的异步数据库操作类"""
+
+    STATE_NAME = API_LOG_ROLLUP_STATE_NAME
+
+    @staticmethod
+    async def get_watermark() -> int:
+        """
+        已汇总到的日志ID
+
+        Returns:
+            最后一条已汇总日志的ID，尚未汇总过时为0
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(
+                "SELECT last_id FROM api_log_rollup_state WHERE name=%s",
+                (AsyncAPILogRollupRepository.STATE_NAME,)
+            )
+            row = await cursor.fetchone()
+            return row['last_id'] if row else 0
+
+    @staticmethod
+    async def get_max_log_id() -> int:
+        """api_logs 当前最大的ID"""
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute("SELECT MAX(id) AS max_id FROM api_logs")
+            row = await cursor.fetchone()
+            return row['max_id'] or 0
+
+    @staticmethod
+    async def apply_range(last_id: int, upper_id: int) -> bool:
+        """
+        把ID在 (last_id, upper_id] 内的日志累加进各汇总表，并推进进度（同一事务）
+
+        Args:
+            last_id: 调用方读到的进度
+            upper_id: 本次汇总到的日志ID
+
+        Returns:
+            是否已汇总；进度已被其他进程推进时返回False，不重复累加
+        """
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute(
+                "INSERT IGNORE INTO api_log_rollup_state (name, last_id) VALUES (%s, 0)",
+                (AsyncAPILogRollupRepository.STATE_NAME,)
+            )
+            await cursor.execute(
+                "SELECT last_id FROM api_log_rollup_state WHERE name=%s FOR UPDATE",
+                (AsyncAPILogRollupRepository.STATE_NAME,)
+            )
+            if (await cursor.fetchone())['last_id'] != last_id:
+                return False
+            for table, _, bucket_expr in API_LOG_ROLLUP_TABLES.values():
+                await cursor.execute(api_log_rollup_sql(table, bucket_expr), (last_id, upper_id))
+            await cursor.execute(
+                "UPDATE api_log_rollup_state SET last_id=%s WHERE name=%s",
+                (upper_id, AsyncAPILogRollupRepository.STATE_NAME)
+            )
+            return True
+
+    @staticmethod
+    async def backfill_center_ids(upper_id: int, batch: int) -> int:
+        """
+        按token补写一批历史日志的中心：进度之后、不超过 upper_id 的 batch 个日志ID，并推进进度（同一事务）
+
+        Args:
+            upper_id: 最多补写到的日志ID
+            batch: 本批的日志ID跨度
+
+        Returns:
+            本批推进的ID跨度；没有登记补写任务或已补写到 upper_id 时为0
+        """
+        async with async_db_session.get_cursor() as cursor:
+            # 锁住进度行，多个进程同时运行时每批只由一个进程执行
+            await cursor.execute(
+                "SELECT last_id FROM api_log_rollup_state WHERE name=%s FOR UPDATE",
+                (API_LOG_CENTER_BACKFILL_NAME,)
+            )
+            row = await cursor.fetchone()
+            if row is None or row['last_id'] >= upper_id:
+                return 0
+            last_id = row['last_id']
+            end_id = min(upper_id, last_id + batch)
+            await cursor.execute("""
+                UPDATE api_logs a JOIN tokens c ON a.token = c.token
+                SET a.center_id = c.center_id
+                WHERE a.id > %s AND a.id <= %s AND a.center_id IS NULL AND c.center_id IS NOT NULL
+            """, (last_id, end_id))
+            await cursor.execute(
+                "UPDATE api_log_rollup_state SET last_id=%s WHERE name=%s",
+                (end_id, API_LOG_CENTER_BACKFILL_NAME)
+            )
+            return end_id - last_id
@@ -1,8 +1,11 @@
 import pymysql
 import os
+import random
 from dotenv import load_dotenv
-from typing import List, Optional, Dict, Any
-from app.db.database import db_session
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Generator, Iterator, List, Optional, Dict, Any, Tuple
+from app.db.database import db_session, connection_pool
 from decimal import Decimal
 
 # 加载环境变量
@@ -10,15 +13,23 @@ load_dotenv()
 
 
 class Database:
+    """从连接池借出一个连接，用完需调用close()归还（或使用with语句）"""
+
     def __init__(self, db_name='ocr'):
-        self.conn = pymysql.connect(
-            host=os.getenv('DB_HOST'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            database=os.getenv('DB_NAME'),
-            port=int(os.getenv('DB_PORT'))
-        )
-        self.cursor = self.conn.cursor()
+        self._pooled = connection_pool.acquire()
+        self.conn = self._pooled.conn
+        # 沿用元组游标，保持 row[0] 的访问方式
+        self.cursor = self.conn.cursor(pymysql.cursors.Cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        # 兜底：忘记close时在回收对象时归还连接
+        self.close()
 
     def add_token(self, token, use_times, center_id):
         try:
@@ -51,7 +62,15 @@ class Database:
             return False
 
     def close(self):
-        self.conn.close()
+        pooled = getattr(self, "_pooled", None)
+        if pooled is None:
+            return
+        self._pooled = None
+        try:
+            self.cursor.close()
+        except Exception:
+            pass
+        connection_pool.release(pooled)
 
     def get_allowed_ips(self):
         # 查询数据库中的允许的IP地址
@@ -145,6 +164,193 @@ class TokenRepository:
             )
             return cursor.rowcount > 0
 
+    @staticmethod
+    def reserve_usage(token: str) -> Optional[int]:
+        """
+        预留一次使用次数：一条带条件的UPDATE完成检查和扣减，并通过LAST_INSERT_ID返回剩余次数
+
+        Args:
+            token: token字符串
+
+        Returns:
+            扣减后的剩余次数，次数不足或token不存在时返回None
+        """
+        with db_session.get_cursor() as cursor:
+            cursor.execute(
+                "UPDATE tokens SET use_times = LAST_INSERT_ID(use_times - 1) WHERE token=%s AND use_times > 0",
+                (token,)
+            )
+            return cursor.lastrowid if cursor.rowcount > 0 else None
+
+    @staticmethod
+    def release_usage(token: str) -> Optional[int]:
+        """
+        归还一次预留的使用次数
+
+        Args:
+            token: token字符串
+
+        Returns:
+            归还后的剩余次数，token不存在时返回None
+        """
+        with db_session.get_cursor() as cursor:
+            cursor.execute(
+                "UPDATE tokens SET use_times = LAST_INSERT_ID(use_times + 1) WHERE token=%s",
+                (token,)
+            )
+            return cursor.lastrowid if cursor.rowcount > 0 else None
+
+
+# 热点token分片计数表：tokens.use_times 之外的剩余次数分散在多行中，读取时求和
+TOKEN_SHARDS_DDL = """
+CREATE TABLE IF NOT EXISTS token_usage_shards (
+    token VARCHAR(255) NOT NULL,
+    shard SMALLINT NOT NULL,
+    use_times INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (token, shard)
+)
+"""
+
+
+def distribute_use_times(total: int, shard_count: int) -> List[int]:
+    """把次数尽量平均地分到各分片"""
+    base, extra = divmod(max(total, 0), shard_count)
+    return [base + 1 if i < extra else base for i in range(shard_count)]
+
+
+class TokenShardRepository:
+    """热点token分片计数的数据库操作类
+
+    分片后的剩余次数 = tokens.use_times + SUM(token_usage_shards.use_times)，
+    每次扣减随机选一行分片，把同一行上的行锁竞争分散到多行
+    """
+
+    @staticmethod
+    def ensure_table():
+        """创建分片表（已存在时忽略）"""
+        with db_session.get_cursor() as cursor:
+            cursor.execute(TOKEN_SHARDS_DDL)
+
+    @staticmethod
+    def list_sharded_tokens() -> Dict[str, int]:
+        """
+        获取所有已分片的token
+
+        Returns:
+            {token: 分片数}
+        """
+        with db_session.get_cursor() as cursor:
+            cursor.execute("SELECT token, COUNT(*) AS shards FROM token_usage_shards GROUP BY token")
+            return {row['token']: row['shards'] for row in cursor.fetchall()}
+
+    @staticmethod
+    def get_total_use_times(token: str) -> Optional[int]:
+        """
+        获取分片token的总剩余次数
+
+        Args:
+            token: token字符串
+
+        Returns:
+            总剩余次数，token不存在时返回None
+        """
+        with db_session.get_cursor() as cursor:
+            cursor.execute(
+                "SELECT t.use_times + COALESCE((SELECT SUM(s.use_times) FROM token_usage_shards s "
+                "WHERE s.token = t.token), 0) AS use_times FROM tokens t WHERE t.token=%s",
+                (token,)
+            )
+            row = cursor.fetchone()
+            return int(row['use_times']) if row else None
+
+    @staticmethod
+    def decrement(token: str, shard_count: int) -> bool:
+        """
+        扣减一次：先随机选一个分片，该分片为0时取剩余最多的分片，最后才扣 tokens 表本身
+
+        Args:
+            token: token字符串
+            shard_count: 分片数
+
+        Returns:
+            是否扣减成功（总次数不足时返回False）
+        """
+        with db_session.get_cursor() as cursor:
+            cursor.execute(
+                "UPDATE token_usage_shards SET use_times = use_times - 1 "
+                "WHERE token=%s AND shard=%s AND use_times > 0",
+                (token, random.randrange(shard_count))
+            )
+            if cursor.rowcount > 0:
+                return True
+            cursor.execute(
+                "UPDATE token_usage_shards SET use_times = use_times - 1 "
+                "WHERE token=%s AND use_times > 0 ORDER BY use_times DESC LIMIT 1",
+                (token,)
+            )
+            if cursor.rowcount > 0:
+                return True
+            cursor.execute(
+                "UPDATE tokens SET use_times = use_times - 1 WHERE token=%s AND use_times > 0",
+                (token,)
+            )
+            return cursor.rowcount > 0
+
+    @staticmethod
+    def shard_token(token: str, shard_count: int) -> bool:
+        """
+        把token的剩余次数平均分到shard_count个分片
+
+        Args:
+            token: token字符串
+            shard_count: 分片数
+
+        Returns:
+            是否分片成功（token不存在或已分片时返回False）
+        """
+        with db_session.get_cursor() as cursor:
+            cursor.execute("SELECT use_times FROM tokens WHERE token=%s FOR UPDATE", (token,))
+            row = cursor.fetchone()
+            if not row:
+                return False
+            cursor.execute("SELECT 1 FROM token_usage_shards WHERE token=%s LIMIT 1", (token,))
+            if cursor.fetchone():
+                return False
+            cursor.executemany(
+                "INSERT INTO token_usage_shards (token, shard, use_times) VALUES (%s, %s, %s)",
+                [(token, i, n) for i, n in enumerate(distribute_use_times(row['use_times'], shard_count))]
+            )
+            cursor.execute("UPDATE tokens SET use_times = 0 WHERE token=%s", (token,))
+            return True
+
+    @staticmethod
+    def unshard_token(token: str) -> bool:
+        """
+        合并分片：把各分片的次数加回 tokens 表并删除分片
+
+        Args:
+            token: token字符串
+
+        Returns:
+            是否存在分片
+        """
+        with db_session.get_cursor() as cursor:
+            cursor.execute("SELECT use_times FROM tokens WHERE token=%s FOR UPDATE", (token,))
+            cursor.execute(
+                "SELECT COALESCE(SUM(use_times), 0) AS total, COUNT(*) AS shards "
+                "FROM token_usage_shards WHERE token=%s FOR UPDATE",
+                (token,)
+            )
+            row = cursor.fetchone()
+            if not row['shards']:
+                return False
+            cursor.execute(
+                "UPDATE tokens SET use_times = use_times + %s WHERE token=%s",
+                (int(row['total']), token)
+            )
+            cursor.execute("DELETE FROM token_usage_shards WHERE token=%s", (token,))
+            return True
+
 
 class CenterRepository:
     """中心相关的数据库操作类"""
@@ -206,6 +412,112 @@ class IPRepository:
             return []
 
 
+# 批量写入api_logs时每条记录的字段顺序
+API_LOG_COLUMNS = (
+    "timestamp", "client_ip", "token", "api_endpoint", "file_upload_id",
+    "file_name", "file_size", "ai_usage", "status",
+    "error_message", "error_code", "token_usetimes", "center_id",
+    "device_type", "processing_time", "repeat_count", "last_seen", "record_uuid",
+)
+
+
+# api_logs 汇总表：按小时/按天、端点、中心、token、设备类型、状态、错误代码累计请求数与处理时间
+API_LOG_ROLLUP_TABLES = {
+    "hourly": ("api_log_rollup_hourly", "DATETIME", "DATE_FORMAT(a.timestamp, '%%Y-%%m-%%d %%H:00:00')"),
+    "daily": ("api_log_rollup_daily", "DATE", "DATE(a.timestamp)"),
+}
+# 汇总维度（NULL存为空字符串，才能作为主键的一部分）
+API_LOG_ROLLUP_KEYS = ("api_endpoint", "center_id", "token", "device_type", "status", "error_code")
+# 处理时间直方图的桶上界（秒），最后一个桶为大于最后一个上界
+PROCESSING_TIME_BUCKETS = (0.5, 1, 2, 3, 5, 10, 20, 30, 60)
+PROCESSING_TIME_BUCKET_COLUMNS = tuple(f"pt_bucket_{i}" for i in range(len(PROCESSING_TIME_BUCKETS) + 1))
+# Dashboard不统计的日志（不存在的token），汇总时同样排除
+API_LOG_ROLLUP_EXCLUDED_MESSAGE = "TOKEN_NOT_FOUND"
+
+# 汇总进度行：已汇总到的日志ID；重建汇总表时另记一行重建目标（重建开始时的最大日志ID），
+# 进度追上目标之前汇总表不完整，Dashboard读原始日志
+API_LOG_ROLLUP_STATE_NAME = "api_logs"
+API_LOG_ROLLUP_REBUILD_NAME = "api_logs_rebuild"
+# 按token补写历史日志中心的进度行（迁移5登记，由汇总任务或命令行分批推进）
+API_LOG_CENTER_BACKFILL_NAME = "api_logs_center_backfill"
+
+API_LOG_ROLLUP_STATE_DDL = """
+CREATE TABLE IF NOT EXISTS api_log_rollup_state (
+    name VARCHAR(64) NOT NULL PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+)
+"""
+
+
+def api_log_rollup_ddl(table: str, bucket_type: str) -> str:
+    """汇总表的建表语句"""
+    histogram = "".join(f"    {column} BIGINT NOT NULL DEFAULT 0,\n" for column in PROCESSING_TIME_BUCKET_COLUMNS)
+    return f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    bucket {bucket_type} NOT NULL,
+    key_hash BINARY(16) NOT NULL,
+    api_endpoint VARCHAR(255) NOT NULL DEFAULT '',
+    center_id VARCHAR(255) NOT NULL DEFAULT '',
+    token VARCHAR(255) NOT NULL DEFAULT '',
+    device_type VARCHAR(64) NOT NULL DEFAULT '',
+    status VARCHAR(32) NOT NULL DEFAULT '',
+    error_code VARCHAR(64) NOT NULL DEFAULT '',
+    error_message TEXT NULL,
+    request_count BIGINT NOT NULL DEFAULT 0,
+    processing_time_count BIGINT NOT NULL DEFAULT 0,
+    processing_time_sum DOUBLE NOT NULL DEFAULT 0,
+{histogram}    PRIMARY KEY (bucket, key_hash),
+    KEY idx_{table}_endpoint_bucket (api_endpoint, bucket)
+)
+"""
+
+
+def api_log_rollup_sql(table: str, bucket_expr: str) -> str:
+    """
+    把 id 区间 (%s, %s] 内的日志累加进汇总表的语句
+
+    合并后的重复失败日志按 repeat_count 计数；同一维度组合已存在时在原值上累加。
+    中心取日志中的 center_id，没有时取token所属的中心（与Dashboard按 tokens 关联的口径一致）
+    """
+    weight = "IFNULL(a.repeat_count, 1)"
+    sources = {key: f"a.{key}" for key in API_LOG_ROLLUP_KEYS}
+    sources["center_id"] = "COALESCE(a.center_id, c.center_id)"
+    keys = [f"IFNULL({sources[key]}, '')" for key in API_LOG_ROLLUP_KEYS]
+    key_hash = f"UNHEX(MD5(CONCAT_WS(CHAR(31), {', '.join(keys)})))"
+    histogram = []
+    lower = None
+    for upper in PROCESSING_TIME_BUCKETS + (None,):
+        conditions = ["a.processing_time IS NOT NULL"]
+        if lower is not None:
+            conditions.append(f"a.processing_time > {lower}")
+        if upper is not None:
+            conditions.append(f"a.processing_time <= {upper}")
+        histogram.append(f"SUM(CASE WHEN {' AND '.join(conditions)} THEN {weight} ELSE 0 END)")
+        lower = upper
+    counters = ("request_count", "processing_time_count", "processing_time_sum") + PROCESSING_TIME_BUCKET_COLUMNS
+    return f"""
+INSERT INTO {table} (
+    bucket, key_hash, {', '.join(API_LOG_ROLLUP_KEYS)}, error_message, {', '.join(counters)}
+)
+SELECT
+    {bucket_expr}, {key_hash}, {', '.join(keys)},
+    MAX(a.error_message),
+    SUM({weight}),
+    SUM(CASE WHEN a.processing_time IS NULL THEN 0 ELSE {weight} END),
+    SUM(IFNULL(a.processing_time, 0) * {weight}),
+    {', '.join(histogram)}
+FROM api_logs a
+LEFT JOIN tokens c ON a.token = c.token
+WHERE a.id > %s AND a.id <= %s
+    AND (a.error_message IS NULL OR a.error_message != '{API_LOG_ROLLUP_EXCLUDED_MESSAGE}')
+GROUP BY {bucket_expr}, {key_hash}, {', '.join(keys)}
+ON DUPLICATE KEY UPDATE
+    error_message = COALESCE(VALUES(error_message), error_message),
+    {', '.join(f"{column} = {column} + VALUES({column})" for column in counters)}
+"""
+
+
 class APILogRepository:
     """API日志相关的数据库操作类"""
 
@@ -320,6 +632,203 @@ class APILogRepository:
             print(f"获取API日志失败: {str(e)}")
             return []
 
+    @staticmethod
+    def iter_api_logs(
+            start: datetime,
+            end: datetime,
+            center_id: Optional[str] = None,
+            token: Optional[str] = None,
+            api_endpoint: Optional[str] = None,
+            status: Optional[str] = None,
+            batch_size: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        逐行读取时间范围内的API日志（关联tokens），通过无缓冲游标每次只从服务器取 batch_size 行，
+        内存占用与时间范围内的日志条数无关
+
+        Args:
+            start: 开始时间（包含）
+            end: 结束时间（不包含）
+            center_id: 按中心过滤（可选）
+            token: 按token过滤（可选）
+            api_endpoint: 按API端点过滤（可选）
+            status: 按状态过滤（可选）
+            batch_size: 每次从服务器读取的行数
+
+        Returns:
+            日志记录迭代器，列为 API_LOG_EXPORT_COLUMNS
+        """
+        conditions = ["a.timestamp >= %s", "a.timestamp < %s"]
+        params: List[Any] = [start, end]
+        for column, value in (("center_id", center_id), ("token", token),
+                              ("api_endpoint", api_endpoint), ("status", status)):
+            if value:
+                # 中心与导出的列一致：日志中没有中心时取token所属的中心
+                target = "COALESCE(a.center_id, c.center_id)" if column == "center_id" else f"a.{column}"
+                conditions.append(f"{target} = %s")
+                params.append(value)
+        # 按token过滤时沿 (token, timestamp) 索引按时间顺序读取；
+        # 否则按主键顺序读取（与写入顺序一致），避免服务器对整个范围排序
+        order_by = "a.timestamp, a.id" if token else "a.id"
+
+        with db_session.get_streaming_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT
+                    a.id,
+                    a.timestamp,
+                    a.client_ip,
+                    a.token,
+                    a.api_endpoint,
+                    COALESCE(a.center_id, c.center_id) as center_id,
+                    a.device_type,
+                    a.file_upload_id,
+                    a.file_name,
+                    a.file_size,
+                    a.status,
+                    a.processing_time,
+                    a.ai_usage,
+                    a.token_usetimes as remaining_times,
+                    c.use_times as original_times,
+                    a.repeat_count,
+                    a.error_code,
+                    a.error_message
+                FROM api_logs a
+                LEFT JOIN tokens c ON a.token = c.token
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {order_by}
+            """, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+
+# 导出日志的列（api_logs 关联 tokens）
+API_LOG_EXPORT_COLUMNS = (
+    "id", "timestamp", "client_ip", "token", "api_endpoint", "center_id", "device_type",
+    "file_upload_id", "file_name", "file_size", "status", "processing_time", "ai_usage",
+    "remaining_times", "original_times", "repeat_count", "error_code", "error_message",
+)
+
+
+# 归档文件的列：api_logs 的全部列，加上归档时 tokens 中的中心与原始次数（token以后被删除也能追溯）
+API_LOG_ARCHIVE_COLUMNS = ("id", *API_LOG_COLUMNS, "token_center_id", "original_times")
+
+
+class APILogArchiveRepository:
+    """旧日志归档相关的数据库操作类"""
+
+    LOCK_NAME = "ocr_api_log_archive"
+
+    @staticmethod
+    def get_oldest_log_time() -> Optional[datetime]:
+        """
+        最早一条日志的时间
+
+        Returns:
+            时间，没有日志时为None
+        """
+        with db_session.get_cursor() as cursor:
+            cursor.execute("SELECT MIN(timestamp) AS t FROM api_logs")
+            row = cursor.fetchone()
+            return row['t'] if row else None
+
+    @staticmethod
+    def iter_month_batches(start: datetime, end: datetime, after_id: int, max_id: Optional[int] = None,
+                           batch_size: int = 5000) -> Iterator[List[Dict[str, Any]]]:
+        """
+        按ID顺序分批读取时间范围内、ID大于 after_id 的日志（无缓冲游标，内存只保留一批）
+
+        Args:
+            start: 开始时间（包含）
+            end: 结束时间（不包含）
+            after_id: 只读取ID大于此值的日志（已归档的部分跳过）
+            max_id: 只读取ID不大于此值的日志（可选）
+            batch_size: 每批行数
+
+        Returns:
+            每批为按 API_LOG_ARCHIVE_COLUMNS 的记录列表
+        """
+        columns = ", ".join(f"a.{column}" for column in API_LOG_ARCHIVE_COLUMNS[:-2])
+        with db_session.get_streaming_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {columns}, c.center_id AS token_center_id, c.use_times AS original_times
+                FROM api_logs a
+                LEFT JOIN tokens c ON a.token = c.token
+                WHERE a.timestamp >= %s AND a.timestamp < %s AND a.id > %s {"AND a.id <= %s" if max_id is not None else ""}
+                ORDER BY a.id
+            """, (start, end, after_id, *([max_id] if max_id is not None else [])))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
+    @staticmethod
+    def delete_archived(start: datetime, end: datetime, max_id: int, batch_size: int = 5000) -> int:
+        """
+        删除一批已归档的日志（时间范围内、ID不大于 max_id），每批一个事务，避免长时间持有大量行锁
+
+        Args:
+            start: 开始时间（包含）
+            end: 结束时间（不包含）
+            max_id: 已归档的最大ID
+            batch_size: 本批最多删除的行数
+
+        Returns:
+            删除的行数，为0表示已删完
+        """
+        with db_session.get_cursor() as cursor:
+            return cursor.execute(
+                "DELETE FROM api_logs WHERE timestamp >= %s AND timestamp < %s AND id <= %s LIMIT %s",
+                (start, end, max_id, batch_size)
+            )
+
+    @staticmethod
+    @contextmanager
+    def lock() -> Generator[bool, None, None]:
+        """
+        归档任务的互斥锁（GET_LOCK，不等待）：多个进程同时启用归档时只有一个执行。
+        锁随连接存在，使用独立连接并在结束时关闭
+
+        Returns:
+            是否拿到锁
+        """
+        conn = db_session.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT GET_LOCK(%s, 0) AS locked", (APILogArchiveRepository.LOCK_NAME,))
+                yield bool(cursor.fetchone()['locked'])
+        finally:
+            conn.close()
+
+
+def month_range(year_month: str) -> Tuple[datetime, datetime]:
+    """
+    把 'YYYY-MM' 转成半开区间 [月初, 下月初)
+
+    按时间范围比较 timestamp 列可以使用 (api_endpoint, timestamp) 等复合索引；
+    对列套用 DATE_FORMAT 后再比较则只能全表扫描
+    """
+    start = datetime.strptime(year_month, '%Y-%m')
+    if start.month == 12:
+        return start, start.replace(year=start.year + 1, month=1)
+    return start, start.replace(month=start.month + 1)
+
+
+# /dashboard/logs 可排序的列及其排序键（可为NULL的列用COALESCE，游标比较才有确定的结果）
+DASHBOARD_LOG_SORT_KEYS = {
+    "timestamp": "a.timestamp",
+    "processing_time": "COALESCE(a.processing_time, -1)",
+    "file_size": "COALESCE(a.file_size, -1)",
+}
+# Dashboard统计的图像识别接口（multipart上传与原始请求体上传）
+DASHBOARD_API_ENDPOINTS = ("/upload/image", "/upload/image/raw")
+_DASHBOARD_ENDPOINT_PLACEHOLDERS = ", ".join(["%s"] * len(DASHBOARD_API_ENDPOINTS))
+# /dashboard/logs 可筛选的列
+DASHBOARD_LOG_FILTERS = ("center_id", "token", "status", "device_type", "error_code")
+
 
 class DashboardRepository:
     """Dashboard数据分析相关的数据库操作类"""
@@ -337,7 +846,7 @@ class DashboardRepository:
         """
         try:
             with db_session.get_cursor() as cursor:
-                sql = """
+                sql = f"""
                 SELECT 
                     a.id,
                     a.timestamp,
@@ -354,6 +863,7 @@ class DashboardRepository:
                     a.error_message,
                     a.error_code,
                     a.token_usetimes as remaining_times,
+                    a.repeat_count,
                     c.use_times as original_times,
                     c.center_id
                 FROM 
@@ -361,16 +871,18 @@ class DashboardRepository:
                 LEFT JOIN 
                     tokens c ON a.token = c.token
                 WHERE
-                    a.api_endpoint = %s
+                    a.api_endpoint IN ({_DASHBOARD_ENDPOINT_PLACEHOLDERS})
                     AND (
                         a.error_message IS NULL
                         OR a.error_message != %s
                     )
-                    AND DATE_FORMAT(a.timestamp, %s) = %s
+                    AND a.timestamp >= %s
+                    AND a.timestamp < %s
                 ORDER BY a.timestamp DESC
                 """
 
-                cursor.execute(sql, ('/upload/image', 'TOKEN_NOT_FOUND', '%Y-%m', year_month))
+                start, end = month_range(year_month)
+                cursor.execute(sql, (*DASHBOARD_API_ENDPOINTS, 'TOKEN_NOT_FOUND', start, end))
                 results = cursor.fetchall()
                 
                 # 转换datetime和Decimal对象为字符串，避免JSON序列化错误
@@ -390,6 +902,215 @@ class DashboardRepository:
             print(f"获取Dashboard数据失败: {str(e)}")
             return []
 
+    @staticmethod
+    def _log_conditions(year_month: str, filters: Dict[str, str]) -> Tuple[List[str], List[Any]]:
+        """
+        原始日志查询的公共条件：端点、月份范围与筛选（token筛选可走对应的复合索引）；
+        中心与列表中显示的一致，日志中没有中心时取token所属的中心，查询需关联 tokens c
+        """
+        start, end = month_range(year_month)
+        conditions = [
+            f"a.api_endpoint IN ({_DASHBOARD_ENDPOINT_PLACEHOLDERS})",
+            "(a.error_message IS NULL OR a.error_message != %s)",
+            "a.timestamp >= %s",
+            "a.timestamp < %s",
+        ]
+        params = [*DASHBOARD_API_ENDPOINTS, 'TOKEN_NOT_FOUND', start, end]
+        for column in DASHBOARD_LOG_FILTERS:
+            if filters.get(column):
+                target = "COALESCE(a.center_id, c.center_id)" if column == "center_id" else f"a.{column}"
+                conditions.append(f"{target} = %s")
+                params.append(filters[column])
+        return conditions, params
+
+    @staticmethod
+    def get_logs_page(
+            year_month: str,
+            filters: Dict[str, str],
+            sort: str = "timestamp",
+            descending: bool = True,
+            after: Optional[Tuple[Any, int]] = None,
+            limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        按 (排序键, id) 做键集分页读取原始日志：从上一页最后一行之后继续，不使用OFFSET，
+        翻到多深都只读取一页的行
+
+        Args:
+            year_month: 年月格式 'YYYY-MM'
+            filters: 筛选条件，键为 DASHBOARD_LOG_FILTERS 中的列
+            sort: 排序列，DASHBOARD_LOG_SORT_KEYS 中的键
+            descending: 是否降序
+            after: 上一页最后一行的 (排序键, id)，第一页为None
+            limit: 每页条数
+
+        Returns:
+            日志记录列表（原始类型），sort_value 为该行的排序键
+        """
+        sort_key = DASHBOARD_LOG_SORT_KEYS[sort]
+        conditions, params = DashboardRepository._log_conditions(year_month, filters)
+        direction = "DESC" if descending else "ASC"
+        if after is not None:
+            op = "<" if descending else ">"
+            conditions.append(f"({sort_key} {op} %s OR ({sort_key} = %s AND a.id {op} %s))")
+            params.extend([after[0], after[0], after[1]])
+        params.append(limit)
+
+        with db_session.get_cursor() as cursor:
+            cursor.execute(f"""
+            SELECT
+                a.id,
+                a.timestamp,
+                a.client_ip,
+                a.token,
+                a.api_endpoint,
+                a.file_upload_id,
+                a.file_name,
+                a.file_size,
+                a.ai_usage,
+                a.device_type,
+                a.processing_time,
+                a.status,
+                a.error_message,
+                a.error_code,
+                a.token_usetimes as remaining_times,
+                a.repeat_count,
+                c.use_times as original_times,
+                COALESCE(a.center_id, c.center_id) as center_id,
+                {sort_key} as sort_value
+            FROM
+                api_logs a
+            LEFT JOIN
+                tokens c ON a.token = c.token
+            WHERE
+                {' AND '.join(conditions)}
+            ORDER BY {sort_key} {direction}, a.id {direction}
+            LIMIT %s
+            """, params)
+            return cursor.fetchall()
+
+    @staticmethod
+    def count_logs(year_month: str, filters: Dict[str, str]) -> int:
+        """
+        符合筛选条件的原始日志条数
+
+        Args:
+            year_month: 年月格式 'YYYY-MM'
+            filters: 筛选条件
+
+        Returns:
+            条数
+        """
+        conditions, params = DashboardRepository._log_conditions(year_month, filters)
+        with db_session.get_cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) AS n FROM api_logs a LEFT JOIN tokens c ON a.token = c.token "
+                f"WHERE {' AND '.join(conditions)}",
+                params
+            )
+            return cursor.fetchone()['n']
+
+    @staticmethod
+    def _scan_months(cursor, table: str, time_column: str) -> List[str]:
+        """
+        沿 (api_endpoint, 时间列) 索引跳跃查找有数据的月份：每次取下一个月月初之后的第一条记录，
+        每个接口分别查找（等值条件才能按索引顺序取第一条），查询次数等于各接口有数据的月份数之和，不扫描日志行
+        """
+        sql = f"""
+        SELECT {time_column} AS t
+        FROM {table}
+        WHERE api_endpoint = %s AND {time_column} >= %s
+        ORDER BY {time_column}
+        LIMIT 1
+        """
+
+        months = set()
+        for api_endpoint in DASHBOARD_API_ENDPOINTS:
+            next_start = datetime(1970, 1, 1)
+            while True:
+                cursor.execute(sql, (api_endpoint, next_start))
+                row = cursor.fetchone()
+                if not row:
+                    break
+                year_month = row['t'].strftime('%Y-%m')
+                months.add(year_month)
+                next_start = month_range(year_month)[1]
+        return sorted(months, reverse=True)
+
+    @staticmethod
+    def get_rollup_data(year_month: str, granularity: str = "daily") -> List[Dict[str, Any]]:
+        """
+        获取指定月份的汇总数据（由 api_log_rollup 后台任务增量维护）
+
+        Args:
+            year_month: 年月格式 'YYYY-MM'
+            granularity: 'daily' 按天 或 'hourly' 按小时
+
+        Returns:
+            每个时间桶与维度组合一行：bucket、center_id、token、device_type、status、error_code、
+            error_message（该组合的一条错误信息）、request_count、processing_time_count、
+            processing_time_sum、processing_time_histogram（各桶计数，上界见 PROCESSING_TIME_BUCKETS）
+        """
+        table, _, _ = API_LOG_ROLLUP_TABLES[granularity]
+        bucket_format = '%Y-%m-%d %H:00:00' if granularity == "hourly" else '%Y-%m-%d'
+        try:
+            with db_session.get_cursor() as cursor:
+                start, end = month_range(year_month)
+                cursor.execute(f"""
+                SELECT
+                    bucket, {', '.join(API_LOG_ROLLUP_KEYS[1:])}, error_message,
+                    request_count, processing_time_count, processing_time_sum,
+                    {', '.join(PROCESSING_TIME_BUCKET_COLUMNS)}
+                FROM {table}
+                WHERE api_endpoint IN ({_DASHBOARD_ENDPOINT_PLACEHOLDERS}) AND bucket >= %s AND bucket < %s
+                ORDER BY bucket
+                """, (*DASHBOARD_API_ENDPOINTS, start, end))
+
+                results = []
+                for row in cursor.fetchall():
+                    formatted_row = {
+                        'bucket': row['bucket'].strftime(bucket_format),
+                        'error_message': row['error_message'],
+                        'request_count': int(row['request_count']),
+                        'processing_time_count': int(row['processing_time_count']),
+                        'processing_time_sum': float(row['processing_time_sum']),
+                        'processing_time_histogram': [int(row[column]) for column in PROCESSING_TIME_BUCKET_COLUMNS],
+                    }
+                    # 汇总表中的空字符串还原为NULL
+                    for key in API_LOG_ROLLUP_KEYS[1:]:
+                        formatted_row[key] = row[key] or None
+                    results.append(formatted_row)
+                return results
+        except Exception as e:
+            print(f"获取Dashboard汇总数据失败: {str(e)}")
+            return []
+
+    @staticmethod
+    def _rollup_ready(cursor) -> bool:
+        """汇总表是否可用：已按中心重建（迁移5），且汇总进度已追上重建目标"""
+        cursor.execute(
+            "SELECT name, last_id FROM api_log_rollup_state WHERE name IN (%s, %s)",
+            (API_LOG_ROLLUP_STATE_NAME, API_LOG_ROLLUP_REBUILD_NAME)
+        )
+        state = {row['name']: row['last_id'] for row in cursor.fetchall()}
+        return (API_LOG_ROLLUP_REBUILD_NAME in state
+                and state.get(API_LOG_ROLLUP_STATE_NAME, 0) >= state[API_LOG_ROLLUP_REBUILD_NAME])
+
+    @staticmethod
+    def is_rollup_ready() -> bool:
+        """
+        汇总表是否可以代替原始日志
+
+        Returns:
+            可用时为True；尚未重建、重建未完成或查询失败时为False（读原始日志）
+        """
+        try:
+            with db_session.get_cursor() as cursor:
+                return DashboardRepository._rollup_ready(cursor)
+        except Exception as e:
+            print(f"获取汇总进度失败: {str(e)}")
+            return False
+
     @staticmethod
     def get_available_months() -> List[str]:
         """
@@ -400,16 +1121,12 @@ class DashboardRepository:
         """
         try:
             with db_session.get_cursor() as cursor:
-                sql = """
-                SELECT DISTINCT DATE_FORMAT(timestamp, %s) as year_month
-                FROM api_logs 
-                WHERE api_endpoint = %s
-                ORDER BY year_month DESC
-                """
-
-                cursor.execute(sql, ('%Y-%m', '/upload/image'))
-                results = cursor.fetchall()
-                return [row['year_month'] for row in results]
+                # 优先读按天汇总表；汇总表不可用（刚迁移、历史日志尚未汇总完）时读原始日志
+                months = []
+                if DashboardRepository._rollup_ready(cursor):
+                    daily_table = API_LOG_ROLLUP_TABLES["daily"][0]
+                    months = DashboardRepository._scan_months(cursor, daily_table, "bucket")
+                return months or DashboardRepository._scan_months(cursor, "api_logs", "timestamp")
         except Exception as e:
             print(f"获取可用月份失败: {str(e)}")
             return []
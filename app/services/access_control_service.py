@@ -0,0 +1,155 @@
+"""
+管理接口的访问控制快照：IP白名单与中心列表
+
+白名单编译为按前缀长度分组的网络地址集合，查找时对每种前缀长度做一次集合查询，
+支持IPv4/IPv6与CIDR写法。快照定期刷新，也可以调用 invalidate() 立即失效。
+"""
+import asyncio
+import ipaddress
+import os
+import time
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Union
+
+from app.models.async_database import AsyncIPRepository, AsyncCenterRepository
+
+# 快照有效期（秒）
+ACCESS_CONTROL_TTL = float(os.getenv("ACCESS_CONTROL_TTL", "60"))
+# 白名单中不带前缀长度的IPv4地址按该前缀匹配（沿用原来的 a.b.c 前三段匹配，即/24）
+IP_ALLOWLIST_IPV4_BARE_PREFIX = int(os.getenv("IP_ALLOWLIST_IPV4_BARE_PREFIX", "24"))
+# 白名单中不带前缀长度的IPv6地址按该前缀匹配
+IP_ALLOWLIST_IPV6_BARE_PREFIX = int(os.getenv("IP_ALLOWLIST_IPV6_BARE_PREFIX", "64"))
+
+
+class IPAllowlist:
+    """编译后的IP白名单"""
+
+    def __init__(self, entries: Iterable[str]):
+        # {IP版本: {前缀长度: {网络地址整数}}}
+        self._networks: Dict[int, Dict[int, Set[int]]] = {4: {}, 6: {}}
+        self.invalid_entries = []
+        for entry in entries:
+            network = self._parse(entry)
+            if network is None:
+                self.invalid_entries.append(entry)
+                continue
+            self._networks[network.version].setdefault(network.prefixlen, set()).add(
+                int(network.network_address)
+            )
+        # 长前缀优先，命中即返回
+        self._prefixes = {
+            version: sorted(by_prefix, reverse=True) for version, by_prefix in self._networks.items()
+        }
+
+    @staticmethod
+    def _parse(entry: str) -> Optional[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+        entry = (entry or "").strip()
+        if not entry:
+            return None
+        try:
+            if "/" in entry:
+                return ipaddress.ip_network(entry, strict=False)
+            # 只写前几段的IPv4前缀，如 "192.168.1" 或 "192.168.1.*"
+            octets = entry.rstrip(".*").split(".") if ":" not in entry else []
+            if 0 < len(octets) < 4 and all(o.isdigit() for o in octets):
+                padded = octets + ["0"] * (4 - len(octets))
+                return ipaddress.ip_network(f"{'.'.join(padded)}/{8 * len(octets)}", strict=False)
+            address = ipaddress.ip_address(entry)
+            prefix = IP_ALLOWLIST_IPV4_BARE_PREFIX if address.version == 4 else IP_ALLOWLIST_IPV6_BARE_PREFIX
+            return ipaddress.ip_network(f"{address}/{prefix}", strict=False)
+        except ValueError:
+            return None
+
+    def __contains__(self, ip: str) -> bool:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        # IPv4映射的IPv6地址（::ffff:a.b.c.d）按IPv4匹配
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        value = int(address)
+        bits = address.max_prefixlen
+        by_prefix = self._networks[address.version]
+        for prefix in self._prefixes[address.version]:
+            mask = ((1 << prefix) - 1) << (bits - prefix) if prefix else 0
+            if (value & mask) in by_prefix[prefix]:
+                return True
+        return False
+
+    def __len__(self):
+        return sum(len(networks) for by_prefix in self._networks.values() for networks in by_prefix.values())
+
+
+class AccessControlSnapshot:
+    """某一时刻的白名单与中心列表"""
+
+    def __init__(self, allowlist: IPAllowlist, centers: FrozenSet[str]):
+        self.allowlist = allowlist
+        self.centers = centers
+        self.loaded_at = time.monotonic()
+
+    def is_ip_allowed(self, ip: Optional[str]) -> bool:
+        return bool(ip) and ip in self.allowlist
+
+
+class AccessControlRegistry:
+    """访问控制快照的缓存，过期后由一个请求负责重新加载"""
+
+    def __init__(self, ttl: float = ACCESS_CONTROL_TTL):
+        self.ttl = ttl
+        self._snapshot: Optional[AccessControlSnapshot] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.reloads = 0
+
+    async def _load(self) -> AccessControlSnapshot:
+        allowed_ips = await AsyncIPRepository.get_allowed_ips()
+        centers = await AsyncCenterRepository.list_centers()
+        allowlist = IPAllowlist(allowed_ips)
+        if allowlist.invalid_entries:
+            print(f"IP白名单中的无效条目已忽略: {allowlist.invalid_entries}")
+        self.reloads += 1
+        return AccessControlSnapshot(allowlist, frozenset(centers))
+
+    def _fresh(self) -> bool:
+        return self._snapshot is not None and time.monotonic() - self._snapshot.loaded_at <= self.ttl
+
+    async def get_snapshot(self) -> AccessControlSnapshot:
+        """
+        获取当前快照，过期或已失效时重新加载
+
+        返回:
+            AccessControlSnapshot
+        """
+        if self._fresh():
+            return self._snapshot
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._fresh():
+                self._snapshot = await self._load()
+            return self._snapshot
+
+    async def center_exists(self, center_id: str) -> bool:
+        """
+        检查中心ID是否存在：先查快照，快照中没有时再查一次数据库（快照之后新增的中心）
+
+        参数:
+            center_id: 中心ID
+        返回:
+            中心ID是否存在
+        """
+        snapshot = await self.get_snapshot()
+        if center_id in snapshot.centers:
+            return True
+        if await AsyncCenterRepository.center_exists(center_id):
+            self.invalidate()
+            return True
+        return False
+
+    def invalidate(self):
+        """使快照失效，下次访问时重新加载"""
+        self._snapshot = None
+
+
+# 全局访问控制快照
+access_control = AccessControlRegistry()
@@ -0,0 +1,146 @@
+"""
+Dashboard分析结果缓存
+
+缓存序列化好的响应体与ETag：已结束的月份（过了宽限期，补写和汇总都已完成）长期缓存，
+当前月份每 DASHBOARD_CACHE_TTL 秒重新计算一次。同一月份同时只有一个请求在计算，
+其他请求等待同一个结果。客户端带 If-None-Match 且内容未变时返回304。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from app.core.metrics import Metric, metrics_registry
+from app.models.database import month_range
+
+# 当前月份的缓存有效期（秒）
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "60"))
+# 月份结束后多久视为不再变化（秒）：暂存日志重放、汇总任务补齐最后一段日志都需要时间
+DASHBOARD_CACHE_CLOSE_GRACE = float(os.getenv("DASHBOARD_CACHE_CLOSE_GRACE", "3600"))
+# 最多缓存的月份数，超出时淘汰最久未访问的
+DASHBOARD_CACHE_MAX_MONTHS = int(os.getenv("DASHBOARD_CACHE_MAX_MONTHS", "36"))
+
+
+class DashboardCacheEntry:
+    """一个月份的缓存结果"""
+
+    def __init__(self, body: bytes, immutable: bool):
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.immutable = immutable
+        self.computed_at = time.monotonic()
+
+    @property
+    def cache_control(self) -> str:
+        # 已结束的月份浏览器可直接使用本地缓存；当前月份每次带ETag重新验证
+        return "private, max-age=86400" if self.immutable else "private, no-cache"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否包含该ETag（支持多个值、弱校验前缀W/和*）"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(value.removeprefix("W/") == etag for value in candidates)
+
+
+class DashboardCache:
+    """按月份缓存Dashboard分析结果"""
+
+    def __init__(self, ttl: float = DASHBOARD_CACHE_TTL, close_grace: float = DASHBOARD_CACHE_CLOSE_GRACE,
+                 max_months: int = DASHBOARD_CACHE_MAX_MONTHS):
+        self.ttl = ttl
+        self.close_grace = close_grace
+        self.max_months = max_months
+        self._entries: "OrderedDict[str, DashboardCacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        # 指标
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.not_modified = 0
+        self.last_compute_duration = 0.0
+
+    def is_closed(self, year_month: str) -> bool:
+        """月份是否已结束且过了宽限期"""
+        _, end = month_range(year_month)
+        return (datetime.now() - end).total_seconds() >= self.close_grace
+
+    def _fresh(self, entry: DashboardCacheEntry) -> bool:
+        return entry.immutable or time.monotonic() - entry.computed_at <= self.ttl
+
+    async def get(self, year_month: str, compute: Callable[[str], Dict[str, Any]]) -> DashboardCacheEntry:
+        """
+        获取某月份的缓存结果，没有或已过期时计算
+
+        参数:
+            year_month: 年月格式 'YYYY-MM'
+            compute: 计算分析数据的同步函数（在线程池中执行）
+        返回:
+            DashboardCacheEntry
+        """
+        entry = self._entries.get(year_month)
+        if entry is not None and self._fresh(entry):
+            self._entries.move_to_end(year_month)
+            self.hits += 1
+            return entry
+
+        inflight = self._inflight.get(year_month)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[year_month] = future
+        try:
+            start = time.monotonic()
+            closed = self.is_closed(year_month)
+            data = await asyncio.to_thread(compute, year_month)
+            body = json.dumps({"success": True, "data": data}, ensure_ascii=False, default=str).encode("utf-8")
+            # 查询失败时仓库返回空数据，已结束的月份为空时不长期缓存，过期后重新计算
+            entry = DashboardCacheEntry(body, immutable=closed and bool(data.get("total_requests")))
+            self.last_compute_duration = time.monotonic() - start
+            self._entries[year_month] = entry
+            self._entries.move_to_end(year_month)
+            while len(self._entries) > self.max_months:
+                self._entries.popitem(last=False)
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他请求等待时取出异常，避免"Future exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(year_month, None)
+
+    def invalidate(self, year_month: Optional[str] = None):
+        """清除某月份（或全部）的缓存"""
+        if year_month is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(year_month, None)
+
+    def collect_metrics(self):
+        """导出指标"""
+        return [
+            Metric("dashboard_cache_entries", "gauge", "已缓存的月份数", [({}, len(self._entries))]),
+            Metric("dashboard_cache_hits_total", "counter", "命中缓存的请求数", [({}, self.hits)]),
+            Metric("dashboard_cache_misses_total", "counter", "需要重新计算的请求数", [({}, self.misses)]),
+            Metric("dashboard_cache_coalesced_total", "counter", "等待同一次计算结果的请求数",
+                   [({}, self.coalesced)]),
+            Metric("dashboard_cache_not_modified_total", "counter", "返回304的请求数", [({}, self.not_modified)]),
+            Metric("dashboard_cache_last_compute_duration_seconds", "gauge", "最近一次计算耗时（秒）",
+                   [({}, round(self.last_compute_duration, 6))]),
+        ]
+
+
+# 全局Dashboard缓存
+dashboard_cache = DashboardCache()
+metrics_registry.register(dashboard_cache.collect_metrics)
@@ -0,0 +1,212 @@
+"""
+Dashboard实时增量
+
+API日志在进入批量写入队列时同时发布到进程内的事件总线，总线把每 DASHBOARD_EVENTS_INTERVAL 秒内的日志
+累加成一条增量（请求数、成功/失败数、处理时间直方图、按中心/设备/错误代码的计数），推送给所有
+SSE订阅者，页面在已加载的统计上累加，不必重新请求整月数据。
+没有订阅者时发布只做一次判断，不累加。增量只包含本进程处理的请求（多worker部署时各连接看到的是
+所在worker的增量），以汇总表为准的完整数据在重新加载页面时获得。
+"""
+import asyncio
+import json
+import os
+from bisect import bisect_left
+from typing import Any, Dict, Optional, Set
+
+from app.core.metrics import Metric, metrics_registry
+from app.models.database import (
+    API_LOG_COLUMNS, API_LOG_ROLLUP_EXCLUDED_MESSAGE, DASHBOARD_API_ENDPOINTS, PROCESSING_TIME_BUCKETS
+)
+
+# 增量推送间隔（秒）
+DASHBOARD_EVENTS_INTERVAL = float(os.getenv("DASHBOARD_EVENTS_INTERVAL", "2"))
+# 最多同时订阅的连接数
+DASHBOARD_EVENTS_MAX_SUBSCRIBERS = int(os.getenv("DASHBOARD_EVENTS_MAX_SUBSCRIBERS", "50"))
+# 每个订阅者最多积压的增量条数，超出时断开该订阅者（客户端重连后重新加载）
+DASHBOARD_EVENTS_QUEUE_SIZE = int(os.getenv("DASHBOARD_EVENTS_QUEUE_SIZE", "100"))
+
+_TIMESTAMP = API_LOG_COLUMNS.index("timestamp")
+_API_ENDPOINT = API_LOG_COLUMNS.index("api_endpoint")
+_STATUS = API_LOG_COLUMNS.index("status")
+_ERROR_MESSAGE = API_LOG_COLUMNS.index("error_message")
+_ERROR_CODE = API_LOG_COLUMNS.index("error_code")
+_CENTER_ID = API_LOG_COLUMNS.index("center_id")
+_DEVICE_TYPE = API_LOG_COLUMNS.index("device_type")
+_PROCESSING_TIME = API_LOG_COLUMNS.index("processing_time")
+
+
+class SubscriberLimitError(Exception):
+    """订阅者数量已达上限"""
+
+
+def new_delta(year_month: str) -> Dict[str, Any]:
+    """某月份的空增量"""
+    return {
+        "year_month": year_month,
+        "total_requests": 0,
+        "success_count": 0,
+        "failed_count": 0,
+        "processing_time_count": 0,
+        "processing_time_sum": 0.0,
+        # 各桶计数，桶上界见 processing_time_buckets，最后一桶为更长的处理时间
+        "processing_time_histogram": [0] * (len(PROCESSING_TIME_BUCKETS) + 1),
+        "processing_time_buckets": list(PROCESSING_TIME_BUCKETS),
+        "centers": {},
+        "devices": {},
+        "errors": {},
+    }
+
+
+def add_to_delta(delta: Dict[str, Any], record: tuple):
+    """把一条日志累加进增量（统计口径与 analyze_requests 一致）"""
+    status = record[_STATUS]
+    success = 1 if status == "success" else 0
+    failed = 1 if status == "failed" else 0
+    processing_time = record[_PROCESSING_TIME]
+
+    delta["total_requests"] += 1
+    delta["success_count"] += success
+    delta["failed_count"] += failed
+    if processing_time is not None:
+        processing_time = float(processing_time)
+        delta["processing_time_count"] += 1
+        delta["processing_time_sum"] += processing_time
+        delta["processing_time_histogram"][bisect_left(PROCESSING_TIME_BUCKETS, processing_time)] += 1
+
+    center_id = record[_CENTER_ID]
+    if center_id:
+        center = delta["centers"].setdefault(center_id, {"total_requests": 0, "success_count": 0, "failed_count": 0})
+        center["total_requests"] += 1
+        center["success_count"] += success
+        center["failed_count"] += failed
+
+    device_type = record[_DEVICE_TYPE]
+    if device_type:
+        device = delta["devices"].setdefault(device_type, {
+            "total_requests": 0, "success_count": 0, "processing_time_count": 0, "processing_time_sum": 0.0
+        })
+        device["total_requests"] += 1
+        device["success_count"] += success
+        if processing_time is not None:
+            device["processing_time_count"] += 1
+            device["processing_time_sum"] += processing_time
+
+    if failed:
+        error_code = record[_ERROR_CODE]
+        error_message = record[_ERROR_MESSAGE] or "Unknown Error"
+        key = error_code or error_message
+        error = delta["errors"].setdefault(key, {"error_code": error_code, "error_message": error_message, "count": 0})
+        error["count"] += 1
+
+
+class DashboardEventBus:
+    """进程内的Dashboard增量总线（所有操作在事件循环线程内执行）"""
+
+    def __init__(self, interval: float = DASHBOARD_EVENTS_INTERVAL,
+                 max_subscribers: int = DASHBOARD_EVENTS_MAX_SUBSCRIBERS,
+                 queue_size: int = DASHBOARD_EVENTS_QUEUE_SIZE):
+        self.interval = interval
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._pending: Dict[str, Dict[str, Any]] = {}  # 年月 -> 尚未推送的增量
+        self._task: Optional[asyncio.Task] = None
+
+        # 指标
+        self.published = 0
+        self.deltas_sent = 0
+        self.subscribers_dropped = 0
+
+    def publish(self, record: tuple):
+        """
+        发布一条API日志
+
+        参数:
+            record: 按 API_LOG_COLUMNS 顺序排列的记录
+        """
+        if not self._subscribers:
+            return
+        if (record[_API_ENDPOINT] not in DASHBOARD_API_ENDPOINTS
+                or record[_ERROR_MESSAGE] == API_LOG_ROLLUP_EXCLUDED_MESSAGE):
+            return
+        year_month = record[_TIMESTAMP].strftime('%Y-%m')
+        delta = self._pending.get(year_month)
+        if delta is None:
+            delta = self._pending[year_month] = new_delta(year_month)
+        add_to_delta(delta, record)
+        self.published += 1
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        订阅增量
+
+        返回:
+            接收增量的队列，队列中收到None表示订阅已被断开
+        """
+        if len(self._subscribers) >= self.max_subscribers:
+            raise SubscriberLimitError(f"实时连接数已达上限 {self.max_subscribers}")
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        """取消订阅"""
+        self._subscribers.discard(queue)
+        if not self._subscribers:
+            self._pending.clear()
+
+    def flush(self):
+        """把累计的增量推送给所有订阅者"""
+        if not self._pending:
+            return
+        messages = [json.dumps(delta, ensure_ascii=False) for delta in self._pending.values()]
+        self._pending = {}
+        for queue in list(self._subscribers):
+            if queue.qsize() + len(messages) > self.queue_size - 1:
+                # 客户端读得太慢：断开，避免积压，重连后页面重新加载完整数据（留一个位置放断开标记）
+                self.unsubscribe(queue)
+                queue.put_nowait(None)
+                self.subscribers_dropped += 1
+                continue
+            for message in messages:
+                queue.put_nowait(message)
+        self.deltas_sent += len(messages)
+
+    async def _run(self):
+        """定期推送，没有订阅者时退出"""
+        while self._subscribers:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    async def close(self):
+        """断开所有订阅者，停止推送任务"""
+        for queue in list(self._subscribers):
+            self.unsubscribe(queue)
+            try:
+                queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def collect_metrics(self):
+        """导出指标"""
+        return [
+            Metric("dashboard_events_subscribers", "gauge", "实时增量的订阅连接数", [({}, len(self._subscribers))]),
+            Metric("dashboard_events_published_total", "counter", "发布到增量总线的日志数", [({}, self.published)]),
+            Metric("dashboard_events_deltas_total", "counter", "推送的增量条数", [({}, self.deltas_sent)]),
+            Metric("dashboard_events_dropped_subscribers_total", "counter", "因积压被断开的订阅者数",
+                   [({}, self.subscribers_dropped)]),
+        ]
+
+
+# 全局Dashboard增量总线
+dashboard_events = DashboardEventBus()
+metrics_registry.register(dashboard_events.collect_metrics)
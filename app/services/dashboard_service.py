@@ -1,268 +1,442 @@
-# """
-# Dashboard数据分析服务
-# """
-# import pandas as pd
-# from typing import Dict, List, Any
-# from app.models.database import DashboardRepository
-# from datetime import datetime
-# from decimal import Decimal
-#
-#
-# class DashboardService:
-#     """Dashboard数据分析服务类"""
-#
-#     @staticmethod
-#     def get_dashboard_analysis(year_month: str) -> Dict[str, Any]:
-#         """
-#         获取Dashboard分析数据
-#
-#         Args:
-#             year_month: 年月格式 'YYYY-MM'
-#
-#         Returns:
-#             包含各种分析结果的字典
-#         """
-#         # 获取原始数据
-#         raw_data = DashboardRepository.get_dashboard_data(year_month)
-#
-#         if not raw_data:
-#             return {
-#                 "total_requests": 0,
-#                 "success_rate_overall": 0,
-#                 "center_stats": [],
-#                 "error_analysis": [],
-#                 "center_ranking": [],
-#                 "device_analysis": [],
-#                 "avg_processing_time": 0,
-#                 "raw_data": []
-#             }
-#
-#         # 转换为DataFrame
-#         df = pd.DataFrame(raw_data)
-#
-#         # 1. OCR请求总数（按中心分组）
-#         center_requests = df.groupby('center_id').size().reset_index(name='total_requests')
-#
-#         # 2. 成功率和失败率分析
-#         # 总体成功率
-#         total_requests = len(df)
-#         success_count = len(df[df['status'] == 'success'])
-#         overall_success_rate = (success_count / total_requests * 100) if total_requests > 0 else 0
-#
-#         # 按中心的成功率
-#         center_success_stats = []
-#         for center_id in df['center_id'].unique():
-#             if pd.isna(center_id):
-#                 continue
-#
-#             center_data = df[df['center_id'] == center_id]
-#             center_total = len(center_data)
-#             center_success = len(center_data[center_data['status'] == 'success'])
-#             center_failed = len(center_data[center_data['status'] == 'failed'])
-#
-#             success_rate = (center_success / center_total * 100) if center_total > 0 else 0
-#
-#             center_success_stats.append({
-#                 'center_id': center_id,
-#                 'total_requests': center_total,
-#                 'success_count': center_success,
-#                 'failed_count': center_failed,
-#                 'success_rate': round(success_rate, 2)
-#             })
-#
-#         # 3. 失败原因分析
-#         failed_data = df[df['status'] == 'failed']
-#         error_analysis = []
-#         if len(failed_data) > 0:
-#             error_counts = failed_data['error_message'].value_counts()
-#             for error_msg, count in error_counts.items():
-#                 error_analysis.append({
-#                     'error_message': error_msg if pd.notna(error_msg) else 'Unknown Error',
-#                     'count': count,
-#                     'percentage': round(count / len(failed_data) * 100, 2)
-#                 })
-#
-#         # 4. 按使用情况排名的中心
-#         center_ranking = df[df['status'] == 'success'].groupby('center_id').size().reset_index(name='success_count')
-#         center_ranking = center_ranking.sort_values('success_count', ascending=False)
-#         center_ranking_list = []
-#         for idx, row in center_ranking.iterrows():
-#             if pd.notna(row['center_id']):
-#                 center_ranking_list.append({
-#                     'rank': len(center_ranking_list) + 1,
-#                     'center_id': row['center_id'],
-#                     'success_count': row['success_count']
-#                 })
-#
-#         # 5. 设备类型分析（新增）
-#         device_analysis = []
-#         if 'device_type' in df.columns:
-#             device_stats = df.groupby('device_type').agg({
-#                 'status': ['count', lambda x: (x == 'success').sum()],
-#                 'processing_time': 'mean' if 'processing_time' in df.columns else lambda x: None
-#             }).round(3)
-#
-#             for device_type in df['device_type'].unique():
-#                 if pd.isna(device_type):
-#                     continue
-#                 device_data = df[df['device_type'] == device_type]
-#                 device_total = len(device_data)
-#                 device_success = len(device_data[device_data['status'] == 'success'])
-#                 device_success_rate = (device_success / device_total * 100) if device_total > 0 else 0
-#
-#                 # 计算该设备类型的平均处理时间
-#                 device_processing_times = device_data['processing_time'].dropna()
-#                 avg_processing_time = 0
-#                 if len(device_processing_times) > 0:
-#                     # 转换Decimal到float进行计算
-#                     processing_times = [float(pt) if isinstance(pt, Decimal) else pt for pt in device_processing_times if pt is not None]
-#                     if processing_times:
-#                         avg_processing_time = round(sum(processing_times) / len(processing_times), 3)
-#
-#                 device_analysis.append({
-#                     'device_type': device_type,
-#                     'total_requests': device_total,
-#                     'success_count': device_success,
-#                     'success_rate': round(device_success_rate, 2),
-#                     'avg_processing_time': avg_processing_time
-#                 })
-#
-#         # 6. 计算真实的平均处理时间
-#         avg_processing_time = 0
-#         if 'processing_time' in df.columns:
-#             processing_times = df['processing_time'].dropna()
-#             if len(processing_times) > 0:
-#                 # 转换Decimal到float进行计算
-#                 times = [float(pt) if isinstance(pt, Decimal) else pt for pt in processing_times if pt is not None]
-#                 if times:
-#                     avg_processing_time = round(sum(times) / len(times), 3)
-#
-#         # 如果没有真实的处理时间数据，使用估算值
-#         if avg_processing_time == 0:
-#             avg_processing_time = 2.5  # 默认估算值
-#
-#         # 7. 按中心统计的Token使用次数趋势分析（修改）
-#         center_token_trends = []
-#         if 'timestamp' in df.columns and 'token' in df.columns and 'center_id' in df.columns:
-#             # 将timestamp转换为日期
-#             df['date'] = pd.to_datetime(df['timestamp']).dt.date
-#
-#             # 按center和日期分组，计算每个中心每日的token使用总次数
-#             center_usage_by_date = df.groupby(['center_id', 'date']).size().reset_index(name='token_usage_count')
-#
-#             # 为每个center创建时间序列数据
-#             for center_id in df['center_id'].unique():
-#                 if pd.isna(center_id):
-#                     continue
-#
-#                 center_data = center_usage_by_date[center_usage_by_date['center_id'] == center_id]
-#
-#                 # 只处理有足够数据的center（总使用次数>=10）
-#                 total_center_usage = len(df[df['center_id'] == center_id])
-#                 if total_center_usage >= 10:
-#                     time_series = []
-#                     for _, row in center_data.iterrows():
-#                         time_series.append({
-#                             'date': row['date'].strftime('%Y-%m-%d'),
-#                             'token_usage_count': row['token_usage_count']
-#                         })
-#
-#                     if time_series:
-#                         center_token_trends.append({
-#                             'center_id': str(center_id),
-#                             'data': time_series
-#                         })
-#
-#         # 8. Token综合统计分析（合并原来的两个分析）
-#         token_comprehensive_stats = []
-#         if 'token' in df.columns:
-#             for token in df['token'].unique():
-#                 if pd.isna(token):
-#                     continue
-#
-#                 token_data = df[df['token'] == token]
-#                 total_usage = len(token_data)
-#
-#                 if total_usage >= 3:  # 只分析使用次数>=3的token
-#                     # 基本统计
-#                     token_success = len(token_data[token_data['status'] == 'success'])
-#                     token_success_rate = (token_success / total_usage * 100) if total_usage > 0 else 0
-#
-#                     # 计算该token的平均处理时间
-#                     token_processing_times = token_data['processing_time'].dropna()
-#                     token_avg_time = 0
-#                     if len(token_processing_times) > 0:
-#                         times = [float(pt) if isinstance(pt, Decimal) else pt for pt in token_processing_times if pt is not None]
-#                         if times:
-#                             token_avg_time = round(sum(times) / len(times), 3)
-#
-#                     # 频率分析
-#                     df_with_date = token_data.copy()
-#                     df_with_date['date'] = pd.to_datetime(df_with_date['timestamp']).dt.date
-#                     df_with_date['hour'] = pd.to_datetime(df_with_date['timestamp']).dt.hour
-#
-#                     # 计算日使用频率
-#                     daily_usage = df_with_date.groupby('date').size()
-#                     avg_daily_usage = round(daily_usage.mean(), 2) if len(daily_usage) > 0 else 0
-#                     max_daily_usage = daily_usage.max() if len(daily_usage) > 0 else 0
-#
-#                     # 计算使用的中心数量和中心列表
-#                     centers_used_list = token_data['center_id'].dropna().unique()
-#                     centers_used_count = len(centers_used_list)
-#                     centers_used_str = ', '.join([str(c) for c in centers_used_list[:3]])  # 只显示前3个
-#                     if len(centers_used_list) > 3:
-#                         centers_used_str += f' (+{len(centers_used_list)-3}个)'
-#
-#                     # 最常使用的时间段
-#                     hourly_usage = df_with_date.groupby('hour').size()
-#                     peak_hour = hourly_usage.idxmax() if len(hourly_usage) > 0 else 0
-#
-#                     token_comprehensive_stats.append({
-#                         'token': str(token)[:20] + '...' if len(str(token)) > 20 else str(token),
-#                         'full_token': str(token),
-#                         'usage_count': total_usage,
-#                         'success_rate': round(token_success_rate, 2),
-#                         'avg_processing_time': token_avg_time,
-#                         'avg_daily_usage': avg_daily_usage,
-#                         'max_daily_usage': int(max_daily_usage),
-#                         'centers_used_count': centers_used_count,
-#                         'centers_used_list': centers_used_str,
-#                         'peak_hour': f"{peak_hour}:00-{peak_hour+1}:00"
-#                     })
-#
-#             # 按总使用次数排序
-#             token_comprehensive_stats.sort(key=lambda x: x['usage_count'], reverse=True)
-#
-#         return {
-#             "year_month": year_month,
-#             "total_requests": total_requests,
-#             "success_rate_overall": round(overall_success_rate, 2),
-#             "center_stats": center_success_stats,
-#             "error_analysis": error_analysis,
-#             "center_ranking": center_ranking_list,
-#             "device_analysis": device_analysis,
-#             "avg_processing_time": avg_processing_time,
-#             "center_token_trends": center_token_trends,
-#             "token_comprehensive_stats": token_comprehensive_stats,
-#             "raw_data": raw_data[:1000]  # 限制返回数据量，只返回前1000条
-#         }
-#
-#     @staticmethod
-#     def get_available_months() -> List[str]:
-#         """
-#         获取可用的年月列表
-#
-#         Returns:
-#             年月列表
-#         """
-#         return DashboardRepository.get_available_months()
-#
-#     @staticmethod
-#     def get_current_month() -> str:
-#         """
-#         获取当前月份
-#
-#         Returns:
-#             当前月份，格式为 'YYYY-MM'
-#         """
-#         return datetime.now().strftime('%Y-%m')
\ No newline at end of file
+"""
+Dashboard数据分析服务
+
+所有统计在同一个表格上用分组聚合一次算出，不再按中心/设备/token逐个过滤整张表。
+输入每行是一个"时间桶 × 维度组合"及其请求数：优先读按小时汇总表（api_log_rollup_hourly），
+汇总表未按中心重建完成、该月尚未汇总或已归档时读原始日志（每条日志一行，请求数为repeat_count），已归档的旧日志从归档文件读取。
+汇总表与原始日志按中心的统计可用 python -m app.services.dashboard_service --verify-rollup YYYY-MM 核对。
+"""
+import argparse
+import base64
+import json
+import sys
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.models.database import DashboardRepository, DASHBOARD_LOG_SORT_KEYS
+from app.services.log_archive_service import log_archive
+
+# 维度列，转换为category后分组
+DIMENSION_COLUMNS = ("center_id", "token", "device_type", "status", "error_code", "error_message")
+# 分组时累加的列
+SUM_COLUMNS = ["request_count", "success_count", "failed_count", "processing_time_count", "processing_time_sum"]
+# /dashboard/logs 每页最多条数
+MAX_LOG_PAGE_SIZE = 500
+# 没有处理时间数据时显示的估算值
+DEFAULT_AVG_PROCESSING_TIME = 2.5
+# 趋势图只显示请求数不少于该值的中心
+TREND_MIN_CENTER_REQUESTS = 10
+# Token综合统计只分析使用次数不少于该值的token
+TOKEN_STATS_MIN_USAGE = 3
+
+
+def frame_from_rollup_rows(rows: List[Dict[str, Any]]) -> pd.DataFrame:
+    """按小时汇总表的行转换为分析用的表格"""
+    df = pd.DataFrame(rows, columns=["bucket", *DIMENSION_COLUMNS, "request_count",
+                                     "processing_time_count", "processing_time_sum"])
+    df["bucket"] = pd.to_datetime(df["bucket"])
+    return df
+
+
+def frame_from_raw_rows(rows: List[Dict[str, Any]]) -> pd.DataFrame:
+    """原始日志转换为与汇总表相同结构的表格（每条日志一行，合并的重复失败按repeat_count计）"""
+    df = pd.DataFrame(rows, columns=["timestamp", *DIMENSION_COLUMNS, "processing_time", "repeat_count"])
+    weight = pd.to_numeric(df["repeat_count"], errors="coerce").fillna(1).astype("int64")
+    processing_time = pd.to_numeric(df["processing_time"], errors="coerce")
+    has_time = processing_time.notna()
+    return pd.DataFrame({
+        "bucket": pd.to_datetime(df["timestamp"]).dt.floor("h"),
+        **{column: df[column] for column in DIMENSION_COLUMNS},
+        "request_count": weight,
+        "processing_time_count": weight.where(has_time, 0),
+        "processing_time_sum": (processing_time * weight).fillna(0.0),
+    })
+
+
+def _round(series: pd.Series, digits: int) -> pd.Series:
+    return series.astype("float64").round(digits)
+
+
+def _rate(numerator: pd.Series, denominator: pd.Series) -> pd.Series:
+    """百分比，分母为0时为0"""
+    return _round((numerator / denominator.where(denominator > 0) * 100).fillna(0), 2)
+
+
+def _avg_time(frame: pd.DataFrame) -> pd.Series:
+    count = frame["processing_time_count"]
+    return _round((frame["processing_time_sum"] / count.where(count > 0)).fillna(0), 3)
+
+
+def analyze_requests(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    计算Dashboard的全部统计
+
+    参数:
+        df: frame_from_rollup_rows / frame_from_raw_rows 返回的表格
+    返回:
+        total_requests、success_count、success_rate_overall、processing_time_count（供实时增量累加）、
+        center_stats、error_analysis、center_ranking、
+        device_analysis、avg_processing_time、center_token_trends、token_comprehensive_stats
+    """
+    df = df[df["request_count"] > 0]
+    if df.empty:
+        return {
+            "total_requests": 0,
+            "success_count": 0,
+            "success_rate_overall": 0,
+            "processing_time_count": 0,
+            "center_stats": [],
+            "error_analysis": [],
+            "center_ranking": [],
+            "device_analysis": [],
+            "avg_processing_time": 0,
+            "center_token_trends": [],
+            "token_comprehensive_stats": [],
+        }
+
+    weight = df["request_count"].astype("int64")
+    status = df["status"]
+    df = pd.DataFrame({
+        **{column: df[column].astype("category") for column in DIMENSION_COLUMNS},
+        "date": df["bucket"].dt.normalize(),
+        "hour": df["bucket"].dt.hour.astype("int8"),
+        "request_count": weight,
+        "success_count": weight.where(status == "success", 0),
+        "failed_count": weight.where(status == "failed", 0),
+        "processing_time_count": df["processing_time_count"].astype("int64"),
+        "processing_time_sum": df["processing_time_sum"].astype("float64"),
+    })
+
+    def grouped(keys) -> pd.DataFrame:
+        # 维度为空的行不参与该维度的分组（与原来跳过NaN一致）
+        return df.groupby(keys, observed=True, sort=False)[SUM_COLUMNS].sum().reset_index()
+
+    # 1. 总体
+    totals = df[SUM_COLUMNS].sum()
+    total_requests = int(totals["request_count"])
+    overall_success_rate = round(float(totals["success_count"]) / total_requests * 100, 2)
+    avg_processing_time = 0
+    if totals["processing_time_count"] > 0:
+        avg_processing_time = round(float(totals["processing_time_sum"] / totals["processing_time_count"]), 3)
+    if avg_processing_time == 0:
+        avg_processing_time = DEFAULT_AVG_PROCESSING_TIME
+
+    # 2. 按中心的成功率
+    by_center = grouped("center_id").sort_values("request_count", ascending=False, kind="stable")
+    center_stats = pd.DataFrame({
+        "center_id": by_center["center_id"].astype(str),
+        "total_requests": by_center["request_count"],
+        "success_count": by_center["success_count"],
+        "failed_count": by_center["failed_count"],
+        "success_rate": _rate(by_center["success_count"], by_center["request_count"]),
+    }).to_dict("records")
+
+    # 3. 失败原因（按错误代码，没有代码时按错误信息）
+    failed = df[df["failed_count"] > 0]
+    error_analysis = []
+    if not failed.empty:
+        error_code = failed["error_code"].astype(object)
+        error_message = failed["error_message"].astype(object)
+        errors = pd.DataFrame({
+            "key": error_code.fillna(error_message).fillna("Unknown Error"),
+            "error_code": error_code,
+            "error_message": error_message.fillna("Unknown Error"),
+            "count": failed["failed_count"],
+        })
+        # 每个错误代码显示次数最多的一条错误信息
+        messages = (errors.groupby(["key", "error_message"], sort=False)["count"].sum().reset_index()
+                    .sort_values("count", ascending=False, kind="stable")
+                    .drop_duplicates("key").set_index("key")["error_message"])
+        by_error = errors.groupby("key", sort=False).agg(error_code=("error_code", "first"),
+                                                         count=("count", "sum"))
+        by_error = by_error.sort_values("count", ascending=False, kind="stable")
+        failed_total = by_error["count"].sum()
+        error_analysis = pd.DataFrame({
+            "error_code": by_error["error_code"].astype(object).where(by_error["error_code"].notna(), None),
+            "error_message": messages.reindex(by_error.index),
+            "count": by_error["count"],
+            "percentage": _round(by_error["count"] / failed_total * 100, 2),
+        }).to_dict("records")
+
+    # 4. 按成功次数排名的中心
+    ranking = by_center[by_center["success_count"] > 0].sort_values("success_count", ascending=False, kind="stable")
+    center_ranking = pd.DataFrame({
+        "rank": np.arange(1, len(ranking) + 1),
+        "center_id": ranking["center_id"].astype(str),
+        "success_count": ranking["success_count"],
+    }).to_dict("records")
+
+    # 5. 设备类型
+    by_device = grouped("device_type")
+    device_analysis = pd.DataFrame({
+        "device_type": by_device["device_type"].astype(str),
+        "total_requests": by_device["request_count"],
+        "success_count": by_device["success_count"],
+        "success_rate": _rate(by_device["success_count"], by_device["request_count"]),
+        "avg_processing_time": _avg_time(by_device),
+        "processing_time_count": by_device["processing_time_count"],
+    }).to_dict("records")
+
+    # 6. 各中心每日请求数趋势
+    center_daily = grouped(["center_id", "date"])
+    center_totals = center_daily.groupby("center_id", observed=True)["request_count"].transform("sum")
+    center_daily = center_daily[center_totals >= TREND_MIN_CENTER_REQUESTS].sort_values(["center_id", "date"])
+    center_daily = center_daily.assign(day=center_daily["date"].dt.strftime("%Y-%m-%d"))
+    center_token_trends = [
+        {
+            "center_id": str(center_id),
+            "data": [
+                {"date": day, "token_usage_count": int(count)}
+                for day, count in zip(group["day"], group["request_count"])
+            ],
+        }
+        for center_id, group in center_daily.groupby("center_id", observed=True, sort=False)
+    ]
+
+    # 7. Token综合统计
+    by_token = grouped("token")
+    by_token = by_token[by_token["request_count"] >= TOKEN_STATS_MIN_USAGE].set_index("token")
+    token_comprehensive_stats = []
+    if not by_token.empty:
+        tokens = by_token.index
+        daily = grouped(["token", "date"]).groupby("token", observed=True)["request_count"].agg(["mean", "max"])
+        hourly = grouped(["token", "hour"]).sort_values(["request_count", "hour"], ascending=[False, True])
+        peak_hour = hourly.drop_duplicates("token").set_index("token")["hour"]
+        centers = grouped(["token", "center_id"]).sort_values("request_count", ascending=False, kind="stable")
+        centers = centers.assign(center_id=centers["center_id"].astype(str))
+        centers_count = centers.groupby("token", observed=True).size().reindex(tokens, fill_value=0)
+        # 每个token使用最多的前3个中心，按名次展开成3列后拼接
+        top = centers.groupby("token", observed=True).head(3)
+        top = top.assign(rank=top.groupby("token", observed=True).cumcount())
+        # 固定3列：所有token都没有中心时 unstack 得到空表
+        top = top.set_index(["token", "rank"])["center_id"].unstack()
+        top = top.reindex(index=tokens, columns=range(3)).astype(object)
+        centers_list = top[0].fillna("")
+        for rank in top.columns[1:]:
+            centers_list = centers_list + (", " + top[rank]).fillna("")
+        more = centers_count - 3
+        centers_list = centers_list + np.where(more > 0, " (+" + more.astype(str) + "个)", "")
+
+        token_str = pd.Series(tokens.astype(str), index=tokens)
+        peak = peak_hour.reindex(tokens, fill_value=0).astype(int)
+        stats = pd.DataFrame({
+            "token": np.where(token_str.str.len() > 20, token_str.str[:20] + "...", token_str),
+            "full_token": token_str,
+            "usage_count": by_token["request_count"],
+            "success_rate": _rate(by_token["success_count"], by_token["request_count"]),
+            "avg_processing_time": _avg_time(by_token),
+            "avg_daily_usage": _round(daily["mean"].reindex(tokens, fill_value=0), 2),
+            "max_daily_usage": daily["max"].reindex(tokens, fill_value=0).astype("int64"),
+            "centers_used_count": centers_count,
+            "centers_used_list": centers_list,
+            "peak_hour": peak.astype(str) + ":00-" + (peak + 1).astype(str) + ":00",
+        })
+        token_comprehensive_stats = stats.sort_values("usage_count", ascending=False, kind="stable").to_dict("records")
+
+    return {
+        "total_requests": total_requests,
+        "success_count": int(totals["success_count"]),
+        "success_rate_overall": overall_success_rate,
+        "processing_time_count": int(totals["processing_time_count"]),
+        "center_stats": center_stats,
+        "error_analysis": error_analysis,
+        "center_ranking": center_ranking,
+        "device_analysis": device_analysis,
+        "avg_processing_time": avg_processing_time,
+        "center_token_trends": center_token_trends,
+        "token_comprehensive_stats": token_comprehensive_stats,
+    }
+
+
+def encode_log_cursor(sort: str, order: str, value: Any, row_id: int) -> str:
+    """把上一页最后一行的排序键和id编码为不透明的游标"""
+    if isinstance(value, datetime):
+        value = value.strftime('%Y-%m-%d %H:%M:%S.%f')
+    elif isinstance(value, Decimal):
+        value = str(value)
+    payload = json.dumps([sort, order, value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_log_cursor(cursor: str, sort: str, order: str):
+    """解析游标，返回 (排序键, id)"""
+    try:
+        cursor_sort, cursor_order, value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("游标无效")
+    if (cursor_sort, cursor_order) != (sort, order) or not isinstance(row_id, int):
+        raise ValueError("游标与排序参数不一致")
+    return value, row_id
+
+
+def _log_sort_key(row: Dict[str, Any]):
+    """合并数据库和归档两路分页时的排序键（数据库的数值为Decimal，归档为float）"""
+    value = row['sort_value']
+    return (value if isinstance(value, datetime) else float(value), row['id'])
+
+
+class DashboardService:
+    """Dashboard数据分析服务类"""
+
+    @staticmethod
+    def _raw_frame(year_month: str) -> pd.DataFrame:
+        """某月份的原始日志（含已归档的部分）转换为分析用的表格"""
+        rows = DashboardRepository.get_dashboard_data(year_month)
+        if log_archive.has_month(year_month):
+            # 该月的日志已（部分）归档：数据库中剩余的行加上归档文件中的行
+            rows = pd.concat([pd.DataFrame(rows), log_archive.dashboard_frame(year_month)], ignore_index=True)
+        return frame_from_raw_rows(rows)
+
+    @staticmethod
+    def compare_center_breakdown(year_month: str) -> List[Dict[str, Any]]:
+        """
+        对比汇总表与原始日志按中心的统计（请求数、成功数、失败数）
+
+        Args:
+            year_month: 年月格式 'YYYY-MM'
+
+        Returns:
+            不一致的中心列表 [{"center_id", "rollup", "raw"}]，一致时为空列表
+        """
+        def breakdown(df: pd.DataFrame) -> Dict[str, tuple]:
+            return {
+                row["center_id"]: (row["total_requests"], row["success_count"], row["failed_count"])
+                for row in analyze_requests(df)["center_stats"]
+            }
+
+        rollup = breakdown(frame_from_rollup_rows(
+            DashboardRepository.get_rollup_data(year_month, granularity="hourly")
+        ))
+        raw = breakdown(DashboardService._raw_frame(year_month))
+        return [
+            {"center_id": center_id, "rollup": rollup.get(center_id), "raw": raw.get(center_id)}
+            for center_id in sorted(rollup.keys() | raw.keys())
+            if rollup.get(center_id) != raw.get(center_id)
+        ]
+
+    @staticmethod
+    def get_dashboard_analysis(year_month: str) -> Dict[str, Any]:
+        """
+        获取Dashboard分析数据
+
+        Args:
+            year_month: 年月格式 'YYYY-MM'
+
+        Returns:
+            包含各种分析结果的字典
+        """
+        # 汇总表按中心重建完成之前不使用，避免中心统计与原始日志不一致；
+        # 已归档的月份也不使用：重建只能从数据库中剩余的日志累加，已删除的日志不在汇总表中
+        rollup_rows = []
+        if not log_archive.has_month(year_month) and DashboardRepository.is_rollup_ready():
+            rollup_rows = DashboardRepository.get_rollup_data(year_month, granularity="hourly")
+        if rollup_rows:
+            df = frame_from_rollup_rows(rollup_rows)
+        else:
+            # 该月尚未汇总（汇总任务未启用或历史日志还在补汇总）
+            df = DashboardService._raw_frame(year_month)
+
+        # 原始日志不再随分析结果返回，由 /dashboard/logs 分页读取
+        return {
+            "year_month": year_month,
+            **analyze_requests(df),
+        }
+
+    @staticmethod
+    def get_logs(year_month: str, filters: Dict[str, str], sort: str = "timestamp", order: str = "desc",
+                 cursor: Optional[str] = None, limit: int = 50, with_total: bool = False) -> Dict[str, Any]:
+        """
+        分页获取原始日志
+
+        Args:
+            year_month: 年月格式 'YYYY-MM'
+            filters: 筛选条件（center_id、token、status、device_type、error_code）
+            sort: 排序列（timestamp、processing_time、file_size）
+            order: 'desc' 或 'asc'
+            cursor: 上一页返回的 next_cursor，第一页不传
+            limit: 每页条数
+            with_total: 是否同时返回符合条件的总条数
+
+        Returns:
+            {"rows": 日志列表, "next_cursor": 下一页游标（没有下一页时为None）, "total": 总条数或None}
+
+        Raises:
+            ValueError: 排序参数无效，或游标与本次的排序参数不一致
+        """
+        if sort not in DASHBOARD_LOG_SORT_KEYS or order not in ("asc", "desc"):
+            raise ValueError("排序参数无效")
+        limit = max(1, min(limit, MAX_LOG_PAGE_SIZE))
+        after = decode_log_cursor(cursor, sort, order) if cursor else None
+
+        descending = order == "desc"
+        rows = DashboardRepository.get_logs_page(
+            year_month, filters, sort=sort, descending=descending, after=after, limit=limit + 1
+        )
+        archived = log_archive.has_month(year_month)
+        if archived:
+            # 已归档的月份：数据库和归档文件各取一页，按同样的 (排序键, id) 合并
+            rows += log_archive.get_logs_page(
+                year_month, filters, sort=sort, descending=descending, after=after, limit=limit + 1
+            )
+            rows.sort(key=_log_sort_key, reverse=descending)
+            rows = rows[:limit + 1]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_log_cursor(sort, order, rows[-1]['sort_value'], rows[-1]['id'])
+
+        formatted_rows = []
+        for row in rows:
+            formatted_row = dict(row)
+            formatted_row.pop('sort_value', None)
+            if formatted_row.get('timestamp'):
+                formatted_row['timestamp'] = formatted_row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+            if formatted_row.get('processing_time') is not None:
+                formatted_row['processing_time'] = float(formatted_row['processing_time'])
+            formatted_rows.append(formatted_row)
+
+        return {
+            "rows": formatted_rows,
+            "next_cursor": next_cursor,
+            "total": (DashboardRepository.count_logs(year_month, filters)
+                      + (log_archive.count_logs(year_month, filters) if archived else 0)) if with_total else None,
+        }
+
+    @staticmethod
+    def get_available_months() -> List[str]:
+        """
+        获取可用的年月列表
+
+        Returns:
+            年月列表
+        """
+        months = set(DashboardRepository.get_available_months()) | set(log_archive.months())
+        return sorted(months, reverse=True)
+
+    @staticmethod
+    def get_current_month() -> str:
+        """
+        获取当前月份
+
+        Returns:
+            当前月份，格式为 'YYYY-MM'
+        """
+        return datetime.now().strftime('%Y-%m')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检查汇总表与原始日志按中心的统计是否一致")
+    parser.add_argument("--verify-rollup", metavar="YYYY-MM", required=True, help="要检查的月份")
+    args = parser.parse_args()
+
+    if not DashboardRepository.is_rollup_ready():
+        print("汇总表尚未重建完成，Dashboard当前读取原始日志")
+    differences = DashboardService.compare_center_breakdown(args.verify_rollup)
+    for row in differences:
+        print(f"{row['center_id']}: 汇总表 {row['rollup']}  原始日志 {row['raw']}  (请求数, 成功数, 失败数)")
+    print(f"{args.verify_rollup}: {len(differences)} 个中心不一致" if differences else f"{args.verify_rollup}: 按中心的统计一致")
+    sys.exit(1 if differences else 0)
@@ -1,9 +1,30 @@
-from PIL import Image,  ExifTags, ImageEnhance
+from PIL import Image,  ExifTags, ImageEnhance, ImageOps
 # import numpy as np
 import io
+import os
 import base64
+from typing import Optional, Tuple
 # import cv2
 
+# HEIC/HEIF需要pillow-heif插件才能解码（可选依赖）
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    register_heif_opener = None
+
+# 模型原生支持、可直接透传的图像格式
+NATIVE_IMAGE_FORMATS = {
+    mime.strip() for mime in os.getenv("NATIVE_IMAGE_FORMATS", "image/jpeg,image/png,image/webp").split(",")
+    if mime.strip()
+}
+TRANSCODE_JPEG_QUALITY = int(os.getenv("TRANSCODE_JPEG_QUALITY", "90"))  # 转码时JPEG质量
+TRANSCODE_WEBP_QUALITY = int(os.getenv("TRANSCODE_WEBP_QUALITY", "85"))  # 转码时WebP质量
+
+# HEIF容器ftyp中的品牌标识
+HEIC_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis"}
+HEIF_BRANDS = {b"mif1", b"msf1"}
+
 
 def process_image(image_data, MIN_PIXELS, MAX_PIXELS):
     """
@@ -63,6 +84,119 @@ def process_image(image_data, MIN_PIXELS, MAX_PIXELS):
     return output_buffer.getvalue()
 
 
+def detect_image_mime(image_data: bytes) -> Optional[str]:
+    """
+    根据文件头（magic bytes）识别图像的真实MIME类型，不解码图像
+
+    参数:
+        image_data: 图像二进制数据
+    返回:
+        MIME类型字符串，无法识别时返回None
+    """
+    if image_data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if image_data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+        return "image/webp"
+    if image_data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if image_data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    if image_data.startswith(b"BM"):
+        return "image/bmp"
+    if image_data[4:8] == b"ftyp":
+        brand = image_data[8:12]
+        if brand in HEIC_BRANDS:
+            return "image/heic"
+        if brand in HEIF_BRANDS:
+            return "image/heif"
+        if brand in (b"avif", b"avis"):
+            return "image/avif"
+    return None
+
+
+def transcode_image(image_data: bytes, allowed_formats=None) -> Tuple[bytes, str]:
+    """
+    将模型不支持的图像转码，在候选编码中选择体积最小的一个
+
+    参数:
+        image_data: 图像二进制数据
+        allowed_formats: 允许输出的MIME类型集合，默认为NATIVE_IMAGE_FORMATS
+    返回:
+        (转码后的图像数据, MIME类型)
+    """
+    if allowed_formats is None:
+        allowed_formats = NATIVE_IMAGE_FORMATS
+
+    img = Image.open(io.BytesIO(image_data))
+    # 手机照片（如HEIC）通常依赖EXIF方向，转码后EXIF会丢失，先按EXIF旋转
+    img = ImageOps.exif_transpose(img)
+
+    # 若为带透明通道的图像，先合成到白色背景上
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    candidates = []
+    if "image/jpeg" in allowed_formats:
+        candidates.append(("image/jpeg", {"format": "JPEG", "quality": TRANSCODE_JPEG_QUALITY, "optimize": True}))
+    if "image/webp" in allowed_formats:
+        candidates.append(("image/webp", {"format": "WEBP", "quality": TRANSCODE_WEBP_QUALITY, "method": 4}))
+    # 颜色较少的图像（截图、LCD界面）用PNG无损编码往往更小，照片则跳过PNG以节省CPU
+    if "image/png" in allowed_formats and (not candidates or img.getcolors(maxcolors=256) is not None):
+        candidates.append(("image/png", {"format": "PNG", "optimize": True}))
+
+    if not candidates:
+        raise ValueError("没有可用的转码目标格式")
+
+    best_data, best_mime = None, None
+    for mime_type, save_kwargs in candidates:
+        output_buffer = io.BytesIO()
+        img.save(output_buffer, **save_kwargs)
+        encoded = output_buffer.getvalue()
+        if best_data is None or len(encoded) < len(best_data):
+            best_data, best_mime = encoded, mime_type
+
+    print(f"图像转码完成: {len(image_data)} bytes -> {best_mime} {len(best_data)} bytes")
+    return best_data, best_mime
+
+
+def negotiate_image_format(image_data: bytes, allowed_formats=None) -> Tuple[bytes, str]:
+    """
+    图像格式协商：模型原生支持的格式原样透传并返回正确的MIME类型，
+    仅对不支持的格式（如手机拍摄的HEIC）进行转码
+
+    参数:
+        image_data: 图像二进制数据
+        allowed_formats: 原生支持的MIME类型集合，默认为NATIVE_IMAGE_FORMATS
+    返回:
+        (用于分析的图像数据, MIME类型)
+    异常:
+        ValueError: 图像格式无法识别或无法解码
+    """
+    if allowed_formats is None:
+        allowed_formats = NATIVE_IMAGE_FORMATS
+
+    mime_type = detect_image_mime(image_data)
+    if mime_type in allowed_formats:
+        return image_data, mime_type
+
+    if mime_type in ("image/heic", "image/heif") and register_heif_opener is None:
+        raise ValueError("不支持的图像格式: HEIC/HEIF（服务器未安装pillow-heif）")
+
+    try:
+        return transcode_image(image_data, allowed_formats)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"不支持的图像格式: {mime_type or '未知'}") from e
+
+
 def correct_image_orientation(image_content: bytes) -> Image.Image:
     """修正图片方向"""
     try:
@@ -0,0 +1,554 @@
+"""
+api_logs 冷数据归档
+
+超过保留期（LOG_ARCHIVE_RETENTION_MONTHS 个月）的日志按月写入本地压缩文件，再分批从MySQL删除。
+每个月份一个目录，每次归档写一个分片文件，文件名带分片内的最小和最大日志ID：
+    {LOG_ARCHIVE_DIR}/2025-03/api_logs-000000012345-000000098765.parquet   （安装了pyarrow时，zstd压缩）
+    {LOG_ARCHIVE_DIR}/2025-03/api_logs-000000012345-000000098765.csv.gz    （未安装pyarrow时）
+分片先写临时文件再改名，之后才删除数据库中ID不大于分片最大ID的行；中途中断时下次从已归档的最大ID
+之后继续，不会重复归档，也不会删除未归档的行。归档后补写进来的旧日志（本地暂存重放）在下次运行时写入新的分片。
+启用汇总表时只归档汇总进度以内的日志，保证删除的日志都已计入汇总表。
+
+Dashboard查询已归档的月份时，用pandas在进程内读取该月的分片（最近读取的月份缓存在内存中），
+与数据库中剩余的行合并。汇总表重建（迁移5）时只能从数据库中剩余的日志累加，
+因此已归档月份的统计也从归档文件与剩余日志计算，不读汇总表。
+
+用法:
+    python -m app.services.log_archive_service              归档超过保留期的日志
+    python -m app.services.log_archive_service --dry-run    只列出会归档的月份
+    python -m app.services.log_archive_service --list       列出已归档的月份和分片
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from app.core.metrics import Metric, metrics_registry
+from app.db.migrations import ensure_schema
+from app.models.async_database import AsyncAPILogRollupRepository
+from app.models.database import (
+    API_LOG_ARCHIVE_COLUMNS, API_LOG_EXPORT_COLUMNS, API_LOG_ROLLUP_EXCLUDED_MESSAGE, DASHBOARD_API_ENDPOINTS,
+    DASHBOARD_LOG_FILTERS,
+    APILogArchiveRepository, month_range
+)
+from app.services.log_rollup_service import ENABLE_API_LOG_ROLLUP
+
+# Parquet需要pyarrow（可选依赖），未安装时归档为gzip压缩的CSV
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# 是否启用归档任务（会删除数据库中的旧日志，默认关闭）
+ENABLE_LOG_ARCHIVE = os.getenv("ENABLE_LOG_ARCHIVE", "false").lower() == "true"
+# 数据库中保留的月份数（不含当前月份），更早的日志归档
+LOG_ARCHIVE_RETENTION_MONTHS = int(os.getenv("LOG_ARCHIVE_RETENTION_MONTHS", "12"))
+# 归档文件目录
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "data/log_archive")
+# 归档格式：auto（安装了pyarrow时用parquet，否则csv）、parquet、csv
+LOG_ARCHIVE_FORMAT = os.getenv("LOG_ARCHIVE_FORMAT", "auto").lower()
+# 归档任务运行间隔（秒）
+LOG_ARCHIVE_INTERVAL = float(os.getenv("LOG_ARCHIVE_INTERVAL", "86400"))
+# 读取和写入归档时每批的行数
+LOG_ARCHIVE_BATCH_SIZE = int(os.getenv("LOG_ARCHIVE_BATCH_SIZE", "5000"))
+# 每个删除事务最多删除的行数
+LOG_ARCHIVE_DELETE_BATCH = int(os.getenv("LOG_ARCHIVE_DELETE_BATCH", "5000"))
+# 两个删除事务之间的间隔（秒），给复制和正常写入留出余量
+LOG_ARCHIVE_DELETE_PAUSE = float(os.getenv("LOG_ARCHIVE_DELETE_PAUSE", "0.05"))
+# 内存中缓存的已归档月份数（Dashboard翻页时不必每页重新读文件）
+LOG_ARCHIVE_CACHE_MONTHS = int(os.getenv("LOG_ARCHIVE_CACHE_MONTHS", "2"))
+
+PART_PATTERN = re.compile(r"^api_logs-(\d+)-(\d+)\.(parquet|csv\.gz)$")
+MONTH_PATTERN = re.compile(r"^\d{4}-\d{2}$")
+
+# 归档文件中各列的类型
+_INT_COLUMNS = ("id", "file_size", "ai_usage", "token_usetimes", "repeat_count", "original_times")
+_FLOAT_COLUMNS = ("processing_time",)
+_TIME_COLUMNS = ("timestamp", "last_seen")
+
+
+def _arrow_schema():
+    def column_type(column):
+        if column in _INT_COLUMNS:
+            return pa.int64()
+        if column in _FLOAT_COLUMNS:
+            return pa.float64()
+        if column in _TIME_COLUMNS:
+            return pa.timestamp("us")
+        return pa.string()
+    return pa.schema([(column, column_type(column)) for column in API_LOG_ARCHIVE_COLUMNS])
+
+
+def _normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """统一读取后的列类型（parquet与csv读出的类型不同）"""
+    df = df.reindex(columns=list(API_LOG_ARCHIVE_COLUMNS))
+    for column in _INT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype("Int64")
+    for column in _FLOAT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype("float64")
+    for column in _TIME_COLUMNS:
+        df[column] = pd.to_datetime(df[column], errors="coerce", format="ISO8601")
+    for column in df.columns.difference([*_INT_COLUMNS, *_FLOAT_COLUMNS, *_TIME_COLUMNS]):
+        df[column] = df[column].astype(object).where(df[column].notna(), None)
+    return df
+
+
+def frame_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """表格转换为与数据库查询结果相同类型的记录（datetime、int、float、None）"""
+    records = df.astype(object).where(df.notna(), None).to_dict("records")
+    for record in records:
+        for key, value in record.items():
+            if isinstance(value, pd.Timestamp):
+                record[key] = value.to_pydatetime()
+    return records
+
+
+class LogArchive:
+    """已归档日志的读写"""
+
+    def __init__(self, directory: str = LOG_ARCHIVE_DIR, fmt: str = LOG_ARCHIVE_FORMAT,
+                 batch_size: int = LOG_ARCHIVE_BATCH_SIZE, cache_months: int = LOG_ARCHIVE_CACHE_MONTHS):
+        self.directory = directory
+        if fmt == "auto":
+            fmt = "parquet" if pq is not None else "csv"
+        if fmt == "parquet" and pq is None:
+            raise RuntimeError("归档为parquet需要安装pyarrow")
+        self.format = fmt
+        self.batch_size = batch_size
+        self.cache_months = cache_months
+        self._cache: "OrderedDict[str, Tuple[tuple, pd.DataFrame]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 指标
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _month_dir(self, year_month: str) -> str:
+        return os.path.join(self.directory, year_month)
+
+    def parts(self, year_month: str) -> List[Tuple[str, int, int]]:
+        """
+        某月份的分片
+
+        返回:
+            [(文件路径, 最小ID, 最大ID)]，按ID排序
+        """
+        month_dir = self._month_dir(year_month)
+        if not os.path.isdir(month_dir):
+            return []
+        parts = []
+        for name in os.listdir(month_dir):
+            match = PART_PATTERN.match(name)
+            if match:
+                parts.append((os.path.join(month_dir, name), int(match.group(1)), int(match.group(2))))
+        return sorted(parts, key=lambda part: part[1])
+
+    def months(self) -> List[str]:
+        """已归档的月份（从新到旧）"""
+        if not os.path.isdir(self.directory):
+            return []
+        months = [name for name in os.listdir(self.directory) if MONTH_PATTERN.match(name) and self.parts(name)]
+        return sorted(months, reverse=True)
+
+    def has_month(self, year_month: str) -> bool:
+        return bool(self.parts(year_month))
+
+    def archived_max_id(self, year_month: str) -> int:
+        """某月份已归档的最大日志ID，没有归档时为0"""
+        return max((part[2] for part in self.parts(year_month)), default=0)
+
+    def write_part(self, year_month: str, batches: Iterator[List[Dict[str, Any]]]) -> Optional[Tuple[str, int, int, int]]:
+        """
+        把一批批日志写成该月份的一个新分片
+
+        参数:
+            year_month: 年月格式 'YYYY-MM'
+            batches: 按ID递增的日志批次
+        返回:
+            (文件路径, 行数, 最小ID, 最大ID)，没有日志时为None
+        """
+        month_dir = self._month_dir(year_month)
+        os.makedirs(month_dir, exist_ok=True)
+        suffix = "parquet" if self.format == "parquet" else "csv.gz"
+        temp_path = os.path.join(month_dir, f".api_logs-{os.getpid()}-{time.time_ns()}.{suffix}.tmp")
+        rows = 0
+        min_id = max_id = None
+        try:
+            if self.format == "parquet":
+                schema = _arrow_schema()
+                writer = None
+                try:
+                    for batch in batches:
+                        for row in batch:
+                            if isinstance(row.get("processing_time"), Decimal):
+                                row["processing_time"] = float(row["processing_time"])
+                        if writer is None:
+                            writer = pq.ParquetWriter(temp_path, schema, compression="zstd")
+                        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                        rows += len(batch)
+                        min_id = batch[0]["id"] if min_id is None else min_id
+                        max_id = batch[-1]["id"]
+                finally:
+                    if writer is not None:
+                        writer.close()
+            else:
+                with gzip.open(temp_path, "wt", encoding="utf-8", newline="") as output:
+                    writer = csv.writer(output)
+                    writer.writerow(API_LOG_ARCHIVE_COLUMNS)
+                    for batch in batches:
+                        writer.writerows(
+                            [["" if row.get(column) is None else row[column] for column in API_LOG_ARCHIVE_COLUMNS]
+                             for row in batch]
+                        )
+                        rows += len(batch)
+                        min_id = batch[0]["id"] if min_id is None else min_id
+                        max_id = batch[-1]["id"]
+            if not rows:
+                return None
+            path = os.path.join(month_dir, f"api_logs-{min_id:012d}-{max_id:012d}.{suffix}")
+            os.replace(temp_path, path)
+            return path, rows, min_id, max_id
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _iter_part_frames(self, path: str) -> Iterator[pd.DataFrame]:
+        """分块读取一个分片"""
+        if path.endswith(".parquet"):
+            if pq is None:
+                raise RuntimeError(f"读取 {path} 需要安装pyarrow")
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=self.batch_size):
+                yield _normalize_frame(batch.to_pandas())
+        else:
+            for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[""],
+                                     chunksize=self.batch_size):
+                yield _normalize_frame(chunk)
+
+    def frame(self, year_month: str) -> pd.DataFrame:
+        """
+        读取某月份的全部归档日志（最近读取的月份缓存在内存中，分片变化后重新读取）
+
+        参数:
+            year_month: 年月格式 'YYYY-MM'
+        返回:
+            列为 API_LOG_ARCHIVE_COLUMNS 的表格
+        """
+        parts = self.parts(year_month)
+        signature = tuple((path, os.path.getmtime(path)) for path, _, _ in parts)
+        with self._lock:
+            cached = self._cache.get(year_month)
+            if cached is not None and cached[0] == signature:
+                self._cache.move_to_end(year_month)
+                self.cache_hits += 1
+                return cached[1]
+        self.cache_misses += 1
+        frames = [frame for path, _, _ in parts for frame in self._iter_part_frames(path)]
+        df = pd.concat(frames, ignore_index=True) if frames else _normalize_frame(pd.DataFrame())
+        with self._lock:
+            self._cache[year_month] = (signature, df)
+            self._cache.move_to_end(year_month)
+            while len(self._cache) > self.cache_months:
+                self._cache.popitem(last=False)
+        return df
+
+    def dashboard_frame(self, year_month: str) -> pd.DataFrame:
+        """某月份Dashboard统计的日志（与 DashboardRepository.get_dashboard_data 的条件和列一致）"""
+        df = self.frame(year_month)
+        df = df[df["api_endpoint"].isin(DASHBOARD_API_ENDPOINTS)
+                & (df["error_message"].isna() | (df["error_message"] != API_LOG_ROLLUP_EXCLUDED_MESSAGE))]
+        return df.assign(center_id=df["token_center_id"])
+
+    def _log_frame(self, year_month: str, filters: Dict[str, str]) -> pd.DataFrame:
+        """与 DashboardRepository._log_conditions 相同的条件（中心同样在日志中没有时取token所属的中心）"""
+        df = self.frame(year_month)
+        mask = (df["api_endpoint"].isin(DASHBOARD_API_ENDPOINTS)
+                & (df["error_message"].isna() | (df["error_message"] != API_LOG_ROLLUP_EXCLUDED_MESSAGE)))
+        for column in DASHBOARD_LOG_FILTERS:
+            if filters.get(column):
+                values = df["center_id"].fillna(df["token_center_id"]) if column == "center_id" else df[column]
+                mask &= values == filters[column]
+        return df[mask]
+
+    def get_logs_page(self, year_month: str, filters: Dict[str, str], sort: str = "timestamp",
+                      descending: bool = True, after: Optional[Tuple[Any, int]] = None,
+                      limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        与 DashboardRepository.get_logs_page 相同的键集分页，数据来自归档文件
+
+        返回:
+            日志记录列表，列与 DashboardRepository.get_logs_page 相同
+        """
+        df = self._log_frame(year_month, filters)
+        if sort == "timestamp":
+            sort_value = df["timestamp"]
+        else:
+            sort_value = df[sort].astype("float64").fillna(-1)
+        df = df.assign(sort_value=sort_value, id=df["id"].astype("int64"))
+        if after is not None:
+            value = pd.Timestamp(after[0]) if sort == "timestamp" else float(after[0])
+            if descending:
+                mask = (df["sort_value"] < value) | ((df["sort_value"] == value) & (df["id"] < after[1]))
+            else:
+                mask = (df["sort_value"] > value) | ((df["sort_value"] == value) & (df["id"] > after[1]))
+            df = df[mask]
+        # 只取前 limit 行，不对整月排序
+        pick = df.nlargest if descending else df.nsmallest
+        page = pick(limit, ["sort_value", "id"])
+        page = pd.DataFrame({
+            "id": page["id"],
+            "timestamp": page["timestamp"],
+            "client_ip": page["client_ip"],
+            "token": page["token"],
+            "api_endpoint": page["api_endpoint"],
+            "file_upload_id": page["file_upload_id"],
+            "file_name": page["file_name"],
+            "file_size": page["file_size"],
+            "ai_usage": page["ai_usage"],
+            "device_type": page["device_type"],
+            "processing_time": page["processing_time"],
+            "status": page["status"],
+            "error_message": page["error_message"],
+            "error_code": page["error_code"],
+            "remaining_times": page["token_usetimes"],
+            "repeat_count": page["repeat_count"],
+            "original_times": page["original_times"],
+            "center_id": page["center_id"].where(page["center_id"].notna(), page["token_center_id"]),
+            "sort_value": page["sort_value"],
+        })
+        return frame_records(page)
+
+    def count_logs(self, year_month: str, filters: Dict[str, str]) -> int:
+        """符合筛选条件的归档日志条数"""
+        return len(self._log_frame(year_month, filters))
+
+    def iter_export_rows(self, start: datetime, end: datetime, **filters: Optional[str]) -> Iterator[Dict[str, Any]]:
+        """
+        逐块读取时间范围内的归档日志，列为 API_LOG_EXPORT_COLUMNS（供日志导出使用，不经过月份缓存）
+
+        参数:
+            start: 开始时间（包含）
+            end: 结束时间（不包含）
+            filters: center_id、token、api_endpoint、status 过滤条件
+        """
+        for year_month in sorted(self.months()):
+            month_start, month_end = month_range(year_month)
+            if month_end <= start or month_start >= end:
+                continue
+            for path, _, _ in self.parts(year_month):
+                for df in self._iter_part_frames(path):
+                    # 先补上中心再过滤，与 DashboardRepository.iter_api_logs 按导出的中心过滤一致
+                    df = df.assign(
+                        center_id=df["center_id"].where(df["center_id"].notna(), df["token_center_id"]),
+                        remaining_times=df["token_usetimes"],
+                    )
+                    mask = (df["timestamp"] >= start) & (df["timestamp"] < end)
+                    for column, value in filters.items():
+                        if value:
+                            mask &= df[column] == value
+                    df = df[mask]
+                    if df.empty:
+                        continue
+                    yield from frame_records(df[list(API_LOG_EXPORT_COLUMNS)])
+
+    def collect_metrics(self):
+        """导出指标"""
+        return [
+            Metric("log_archive_cache_hits_total", "counter", "读取已归档月份命中内存缓存的次数",
+                   [({}, self.cache_hits)]),
+            Metric("log_archive_cache_misses_total", "counter", "读取已归档月份需要读文件的次数",
+                   [({}, self.cache_misses)]),
+        ]
+
+
+def months_before(oldest: datetime, cutoff: str) -> List[str]:
+    """oldest 所在月份到 cutoff（不含）之间的所有月份"""
+    months = []
+    year_month = oldest.strftime('%Y-%m')
+    while year_month < cutoff:
+        months.append(year_month)
+        year_month = month_range(year_month)[1].strftime('%Y-%m')
+    return months
+
+
+def retention_cutoff(retention_months: int, now: Optional[datetime] = None) -> str:
+    """保留期内最早的月份，更早的月份归档"""
+    now = now or datetime.now()
+    index = now.year * 12 + now.month - 1 - retention_months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+class LogArchiver:
+    """定期归档超过保留期的日志"""
+
+    def __init__(self, archive: LogArchive, enabled: bool = ENABLE_LOG_ARCHIVE,
+                 retention_months: int = LOG_ARCHIVE_RETENTION_MONTHS, interval: float = LOG_ARCHIVE_INTERVAL,
+                 delete_batch: int = LOG_ARCHIVE_DELETE_BATCH, delete_pause: float = LOG_ARCHIVE_DELETE_PAUSE):
+        self.archive = archive
+        self.enabled = enabled
+        self.retention_months = retention_months
+        self.interval = interval
+        self.delete_batch = delete_batch
+        self.delete_pause = delete_pause
+        self._task: Optional[asyncio.Task] = None
+
+        # 指标
+        self.archived_rows = 0
+        self.deleted_rows = 0
+        self.errors = 0
+        self.last_run_at: Optional[float] = None
+        self.last_run_duration = 0.0
+
+    def pending_months(self) -> List[str]:
+        """数据库中超过保留期、需要归档的月份"""
+        oldest = APILogArchiveRepository.get_oldest_log_time()
+        if oldest is None:
+            return []
+        return months_before(oldest, retention_cutoff(self.retention_months))
+
+    def archive_month(self, year_month: str, max_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        归档一个月份：把尚未归档的日志写成新分片，然后分批删除已归档的日志
+
+        参数:
+            year_month: 年月格式 'YYYY-MM'
+            max_id: 只归档ID不大于此值的日志（汇总进度），None表示不限制
+        返回:
+            {"year_month", "archived", "deleted", "path"}
+        """
+        start, end = month_range(year_month)
+        after_id = self.archive.archived_max_id(year_month)
+        part = self.archive.write_part(
+            year_month,
+            APILogArchiveRepository.iter_month_batches(start, end, after_id, max_id, self.archive.batch_size)
+        )
+        path, rows = None, 0
+        if part is not None:
+            path, rows, _, max_id = part
+            after_id = max_id
+            self.archived_rows += rows
+
+        deleted = 0
+        while after_id:
+            count = APILogArchiveRepository.delete_archived(start, end, after_id, self.delete_batch)
+            deleted += count
+            self.deleted_rows += count
+            if count < self.delete_batch:
+                break
+            time.sleep(self.delete_pause)
+        return {"year_month": year_month, "archived": rows, "deleted": deleted, "path": path}
+
+    def run_once(self, max_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        归档所有超过保留期的月份（其他进程正在归档时直接返回）
+
+        参数:
+            max_id: 只归档ID不大于此值的日志（汇总进度），None表示不限制
+        返回:
+            各月份的归档结果
+        """
+        start = time.monotonic()
+        results = []
+        with APILogArchiveRepository.lock() as locked:
+            if not locked:
+                return results
+            for year_month in self.pending_months():
+                result = self.archive_month(year_month, max_id)
+                if result["archived"] or result["deleted"]:
+                    print(f"归档API日志 {year_month}: 写入 {result['archived']} 条，删除 {result['deleted']} 条")
+                results.append(result)
+        self.last_run_at = time.time()
+        self.last_run_duration = time.monotonic() - start
+        return results
+
+    @staticmethod
+    async def rollup_watermark() -> Optional[int]:
+        """启用汇总表时返回汇总进度（只归档已汇总的日志），否则为None"""
+        return await AsyncAPILogRollupRepository.get_watermark() if ENABLE_API_LOG_ROLLUP else None
+
+    async def _run(self):
+        while True:
+            try:
+                await ensure_schema()
+                await asyncio.to_thread(self.run_once, await self.rollup_watermark())
+            except Exception as e:
+                self.errors += 1
+                print(f"归档API日志失败: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """启动归档任务"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """停止归档任务（正在进行的月份由下次运行继续）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def collect_metrics(self):
+        """导出指标"""
+        return [
+            Metric("log_archive_rows_total", "counter", "写入归档文件的日志条数", [({}, self.archived_rows)]),
+            Metric("log_archive_deleted_total", "counter", "归档后从数据库删除的日志条数", [({}, self.deleted_rows)]),
+            Metric("log_archive_errors_total", "counter", "归档失败次数", [({}, self.errors)]),
+            Metric("log_archive_last_run_duration_seconds", "gauge", "最近一次归档耗时（秒）",
+                   [({}, round(self.last_run_duration, 6))]),
+        ]
+
+
+# 全局归档（读取在Dashboard中使用，归档任务按 ENABLE_LOG_ARCHIVE 启动）
+log_archive = LogArchive()
+log_archiver = LogArchiver(log_archive)
+metrics_registry.register(log_archive.collect_metrics)
+metrics_registry.register(log_archiver.collect_metrics)
+
+
+async def _main(args):
+    if args.list:
+        for year_month in log_archive.months():
+            for path, min_id, max_id in log_archive.parts(year_month):
+                print(f"{year_month}  {min_id:>12} - {max_id:<12}  {os.path.getsize(path):>12} B  {path}")
+        return
+    await ensure_schema()
+    if args.retention_months is not None:
+        log_archiver.retention_months = args.retention_months
+    if args.dry_run:
+        months = await asyncio.to_thread(log_archiver.pending_months)
+        print(f"将归档的月份: {', '.join(months)}" if months else "没有超过保留期的日志")
+        return
+    results = await asyncio.to_thread(log_archiver.run_once, await log_archiver.rollup_watermark())
+    if not results:
+        print("没有超过保留期的日志（或其他进程正在归档）")
+
+
+if __name__ == "__main__":
+    from app.db.async_database import async_db_session
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--retention-months", type=int, help="数据库中保留的月份数，默认 LOG_ARCHIVE_RETENTION_MONTHS")
+    parser.add_argument("--dry-run", action="store_true", help="只列出会归档的月份")
+    parser.add_argument("--list", action="store_true", help="列出已归档的月份和分片")
+
+    async def run(args):
+        try:
+            await _main(args)
+        finally:
+            await async_db_session.close()
+
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,230 @@
+"""
+API日志导出
+
+把某个时间范围内的 api_logs（关联 tokens）以 CSV 或 NDJSON（可选gzip压缩）分块输出。
+token是调用凭据，导出文件中只保留首尾各4位（mask_token）。
+数据通过无缓冲游标逐批读取、边读边写，内存占用与导出的条数无关，适合按月、按中心导出用量明细。
+已归档的旧日志先从归档文件逐块读出，再接上数据库中的日志。
+
+用法:
+    python -m app.services.log_export_service --month 2025-03 [--center-id xxx] [--format csv|ndjson] [--gzip] [-o 文件]
+    不指定 -o 时写到标准输出
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterator, Optional
+
+from app.core.metrics import Metric, metrics_registry
+from app.models.database import API_LOG_EXPORT_COLUMNS, APILogRepository, month_range
+from app.services.log_archive_service import log_archive
+
+# 每次从数据库读取的行数
+LOG_EXPORT_BATCH_SIZE = int(os.getenv("LOG_EXPORT_BATCH_SIZE", "2000"))
+# 输出块大小（字节，压缩前）：缓冲到这个大小再写出一次
+LOG_EXPORT_CHUNK_SIZE = int(os.getenv("LOG_EXPORT_CHUNK_SIZE", "65536"))
+# gzip压缩级别（1最快，9压缩率最高）
+LOG_EXPORT_GZIP_LEVEL = int(os.getenv("LOG_EXPORT_GZIP_LEVEL", "6"))
+
+# 支持的导出格式及其 Content-Type
+LOG_EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def mask_token(token: Optional[str]) -> Optional[str]:
+    """隐藏token中间部分，只保留首尾各4位，足以区分token而不能用于调用接口"""
+    if not token:
+        return token
+    if len(token) <= 8:
+        return "*" * len(token)
+    return f"{token[:4]}{'*' * (len(token) - 8)}{token[-4:]}"
+
+
+def iter_csv(rows: Iterator[Dict[str, Any]], chunk_size: int = LOG_EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """把日志行编码为CSV（UTF-8带BOM，Excel可直接打开），按块输出"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(API_LOG_EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow([_csv_value(row.get(column)) for column in API_LOG_EXPORT_COLUMNS])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_ndjson(rows: Iterator[Dict[str, Any]], chunk_size: int = LOG_EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """把日志行编码为NDJSON（每行一个JSON对象），按块输出"""
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps({column: _json_value(row.get(column)) for column in API_LOG_EXPORT_COLUMNS},
+                          ensure_ascii=False, default=str) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield "".join(lines).encode("utf-8")
+            lines = []
+            size = 0
+    if lines:
+        yield "".join(lines).encode("utf-8")
+
+
+def iter_gzip(chunks: Iterator[bytes], level: int = LOG_EXPORT_GZIP_LEVEL) -> Iterator[bytes]:
+    """把输出块压缩为一个gzip流"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class LogExporter:
+    """API日志导出"""
+
+    def __init__(self, batch_size: int = LOG_EXPORT_BATCH_SIZE, chunk_size: int = LOG_EXPORT_CHUNK_SIZE):
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+
+        # 指标
+        self.active = 0
+        self.exports = 0
+        self.failed = 0
+        self.rows_exported = 0
+        self.bytes_exported = 0
+
+    @staticmethod
+    def filename(start: datetime, end: datetime, fmt: str, compress: bool, center_id: Optional[str] = None) -> str:
+        """导出文件名，例如 api_logs_center1_20250301_20250401.csv.gz"""
+        # 中心ID只保留字母数字，文件名要放进 Content-Disposition 头
+        parts = ["api_logs", re.sub(r"[^A-Za-z0-9_-]", "", center_id or ""),
+                 start.strftime('%Y%m%d'), end.strftime('%Y%m%d')]
+        name = "_".join(part for part in parts if part)
+        return f"{name}.{fmt}" + (".gz" if compress else "")
+
+    def _count_rows(self, rows: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """计数并隐藏token"""
+        for row in rows:
+            with self._lock:
+                self.rows_exported += 1
+            yield {**row, "token": mask_token(row.get("token"))}
+
+    def iter_export(self, start: datetime, end: datetime, fmt: str = "csv", compress: bool = False,
+                    **filters: Optional[str]) -> Iterator[bytes]:
+        """
+        导出时间范围内的日志
+
+        参数:
+            start: 开始时间（包含）
+            end: 结束时间（不包含）
+            fmt: 'csv' 或 'ndjson'
+            compress: 是否gzip压缩
+            filters: center_id、token、api_endpoint、status 过滤条件
+        返回:
+            输出块迭代器（迭代时才查询数据库，每个块在调用方的线程中读取）
+        """
+        if fmt not in LOG_EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {fmt}")
+
+        archived = log_archive.iter_export_rows(start, end, **filters)
+        source = APILogRepository.iter_api_logs(start, end, batch_size=self.batch_size, **filters)
+        encode = iter_csv if fmt == "csv" else iter_ndjson
+        chunks = encode(self._count_rows(itertools.chain(archived, source)), self.chunk_size)
+        if compress:
+            chunks = iter_gzip(chunks)
+
+        with self._lock:
+            self.active += 1
+        completed = False
+        try:
+            for chunk in chunks:
+                with self._lock:
+                    self.bytes_exported += len(chunk)
+                yield chunk
+            completed = True
+        finally:
+            # 客户端中途断开时生成器被关闭，同样走到这里并关闭数据库连接
+            archived.close()
+            source.close()
+            with self._lock:
+                self.active -= 1
+                if completed:
+                    self.exports += 1
+                else:
+                    self.failed += 1
+
+    def collect_metrics(self):
+        """导出指标"""
+        return [
+            Metric("log_export_active", "gauge", "进行中的日志导出数", [({}, self.active)]),
+            Metric("log_export_total", "counter", "完成的日志导出数", [({}, self.exports)]),
+            Metric("log_export_failed_total", "counter", "出错或中途断开的日志导出数", [({}, self.failed)]),
+            Metric("log_export_rows_total", "counter", "导出的日志条数", [({}, self.rows_exported)]),
+            Metric("log_export_bytes_total", "counter", "导出的字节数（压缩后）", [({}, self.bytes_exported)]),
+        ]
+
+
+# 全局日志导出
+log_exporter = LogExporter()
+metrics_registry.register(log_exporter.collect_metrics)
+
+
+def _main(args):
+    start, end = month_range(args.month)
+    chunks = log_exporter.iter_export(
+        start, end, args.format, args.gzip,
+        center_id=args.center_id, token=args.token, api_endpoint=args.api_endpoint, status=args.status,
+    )
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+    print(f"导出 {log_exporter.rows_exported} 条日志，{log_exporter.bytes_exported} 字节", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--month", required=True, help="年月格式 YYYY-MM")
+    parser.add_argument("--center-id", help="只导出该中心的日志")
+    parser.add_argument("--token", help="只导出该token的日志")
+    parser.add_argument("--api-endpoint", help="只导出该API端点的日志")
+    parser.add_argument("--status", help="只导出该状态的日志")
+    parser.add_argument("--format", choices=sorted(LOG_EXPORT_FORMATS), default="csv")
+    parser.add_argument("--gzip", action="store_true", help="gzip压缩")
+    parser.add_argument("-o", "--output", help="输出文件，不指定时写到标准输出")
+    _main(parser.parse_args())
@@ -0,0 +1,131 @@
+"""
+api_logs 按小时/按天的增量汇总
+
+后台任务按日志ID分批把新写入的日志累加进汇总表，进度保存在 api_log_rollup_state，
+多个进程同时运行时由进度行的行锁保证每条日志只累加一次。自增ID按分配顺序而不是提交顺序可见，
+所以每轮只汇总到上一轮看到的最大ID：隔了一个周期，批量写入器中拿到这些ID的事务早已提交。
+Dashboard读取汇总表而不是原始日志，数据最多落后两个周期。
+每轮汇总后顺带推进迁移5登记的历史日志中心补写（同样只到上一轮看到的最大ID），补写完成后每轮只检查一次进度。
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+from app.core.metrics import Metric, metrics_registry
+from app.db.migrations import MIGRATION_BACKFILL_BATCH, backfill_center_ids, ensure_schema
+from app.models.async_database import AsyncAPILogRollupRepository
+
+# 是否启用
+ENABLE_API_LOG_ROLLUP = os.getenv("ENABLE_API_LOG_ROLLUP", "true").lower() == "true"
+# 汇总间隔（秒）
+API_LOG_ROLLUP_INTERVAL = float(os.getenv("API_LOG_ROLLUP_INTERVAL", "60"))
+# 每个事务最多汇总的日志ID跨度（首次运行补汇总历史日志时分批进行）
+API_LOG_ROLLUP_BATCH = int(os.getenv("API_LOG_ROLLUP_BATCH", "50000"))
+
+
+class APILogRollup:
+    """api_logs 汇总表的增量维护任务"""
+
+    def __init__(self, enabled: bool = ENABLE_API_LOG_ROLLUP, interval: float = API_LOG_ROLLUP_INTERVAL,
+                 batch: int = API_LOG_ROLLUP_BATCH):
+        self.enabled = enabled
+        self.interval = interval
+        self.batch = batch
+        self._settled_id: Optional[int] = None  # 上一轮看到的最大日志ID，本轮汇总到这里
+        self._task: Optional[asyncio.Task] = None
+
+        # 指标
+        self.last_id = 0
+        self.max_id = 0
+        self.rolled_up = 0
+        self.backfilled = 0
+        self.errors = 0
+        self.last_run_at: Optional[float] = None
+        self.last_run_duration = 0.0
+
+    async def run_once(self) -> int:
+        """
+        汇总上一轮之前写入的日志
+
+        返回:
+            本次汇总的日志ID跨度
+        """
+        await ensure_schema()
+        start = time.monotonic()
+        upper_id = self._settled_id
+        self.max_id = await AsyncAPILogRollupRepository.get_max_log_id()
+        self._settled_id = self.max_id
+
+        total = 0
+        last_id = await AsyncAPILogRollupRepository.get_watermark()
+        while upper_id is not None and last_id < upper_id:
+            end_id = min(upper_id, last_id + self.batch)
+            if not await AsyncAPILogRollupRepository.apply_range(last_id, end_id):
+                # 其他进程已推进进度，下一轮重新读取
+                break
+            total += end_id - last_id
+            last_id = end_id
+
+        if upper_id is not None:
+            self.backfilled += await backfill_center_ids(upper_id, MIGRATION_BACKFILL_BATCH)
+
+        self.last_id = last_id
+        self.rolled_up += total
+        self.last_run_at = time.time()
+        self.last_run_duration = time.monotonic() - start
+        return total
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.errors += 1
+                print(f"汇总API日志失败: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """启动汇总任务"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """停止汇总任务（未汇总的日志由下次启动或其他进程继续汇总）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """汇总进度"""
+        return {
+            "last_id": self.last_id,
+            "max_id": self.max_id,
+            "lag": max(self.max_id - self.last_id, 0),
+            "rolled_up": self.rolled_up,
+            "backfilled": self.backfilled,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at,
+            "last_run_duration": round(self.last_run_duration, 6),
+        }
+
+    def collect_metrics(self):
+        """导出指标"""
+        stats = self.stats()
+        return [
+            Metric("api_log_rollup_lag", "gauge", "尚未汇总的日志ID跨度", [({}, stats["lag"])]),
+            Metric("api_log_rollup_total", "counter", "已汇总的日志ID跨度", [({}, stats["rolled_up"])]),
+            Metric("api_log_center_backfill_total", "counter", "已补写中心的历史日志ID跨度", [({}, stats["backfilled"])]),
+            Metric("api_log_rollup_errors_total", "counter", "汇总失败次数", [({}, stats["errors"])]),
+            Metric("api_log_rollup_last_run_duration_seconds", "gauge", "最近一次汇总耗时（秒）",
+                   [({}, stats["last_run_duration"])]),
+        ]
+
+
+# 全局汇总任务
+api_log_rollup = APILogRollup()
+metrics_registry.register(api_log_rollup.collect_metrics)
@@ -0,0 +1,220 @@
+"""
+API日志本地暂存（spool）
+
+MySQL不可用或写入过慢时，批量写入器把日志追加到本地SQLite文件（WAL模式）而不是丢弃，
+后台重放任务在数据库恢复后按批次写回 api_logs。每条记录带有唯一的 record_uuid，
+重放使用 INSERT IGNORE，超时后实际已写入的记录不会重复。
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional
+
+from app.core.metrics import Metric, metrics_registry
+from app.db.migrations import ensure_schema
+from app.models.async_database import AsyncAPILogRepository
+from app.models.database import API_LOG_COLUMNS
+
+# 是否启用本地暂存（关闭时写入失败的日志直接丢弃）
+ENABLE_API_LOG_SPOOL = os.getenv("ENABLE_API_LOG_SPOOL", "true").lower() == "true"
+# 暂存文件路径
+API_LOG_SPOOL_PATH = os.getenv("API_LOG_SPOOL_PATH", "api_log_spool.db")
+# 重放检查间隔（秒）
+API_LOG_SPOOL_REPLAY_INTERVAL = float(os.getenv("API_LOG_SPOOL_REPLAY_INTERVAL", "5"))
+# 每批重放的条数
+API_LOG_SPOOL_REPLAY_BATCH = int(os.getenv("API_LOG_SPOOL_REPLAY_BATCH", "500"))
+
+# 旧版本暂存记录中没有的字段的默认值
+_COLUMN_DEFAULTS = {"repeat_count": 1}
+
+
+def _encode_value(value):
+    """datetime与Decimal转成MySQL可直接接受的字符串"""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_record(record: tuple) -> str:
+    """记录按列名存成JSON，之后 api_logs 增加列时旧记录仍可重放"""
+    return json.dumps(
+        {column: _encode_value(value) for column, value in zip(API_LOG_COLUMNS, record)},
+        ensure_ascii=False
+    )
+
+
+def decode_record(payload: str) -> tuple:
+    """还原为按 API_LOG_COLUMNS 顺序排列的元组"""
+    values = json.loads(payload)
+    return tuple(values.get(column, _COLUMN_DEFAULTS.get(column)) for column in API_LOG_COLUMNS)
+
+
+class LogSpool:
+    """基于SQLite（WAL）的追加式日志暂存"""
+
+    def __init__(self, path: str = API_LOG_SPOOL_PATH, enabled: bool = ENABLE_API_LOG_SPOOL,
+                 replay_interval: float = API_LOG_SPOOL_REPLAY_INTERVAL,
+                 replay_batch: int = API_LOG_SPOOL_REPLAY_BATCH):
+        self.path = path
+        self.enabled = enabled
+        self.replay_interval = replay_interval
+        self.replay_batch = replay_batch
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._replay_task: Optional[asyncio.Task] = None
+        self._pending: Optional[int] = None
+        # 最近一次写库失败后置为False，重放成功后恢复；不健康期间新日志直接进入暂存
+        self.db_healthy = True
+
+        # 指标
+        self.spooled = 0
+        self.replayed = 0
+        self.replay_errors = 0
+        self.last_replay_at: Optional[float] = None
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS api_log_spool ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "record_uuid TEXT NOT NULL UNIQUE, "
+                "payload TEXT NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def append(self, records: List[tuple]) -> int:
+        """
+        追加日志记录（同步，调用方在线程池中执行）
+
+        参数:
+            records: 按 API_LOG_COLUMNS 顺序排列的记录元组，最后一项为record_uuid
+        返回:
+            新追加的条数（record_uuid已存在的记录忽略）
+        """
+        if not records:
+            return 0
+        rows = [(record[-1], encode_record(record)) for record in records]
+        with self._lock:
+            conn = self._get_conn()
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO api_log_spool (record_uuid, payload) VALUES (?, ?)", rows)
+            conn.commit()
+            added = conn.total_changes - before
+            self.spooled += added
+            if self._pending is not None:
+                self._pending += added
+            return added
+
+    async def append_async(self, records: List[tuple]) -> int:
+        """append的异步版本，SQLite写入放到线程池中执行，不阻塞事件循环"""
+        return await asyncio.to_thread(self.append, records)
+
+    def _read_batch(self, limit: int) -> List[tuple]:
+        with self._lock:
+            return self._get_conn().execute(
+                "SELECT seq, payload FROM api_log_spool ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+
+    def _delete_upto(self, seq: int):
+        with self._lock:
+            conn = self._get_conn()
+            before = conn.total_changes
+            conn.execute("DELETE FROM api_log_spool WHERE seq <= ?", (seq,))
+            conn.commit()
+            if self._pending is not None:
+                self._pending = max(self._pending - (conn.total_changes - before), 0)
+
+    def pending(self) -> int:
+        """暂存中等待重放的条数"""
+        if self._pending is None:
+            with self._lock:
+                if self._conn is None and not os.path.exists(self.path):
+                    return 0
+                self._pending = self._get_conn().execute("SELECT COUNT(*) FROM api_log_spool").fetchone()[0]
+        return self._pending
+
+    async def replay(self) -> int:
+        """
+        把暂存的记录按批次写回 api_logs，写入成功后才从暂存中删除
+
+        返回:
+            本次重放的条数
+        """
+        total = 0
+        while True:
+            rows = await asyncio.to_thread(self._read_batch, self.replay_batch)
+            if not rows:
+                self.db_healthy = True
+                return total
+            records = [decode_record(payload) for _, payload in rows]
+            await ensure_schema()
+            await AsyncAPILogRepository.log_api_requests(records, ignore_duplicates=True)
+            await asyncio.to_thread(self._delete_upto, rows[-1][0])
+            total += len(records)
+            self.replayed += len(records)
+            self.last_replay_at = time.time()
+
+    async def _replay_loop(self):
+        while True:
+            await asyncio.sleep(self.replay_interval)
+            if not self.pending():
+                self.db_healthy = True
+                continue
+            try:
+                replayed = await self.replay()
+                if replayed:
+                    print(f"已从本地暂存重放API日志{replayed}条")
+            except Exception as e:
+                self.replay_errors += 1
+                self.db_healthy = False
+                print(f"重放API日志失败: {str(e)}")
+
+    def start(self):
+        """启动后台重放任务"""
+        if self.enabled and self._replay_task is None:
+            self._replay_task = asyncio.get_running_loop().create_task(self._replay_loop())
+
+    async def close(self):
+        """停止重放任务并关闭SQLite连接，未重放的记录保留到下次启动"""
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+            try:
+                await self._replay_task
+            except asyncio.CancelledError:
+                pass
+            self._replay_task = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def collect_metrics(self):
+        """导出指标"""
+        return [
+            Metric("api_log_spool_pending", "gauge", "本地暂存中等待重放的日志条数", [({}, self.pending())]),
+            Metric("api_log_spooled_total", "counter", "写入本地暂存的日志条数", [({}, self.spooled)]),
+            Metric("api_log_replayed_total", "counter", "从本地暂存重放到数据库的日志条数", [({}, self.replayed)]),
+            Metric("api_log_replay_errors_total", "counter", "重放失败次数", [({}, self.replay_errors)]),
+            Metric("api_log_db_healthy", "gauge", "日志写库是否正常（1正常，0写入暂存）",
+                   [({}, 1 if self.db_healthy else 0)]),
+        ]
+
+
+# 全局日志暂存
+log_spool = LogSpool()
+metrics_registry.register(log_spool.collect_metrics)
@@ -0,0 +1,378 @@
+"""
+API日志异步批量写入
+
+请求处理路径只把日志记录放进内存中的有界队列，由后台任务按条数或时间间隔
+合并成一条多行INSERT写入 api_logs，不再为每个响应多一次数据库往返。
+队列满时按配置等待一小段时间（背压），仍然放不下或写库失败、超时的记录转入本地暂存
+（见 log_spool_service），未启用暂存时丢弃并计入指标；关闭时写完队列中剩余的记录。
+脚本化客户端用无效或次数已用完的token反复请求时，同一 (client_ip, token, error_code) 的失败
+在合并窗口内只写一行（repeat_count 为次数，timestamp/last_seen 为第一次/最后一次时间）。
+每条日志入队前同时发布到Dashboard增量总线（见 dashboard_events_service）和流式统计（见 stream_analytics_service）。
+"""
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional, Any, Dict
+
+from app.core.metrics import Metric, metrics_registry
+from app.models.async_database import AsyncAPILogRepository
+from app.models.database import API_LOG_COLUMNS
+from app.services.dashboard_events_service import dashboard_events
+from app.services.log_spool_service import log_spool
+from app.services.stream_analytics_service import stream_analytics
+from app.services.token_cache_service import token_state_cache
+
+# 队列容量（条）
+API_LOG_QUEUE_SIZE = int(os.getenv("API_LOG_QUEUE_SIZE", "10000"))
+# 每批最多写入的条数
+API_LOG_BATCH_SIZE = int(os.getenv("API_LOG_BATCH_SIZE", "200"))
+# 不满一批时最长等待多久写入（秒）
+API_LOG_FLUSH_INTERVAL = float(os.getenv("API_LOG_FLUSH_INTERVAL", "1"))
+# 队列满时的处理方式：block（等待，最长 API_LOG_ENQUEUE_TIMEOUT 秒后丢弃）或 drop（立即丢弃）
+API_LOG_FULL_POLICY = os.getenv("API_LOG_FULL_POLICY", "block").lower()
+# 背压等待上限（秒）
+API_LOG_ENQUEUE_TIMEOUT = float(os.getenv("API_LOG_ENQUEUE_TIMEOUT", "0.5"))
+# 单批写库超时（秒），超时的批次转入本地暂存
+API_LOG_WRITE_TIMEOUT = float(os.getenv("API_LOG_WRITE_TIMEOUT", "5"))
+# 需要合并的失败错误代码，逗号分隔（默认：token不存在、次数不足）
+API_LOG_DEDUP_CODES = {c.strip() for c in os.getenv("API_LOG_DEDUP_CODES", "FORBIDDEN,TOKEN_error").split(",")
+                       if c.strip()}
+# 合并窗口（秒）：同一客户端IP、token、接口、中心、错误代码与错误信息在窗口内的重复失败只写一行，0表示不合并
+API_LOG_DEDUP_WINDOW = float(os.getenv("API_LOG_DEDUP_WINDOW", "60"))
+# 同时合并的组合数上限，超出后不再合并
+API_LOG_DEDUP_MAX_KEYS = int(os.getenv("API_LOG_DEDUP_MAX_KEYS", "10000"))
+
+_STATUS = API_LOG_COLUMNS.index("status")
+_CLIENT_IP = API_LOG_COLUMNS.index("client_ip")
+_TOKEN = API_LOG_COLUMNS.index("token")
+_ERROR_CODE = API_LOG_COLUMNS.index("error_code")
+_API_ENDPOINT = API_LOG_COLUMNS.index("api_endpoint")
+_ERROR_MESSAGE = API_LOG_COLUMNS.index("error_message")
+_CENTER_ID = API_LOG_COLUMNS.index("center_id")
+_TIMESTAMP = API_LOG_COLUMNS.index("timestamp")
+_REPEAT_COUNT = API_LOG_COLUMNS.index("repeat_count")
+_LAST_SEEN = API_LOG_COLUMNS.index("last_seen")
+
+
+class FailureLogAggregator:
+    """
+    合并重复的失败日志：窗口内第一条记录暂存，之后除时间外都相同的失败
+    （client_ip, token, api_endpoint, center_id, error_code, error_message）只计数，
+    窗口结束时写出一行，timestamp为第一次、last_seen为最后一次、repeat_count为次数。
+    写出的那一行只保留第一条的内容，因此接口、中心或错误信息不同的失败不合并
+    """
+
+    def __init__(self, codes=API_LOG_DEDUP_CODES, window: float = API_LOG_DEDUP_WINDOW,
+                 max_keys: int = API_LOG_DEDUP_MAX_KEYS):
+        self.codes = codes
+        self.window = window
+        self.max_keys = max_keys
+        # key -> [记录, 次数, 最后一次时间, 窗口开始（monotonic）]
+        self._entries: Dict[tuple, list] = {}
+        self.absorbed = 0
+
+    def offer(self, record: tuple) -> Optional[tuple]:
+        """
+        参数:
+            record: 按 API_LOG_COLUMNS 顺序排列的记录
+        返回:
+            需要立即写入的记录；被合并（暂不写入）时返回None
+        """
+        if (self.window <= 0 or record[_STATUS] != "failed"
+                or record[_ERROR_CODE] not in self.codes):
+            return record
+        key = (record[_CLIENT_IP], record[_TOKEN], record[_API_ENDPOINT], record[_CENTER_ID],
+               record[_ERROR_CODE], record[_ERROR_MESSAGE])
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[1] += 1
+            entry[2] = record[_TIMESTAMP]
+            self.absorbed += 1
+            return None
+        if len(self._entries) >= self.max_keys:
+            return record
+        self._entries[key] = [record, 1, record[_TIMESTAMP], time.monotonic()]
+        return None
+
+    def expire(self, force: bool = False) -> List[tuple]:
+        """取出窗口已结束的合并记录（force时取出全部）"""
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if force or now - entry[3] >= self.window]
+        records = []
+        for key in expired:
+            record, count, last_seen, _ = self._entries.pop(key)
+            if count > 1:
+                record = list(record)
+                record[_REPEAT_COUNT] = count
+                record[_LAST_SEEN] = last_seen
+                record = tuple(record)
+            records.append(record)
+        return records
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class APILogWriter:
+    """API日志批量写入器（所有操作在事件循环线程内执行）"""
+
+    def __init__(self, queue_size: int = API_LOG_QUEUE_SIZE, batch_size: int = API_LOG_BATCH_SIZE,
+                 flush_interval: float = API_LOG_FLUSH_INTERVAL, full_policy: str = API_LOG_FULL_POLICY,
+                 enqueue_timeout: float = API_LOG_ENQUEUE_TIMEOUT, write_timeout: float = API_LOG_WRITE_TIMEOUT):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.full_policy = full_policy
+        self.enqueue_timeout = enqueue_timeout
+        self.write_timeout = write_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._sweeper: Optional[asyncio.Task] = None
+        self._closed = False
+        self.aggregator = FailureLogAggregator()
+
+        # 指标
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.batches = 0
+        self.write_errors = 0
+        self.last_batch_size = 0
+        self.last_write_duration = 0.0
+
+    @staticmethod
+    def build_record(
+            client_ip: str,
+            token: str,
+            api_endpoint: str,
+            status: str,
+            file_upload_id: Optional[str] = None,
+            file_name: Optional[str] = None,
+            file_size: Optional[int] = None,
+            ai_usage: Optional[int] = None,
+            error_message: Optional[str] = None,
+            error_code: Optional[str] = None,
+            token_usetimes: Optional[int] = None,
+            center_id: Optional[str] = None,
+            device_type: Optional[str] = None,
+            processing_time: Optional[Decimal] = None,
+    ) -> tuple:
+        """
+        按 API_LOG_COLUMNS 的顺序组装记录，时间取入队时刻而不是写入时刻，record_uuid用于重放去重；
+        没有传入中心时取已缓存的token所属中心，使Dashboard增量和流式统计能按中心计数
+        """
+        if center_id is None and token:
+            center_id = token_state_cache.cached_center_id(token)
+        return (
+            datetime.now(), client_ip, token, api_endpoint, file_upload_id,
+            file_name, file_size, ai_usage, status,
+            error_message, error_code, token_usetimes, center_id,
+            device_type, processing_time, 1, None, uuid.uuid4().hex,
+        )
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        return self._queue
+
+    async def log(self, **fields):
+        """
+        记录一条API日志，参数与 AsyncAPILogRepository.log_api_request 相同
+
+        队列满时按 full_policy 等待或丢弃，不会抛出异常
+        """
+        record = self.build_record(**fields)
+        dashboard_events.publish(record)
+        stream_analytics.publish(record)
+        if self._closed:
+            # 已关闭（应用退出过程中）直接写库
+            await self._write([record])
+            return
+
+        record = self._aggregate(record)
+        if record is not None:
+            await self._enqueue(record)
+
+    def _aggregate(self, record: tuple) -> Optional[tuple]:
+        """重复失败交给合并器，返回需要立即写入的记录"""
+        record = self.aggregator.offer(record)
+        if len(self.aggregator) and (self._sweeper is None or self._sweeper.done()):
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+        return record
+
+    async def _sweep_loop(self):
+        """定期写出窗口已结束的合并记录，没有待合并记录时退出"""
+        while len(self.aggregator):
+            await asyncio.sleep(min(self.aggregator.window / 4, 1.0))
+            for record in self.aggregator.expire():
+                await self._enqueue(record)
+
+    async def _enqueue(self, record: tuple):
+        queue = self._get_queue()
+        try:
+            queue.put_nowait(record)
+        except asyncio.QueueFull:
+            if self.full_policy != "block":
+                await self._overflow(record)
+                return
+            self.blocked += 1
+            try:
+                await asyncio.wait_for(queue.put(record), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                await self._overflow(record)
+                return
+        self.enqueued += 1
+
+    async def _overflow(self, record: tuple):
+        """队列满：写入本地暂存，未启用暂存时丢弃"""
+        if log_spool.enabled:
+            try:
+                await log_spool.append_async([record])
+                return
+            except Exception as e:
+                print(f"写入API日志暂存失败: {str(e)}")
+        self.dropped += 1
+
+    def submit(self, **fields):
+        """记录一条API日志，不等待：队列满时写入本地暂存（未启用暂存时丢弃）"""
+        if self._closed:
+            self.dropped += 1
+            return
+        record = self.build_record(**fields)
+        dashboard_events.publish(record)
+        stream_analytics.publish(record)
+        record = self._aggregate(record)
+        if record is None:
+            return
+        try:
+            self._get_queue().put_nowait(record)
+            self.enqueued += 1
+        except asyncio.QueueFull:
+            asyncio.get_running_loop().create_task(self._overflow(record))
+
+    async def _run(self):
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            record = await queue.get()
+            if record is None:
+                return
+            batch = [record]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        record = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if record is None:
+                    # 收到关闭信号：写完当前批次后退出
+                    stopping = True
+                    break
+                batch.append(record)
+            await self._write(batch)
+
+    async def _write(self, batch: List[tuple]):
+        start = time.monotonic()
+        if log_spool.enabled and not log_spool.db_healthy:
+            # 数据库尚未恢复：直接写入暂存，由重放任务统一写回
+            await self._spool(batch)
+            return
+        try:
+            await asyncio.wait_for(AsyncAPILogRepository.log_api_requests(batch), timeout=self.write_timeout)
+            self.written += len(batch)
+        except Exception as e:
+            self.write_errors += 1
+            print(f"批量写入API日志失败（{len(batch)}条）: {repr(e)}")
+            if log_spool.enabled:
+                log_spool.db_healthy = False
+                await self._spool(batch)
+            else:
+                self.dropped += len(batch)
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        self.last_write_duration = time.monotonic() - start
+
+    async def _spool(self, batch: List[tuple]):
+        try:
+            await log_spool.append_async(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            print(f"写入API日志暂存失败（{len(batch)}条）: {str(e)}")
+
+    async def close(self):
+        """停止后台任务并写完队列中剩余的记录（包括尚未到期的合并记录）"""
+        self._closed = True
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        pending = self.aggregator.expire(force=True)
+        if self._worker is None or self._worker.done():
+            if pending:
+                await self._write(pending)
+            return
+        for record in pending:
+            await self._queue.put(record)
+            self.enqueued += 1
+        # 关闭信号排在所有已入队记录之后，后台任务按顺序写完再退出
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        """写入器状态"""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "batches": self.batches,
+            "write_errors": self.write_errors,
+            "deduplicated": self.aggregator.absorbed,
+            "dedup_keys": len(self.aggregator),
+            "last_batch_size": self.last_batch_size,
+            "last_write_duration": round(self.last_write_duration, 6),
+        }
+
+    def collect_metrics(self):
+        """导出指标"""
+        stats = self.stats()
+        return [
+            Metric("api_log_queue_depth", "gauge", "等待写入的日志条数", [({}, stats["queue_depth"])]),
+            Metric("api_log_enqueued_total", "counter", "进入队列的日志条数", [({}, stats["enqueued"])]),
+            Metric("api_log_written_total", "counter", "已写入数据库的日志条数", [({}, stats["written"])]),
+            Metric("api_log_dropped_total", "counter", "队列满或写入失败且未能暂存而丢弃的日志条数",
+                   [({}, stats["dropped"])]),
+            Metric("api_log_blocked_total", "counter", "因队列满而等待的次数", [({}, stats["blocked"])]),
+            Metric("api_log_batches_total", "counter", "批量写入次数", [({}, stats["batches"])]),
+            Metric("api_log_write_errors_total", "counter", "批量写入失败次数", [({}, stats["write_errors"])]),
+            Metric("api_log_deduplicated_total", "counter", "合并到已有行中的重复失败日志条数",
+                   [({}, stats["deduplicated"])]),
+            Metric("api_log_dedup_keys", "gauge", "正在合并的 (IP, token, 错误代码) 组合数", [({}, stats["dedup_keys"])]),
+            Metric("api_log_last_batch_size", "gauge", "最近一批的条数", [({}, stats["last_batch_size"])]),
+            Metric("api_log_last_write_duration_seconds", "gauge", "最近一批的写入耗时（秒）",
+                   [({}, stats["last_write_duration"])]),
+        ]
+
+
+# 全局API日志写入器
+api_log_writer = APILogWriter()
+metrics_registry.register(api_log_writer.collect_metrics)
@@ -54,7 +54,8 @@ class BaseOCRModel(ABC):
     """OCR模型基类"""
     
     @abstractmethod
-    def analyze_image(self, image_content: bytes, filename: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    def analyze_image(self, image_content: bytes, filename: str,
+                      mime_type: str = "image/jpeg") -> Tuple[Dict[str, Any], Dict[str, Any]]:
         """分析图像并返回结果"""
         pass
     
@@ -261,12 +262,13 @@ class GeminiOCRModel(BaseOCRModel):
         self.timeout = int(os.getenv("GEMINI_TIMEOUT", "60"))
         print(f"Gemini API 超时设置为 {self.timeout} 秒")
 
-    def analyze_image(self, image_content: bytes, filename: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    def analyze_image(self, image_content: bytes, filename: str,
+                      mime_type: str = "image/jpeg") -> Tuple[Dict[str, Any], Dict[str, Any]]:
         """使用Gemini模型分析图像"""
         try:
-            # Gemini直接使用原始图像，不需要压缩和预处理
+            # Gemini直接使用原始图像，不需要压缩和预处理（格式协商已在上游完成）
             prompt_parts = [
-                {"mime_type": "image/jpeg", "data": image_content},
+                {"mime_type": mime_type, "data": image_content},
                 get_gemini_prompt()
             ]
 
@@ -0,0 +1,206 @@
+"""
+本地图像质量检测：在调用模型之前拦截模糊、过暗、过曝的照片
+"""
+import io
+import os
+import json
+import threading
+from typing import Dict, Any, Optional
+
+import numpy as np
+from PIL import Image
+
+# 是否启用质量检测
+ENABLE_QUALITY_GATE = os.getenv("ENABLE_QUALITY_GATE", "true").lower() == "true"
+# 检测用缩略图的最长边（像素）
+QUALITY_THUMBNAIL_SIZE = int(os.getenv("QUALITY_THUMBNAIL_SIZE", "512"))
+# 灰度值不低于此值的像素视为高光溢出
+QUALITY_CLIP_LEVEL = int(os.getenv("QUALITY_CLIP_LEVEL", "250"))
+
+# 默认阈值
+DEFAULT_QUALITY_THRESHOLDS = {
+    "min_sharpness": float(os.getenv("QUALITY_MIN_SHARPNESS", "12")),  # 拉普拉斯方差下限
+    "min_luminance": float(os.getenv("QUALITY_MIN_LUMINANCE", "35")),  # 平均亮度下限
+    "max_luminance": float(os.getenv("QUALITY_MAX_LUMINANCE", "235")),  # 平均亮度上限
+    "max_highlight_ratio": float(os.getenv("QUALITY_MAX_HIGHLIGHT_RATIO", "0.4")),  # 高光溢出像素比例上限
+}
+
+# 按设备类型覆盖的阈值，JSON格式，例如 {"blood_sugar": {"min_sharpness": 20}}
+QUALITY_THRESHOLDS_BY_CATEGORY: Dict[str, Dict[str, float]] = json.loads(
+    os.getenv("QUALITY_THRESHOLDS_BY_CATEGORY", "{}")
+)
+
+# 各项检测失败时返回给用户的提示
+QUALITY_MESSAGES = {
+    "blurry": "图像模糊，请对准屏幕重新拍摄",
+    "too_dark": "图像过暗，请在光线充足处重新拍摄",
+    "too_bright": "图像过亮，请避免强光直射后重新拍摄",
+    "glare": "屏幕反光严重，请调整角度避开反光后重新拍摄",
+}
+
+
+def get_quality_thresholds(category: Optional[str] = None) -> Dict[str, float]:
+    """
+    获取阈值：指定设备类型时返回该类型的阈值，
+    未指定时（模型调用前类型未知）取所有设备类型中最宽松的阈值，避免误拒
+
+    参数:
+        category: 设备类型（blood_pressure / blood_sugar），可选
+    返回:
+        阈值字典
+    """
+    if category is not None:
+        return {**DEFAULT_QUALITY_THRESHOLDS, **QUALITY_THRESHOLDS_BY_CATEGORY.get(category, {})}
+
+    thresholds = dict(DEFAULT_QUALITY_THRESHOLDS)
+    for overrides in QUALITY_THRESHOLDS_BY_CATEGORY.values():
+        merged = {**DEFAULT_QUALITY_THRESHOLDS, **overrides}
+        thresholds["min_sharpness"] = min(thresholds["min_sharpness"], merged["min_sharpness"])
+        thresholds["min_luminance"] = min(thresholds["min_luminance"], merged["min_luminance"])
+        thresholds["max_luminance"] = max(thresholds["max_luminance"], merged["max_luminance"])
+        thresholds["max_highlight_ratio"] = max(thresholds["max_highlight_ratio"], merged["max_highlight_ratio"])
+    return thresholds
+
+
+def measure_image_quality(image_data: bytes) -> Dict[str, float]:
+    """
+    在缩小后的灰度缩略图上计算质量指标
+
+    参数:
+        image_data: 图像二进制数据
+    返回:
+        包含sharpness（拉普拉斯方差）、luminance（平均亮度）、
+        highlight_ratio（高光溢出比例）的字典
+    """
+    img = Image.open(io.BytesIO(image_data))
+    # JPEG可在解码阶段直接缩小，避免解码全尺寸图像
+    img.draft("L", (QUALITY_THUMBNAIL_SIZE, QUALITY_THUMBNAIL_SIZE))
+    img = img.convert("L")
+    img.thumbnail((QUALITY_THUMBNAIL_SIZE, QUALITY_THUMBNAIL_SIZE))
+
+    gray = np.asarray(img, dtype=np.float32)
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        return {"sharpness": 0.0, "luminance": float(gray.mean()), "highlight_ratio": 0.0}
+
+    # 4邻域拉普拉斯算子
+    laplacian = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4.0 * gray[1:-1, 1:-1]
+    )
+
+    return {
+        "sharpness": float(laplacian.var()),
+        "luminance": float(gray.mean()),
+        "highlight_ratio": float(np.count_nonzero(gray >= QUALITY_CLIP_LEVEL) / gray.size),
+    }
+
+
+def check_image_quality(image_data: bytes, category: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    检查图像质量是否足以识别
+
+    参数:
+        image_data: 图像二进制数据
+        category: 设备类型，可选
+    返回:
+        {"passed", "reason", "message", "metrics"}，未启用或无法检测时返回None
+    """
+    if not ENABLE_QUALITY_GATE:
+        return None
+
+    try:
+        metrics = measure_image_quality(image_data)
+    except Exception as e:
+        # 无法解码时交给后续流程处理，不在这里拦截
+        print(f"图像质量检测失败: {str(e)}")
+        return None
+
+    thresholds = get_quality_thresholds(category)
+    reason = None
+    if metrics["highlight_ratio"] > thresholds["max_highlight_ratio"]:
+        reason = "glare"
+    elif metrics["luminance"] < thresholds["min_luminance"]:
+        reason = "too_dark"
+    elif metrics["luminance"] > thresholds["max_luminance"]:
+        reason = "too_bright"
+    elif metrics["sharpness"] < thresholds["min_sharpness"]:
+        reason = "blurry"
+
+    quality_stats.record_check(reason)
+
+    if reason:
+        print(f"图像质量不合格: {reason}, 指标: {metrics}")
+    return {
+        "passed": reason is None,
+        "reason": reason,
+        "message": QUALITY_MESSAGES[reason] if reason else None,
+        "metrics": metrics,
+    }
+
+
+class QualityStats:
+    """按设备类型累计质量指标，用于调整各类型的阈值"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rejected: Dict[str, int] = {}
+        self.checked = 0
+        self.by_category: Dict[str, Dict[str, float]] = {}
+
+    def record_check(self, reason: Optional[str]):
+        """记录一次模型调用前的检测结果"""
+        with self._lock:
+            self.checked += 1
+            if reason:
+                self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+    def record_outcome(self, category: str, metrics: Optional[Dict[str, float]], valid: bool):
+        """
+        记录模型识别后的结果，把质量指标归入识别出的设备类型
+
+        参数:
+            category: 模型识别出的设备类型
+            metrics: 该图像的质量指标
+            valid: 识别结果是否通过数据验证
+        """
+        if not metrics:
+            return
+        with self._lock:
+            stats = self.by_category.setdefault(category or "unknown", {
+                "count": 0, "invalid_count": 0,
+                "sharpness_sum": 0.0, "luminance_sum": 0.0, "highlight_ratio_sum": 0.0,
+                "invalid_sharpness_sum": 0.0,
+            })
+            stats["count"] += 1
+            stats["sharpness_sum"] += metrics["sharpness"]
+            stats["luminance_sum"] += metrics["luminance"]
+            stats["highlight_ratio_sum"] += metrics["highlight_ratio"]
+            if not valid:
+                stats["invalid_count"] += 1
+                stats["invalid_sharpness_sum"] += metrics["sharpness"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回当前统计数据"""
+        with self._lock:
+            categories = {}
+            for category, stats in self.by_category.items():
+                count = stats["count"]
+                invalid = stats["invalid_count"]
+                categories[category] = {
+                    "count": count,
+                    "invalid_count": invalid,
+                    "avg_sharpness": round(stats["sharpness_sum"] / count, 2),
+                    "avg_luminance": round(stats["luminance_sum"] / count, 2),
+                    "avg_highlight_ratio": round(stats["highlight_ratio_sum"] / count, 4),
+                    "avg_invalid_sharpness": round(stats["invalid_sharpness_sum"] / invalid, 2) if invalid else None,
+                    "thresholds": get_quality_thresholds(category),
+                }
+            return {
+                "checked": self.checked,
+                "rejected": dict(self.rejected),
+                "categories": categories,
+            }
+
+
+# 全局质量统计实例
+quality_stats = QualityStats()
@@ -0,0 +1,263 @@
+"""
+进程内的流式近似统计
+
+每条API日志在入队时同时计入当前时间片（STREAM_ANALYTICS_SLOT 秒）的摘要：
+- 按 token、客户端IP、错误代码、中心、接口的近似Top-K计数（Space-Saving）
+- 全部请求和每个中心的 processing_time 直方图（对数分桶，分位数相对误差 STREAM_ANALYTICS_ACCURACY）
+中心取记录中的 center_id（上传日志为token所属的中心，见 APILogWriter.build_record）。
+查询时合并最近 window 秒内的时间片，得到"现在"的Top-K和 p50/p95/p99，不查询数据库。
+只保留最近 STREAM_ANALYTICS_WINDOW 秒的时间片，内存与请求量无关。
+
+摘要可序列化（/upload/analytics?raw=true）并合并，多worker或多实例部署时用命令行合并各自的结果：
+    python -m app.services.stream_analytics_service http://host1/upload/analytics?raw=true worker2.json ...
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from app.core.metrics import Metric, metrics_registry
+from app.core.sketches import LatencySketch, SpaceSaving
+from app.models.database import API_LOG_COLUMNS
+
+# 是否启用
+ENABLE_STREAM_ANALYTICS = os.getenv("ENABLE_STREAM_ANALYTICS", "true").lower() == "true"
+# 保留的时间范围（秒），即可查询的最大窗口
+STREAM_ANALYTICS_WINDOW = int(os.getenv("STREAM_ANALYTICS_WINDOW", "900"))
+# 时间片长度（秒），窗口按时间片滑动
+STREAM_ANALYTICS_SLOT = int(os.getenv("STREAM_ANALYTICS_SLOT", "30"))
+# 每个时间片每个维度跟踪的键数（Top-K的K，计数误差不超过 请求数/该值）
+STREAM_ANALYTICS_CAPACITY = int(os.getenv("STREAM_ANALYTICS_CAPACITY", "100"))
+# 分位数的相对误差
+STREAM_ANALYTICS_ACCURACY = float(os.getenv("STREAM_ANALYTICS_ACCURACY", "0.01"))
+# 每个时间片最多单独统计延迟的中心数，超出的计入 "_other"
+STREAM_ANALYTICS_MAX_CENTERS = int(os.getenv("STREAM_ANALYTICS_MAX_CENTERS", "200"))
+
+# 统计Top-K的维度
+HEAVY_HITTER_DIMENSIONS = ("token", "client_ip", "error_code", "center_id", "api_endpoint")
+# 输出的分位数
+LATENCY_QUANTILES = (0.5, 0.95, 0.99)
+OTHER_CENTER = "_other"
+
+_CLIENT_IP = API_LOG_COLUMNS.index("client_ip")
+_TOKEN = API_LOG_COLUMNS.index("token")
+_API_ENDPOINT = API_LOG_COLUMNS.index("api_endpoint")
+_STATUS = API_LOG_COLUMNS.index("status")
+_ERROR_CODE = API_LOG_COLUMNS.index("error_code")
+_CENTER_ID = API_LOG_COLUMNS.index("center_id")
+_PROCESSING_TIME = API_LOG_COLUMNS.index("processing_time")
+
+
+class StreamSummary:
+    """一段时间内的摘要（一个时间片，或合并后的一个窗口）"""
+
+    def __init__(self, start: float, capacity: int = STREAM_ANALYTICS_CAPACITY,
+                 accuracy: float = STREAM_ANALYTICS_ACCURACY, max_centers: int = STREAM_ANALYTICS_MAX_CENTERS):
+        self.start = start
+        self.end = start
+        self.capacity = capacity
+        self.accuracy = accuracy
+        self.max_centers = max_centers
+        self.requests = 0
+        self.failed = 0
+        self.heavy_hitters = {dimension: SpaceSaving(capacity) for dimension in HEAVY_HITTER_DIMENSIONS}
+        self.latency = LatencySketch(accuracy)
+        self.center_latency: Dict[str, LatencySketch] = {}
+
+    def add(self, record: tuple, now: float):
+        """计入一条日志"""
+        self.end = now
+        self.requests += 1
+        failed = record[_STATUS] != "success"
+        if failed:
+            self.failed += 1
+        for dimension, value in (("token", record[_TOKEN]), ("client_ip", record[_CLIENT_IP]),
+                                 ("center_id", record[_CENTER_ID]), ("api_endpoint", record[_API_ENDPOINT])):
+            if value:
+                self.heavy_hitters[dimension].add(value)
+        if failed:
+            self.heavy_hitters["error_code"].add(record[_ERROR_CODE] or "UNKNOWN")
+
+        processing_time = record[_PROCESSING_TIME]
+        if processing_time is not None:
+            processing_time = float(processing_time)
+            self.latency.add(processing_time)
+            center_id = record[_CENTER_ID]
+            if center_id:
+                self._center_sketch(center_id).add(processing_time)
+
+    def _center_sketch(self, center_id: str) -> LatencySketch:
+        sketch = self.center_latency.get(center_id)
+        if sketch is None:
+            if len(self.center_latency) >= self.max_centers:
+                center_id = OTHER_CENTER
+                sketch = self.center_latency.get(center_id)
+            if sketch is None:
+                sketch = self.center_latency[center_id] = LatencySketch(self.accuracy)
+        return sketch
+
+    def merge(self, other: "StreamSummary"):
+        """合并另一个摘要（时间片或其他worker的窗口）"""
+        self.start = min(self.start, other.start)
+        self.end = max(self.end, other.end)
+        self.requests += other.requests
+        self.failed += other.failed
+        for dimension, sketch in other.heavy_hitters.items():
+            self.heavy_hitters[dimension].merge(sketch)
+        self.latency.merge(other.latency)
+        for center_id, sketch in other.center_latency.items():
+            if center_id not in self.center_latency:
+                self.center_latency[center_id] = LatencySketch(self.accuracy)
+            self.center_latency[center_id].merge(sketch)
+
+    def report(self, top: int = 10) -> Dict[str, Any]:
+        """
+        可读的统计结果
+
+        参数:
+            top: 每个维度返回的键数
+        返回:
+            请求数、各维度Top-K（count为上界，真实值不小于 count - error）、全部与各中心的延迟分位数
+        """
+        def latency(sketch: LatencySketch) -> Dict[str, Any]:
+            return {
+                "count": sketch.count,
+                "avg": round(sketch.sum / sketch.count, 3) if sketch.count else None,
+                "max": sketch.max,
+                **{f"p{round(q * 100)}": _round(sketch.quantile(q)) for q in LATENCY_QUANTILES},
+            }
+
+        centers = sorted(self.center_latency.items(), key=lambda item: item[1].count, reverse=True)
+        return {
+            "start": self.start,
+            "end": self.end,
+            "requests": self.requests,
+            "failed": self.failed,
+            "heavy_hitters": {
+                dimension: [{"key": key, "count": count, "error": error} for key, count, error in sketch.top(top)]
+                for dimension, sketch in self.heavy_hitters.items()
+            },
+            "latency": latency(self.latency),
+            "center_latency": {center_id: latency(sketch) for center_id, sketch in centers},
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "start": self.start, "end": self.end, "capacity": self.capacity, "accuracy": self.accuracy,
+            "max_centers": self.max_centers, "requests": self.requests, "failed": self.failed,
+            "heavy_hitters": {dimension: sketch.to_dict() for dimension, sketch in self.heavy_hitters.items()},
+            "latency": self.latency.to_dict(),
+            "center_latency": {center_id: sketch.to_dict() for center_id, sketch in self.center_latency.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StreamSummary":
+        summary = cls(data["start"], data["capacity"], data["accuracy"], data["max_centers"])
+        summary.end = data["end"]
+        summary.requests = data["requests"]
+        summary.failed = data["failed"]
+        for dimension, sketch in data["heavy_hitters"].items():
+            summary.heavy_hitters[dimension] = SpaceSaving.from_dict(sketch)
+        summary.latency = LatencySketch.from_dict(data["latency"])
+        summary.center_latency = {
+            center_id: LatencySketch.from_dict(sketch) for center_id, sketch in data["center_latency"].items()
+        }
+        return summary
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+class StreamAnalytics:
+    """按时间片滑动的流式统计（所有操作在事件循环线程内执行）"""
+
+    def __init__(self, enabled: bool = ENABLE_STREAM_ANALYTICS, window: int = STREAM_ANALYTICS_WINDOW,
+                 slot: int = STREAM_ANALYTICS_SLOT):
+        self.enabled = enabled
+        self.window = window
+        self.slot = slot
+        self._slots: Deque[StreamSummary] = deque()
+
+        # 指标
+        self.published = 0
+
+    def _expire(self, now: float):
+        """丢弃已滑出保留范围的时间片"""
+        while self._slots and self._slots[0].start + self.slot <= now - self.window:
+            self._slots.popleft()
+
+    def publish(self, record: tuple, now: Optional[float] = None):
+        """
+        计入一条API日志
+
+        参数:
+            record: 按 API_LOG_COLUMNS 顺序排列的记录
+            now: 当前时间（秒），默认为 time.time()
+        """
+        if not self.enabled:
+            return
+        now = time.time() if now is None else now
+        if not self._slots or now >= self._slots[-1].start + self.slot:
+            self._expire(now)
+            self._slots.append(StreamSummary(now - now % self.slot))
+        self._slots[-1].add(record, now)
+        self.published += 1
+
+    def summary(self, window: Optional[int] = None, now: Optional[float] = None) -> StreamSummary:
+        """
+        合并最近 window 秒内的时间片（按时间片对齐，最多 STREAM_ANALYTICS_WINDOW 秒）
+
+        参数:
+            window: 窗口长度（秒），默认为全部保留的时间片
+            now: 当前时间（秒），默认为 time.time()
+        """
+        now = time.time() if now is None else now
+        window = min(window or self.window, self.window)
+        self._expire(now)
+        merged = StreamSummary(now)
+        for slot in self._slots:
+            if slot.start + self.slot > now - window:
+                merged.merge(slot)
+        return merged
+
+    def collect_metrics(self):
+        """导出指标"""
+        return [
+            Metric("stream_analytics_published_total", "counter", "计入流式统计的日志数", [({}, self.published)]),
+            Metric("stream_analytics_slots", "gauge", "保留的时间片数", [({}, len(self._slots))]),
+        ]
+
+
+# 全局流式统计
+stream_analytics = StreamAnalytics()
+metrics_registry.register(stream_analytics.collect_metrics)
+
+
+def load_summary(source: str) -> StreamSummary:
+    """从URL（/upload/analytics?raw=true 的响应）或JSON文件读取一个worker的摘要"""
+    if source.startswith(("http://", "https://")):
+        with urllib.request.urlopen(source, timeout=10) as response:
+            data = json.load(response)
+    else:
+        with open(source, encoding="utf-8") as file:
+            data = json.load(file)
+    return StreamSummary.from_dict(data.get("data", data))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合并多个worker的流式统计")
+    parser.add_argument("sources", nargs="+", help="/upload/analytics?raw=true 的URL或保存的JSON文件")
+    parser.add_argument("--top", type=int, default=10, help="每个维度输出的键数")
+    args = parser.parse_args()
+
+    summaries = [load_summary(source) for source in args.sources]
+    merged = summaries[0]
+    for summary in summaries[1:]:
+        merged.merge(summary)
+    json.dump(merged.report(args.top), sys.stdout, ensure_ascii=False, indent=2)
+    print()
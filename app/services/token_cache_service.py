@@ -0,0 +1,342 @@
+"""
+进程内token状态缓存
+
+缓存每个token的剩余次数（use_times）和中心ID（center_id），短TTL内直接命中。
+默认（严格模式）预留次数直接执行带条件的UPDATE（use_times > 0），由数据库保证多进程、多实例下也不会超额使用。
+TOKEN_CACHE_WRITE_BEHIND=true 时扣减先在本地累计，由后台任务按固定间隔把聚合后的增量写回MySQL（write-behind）：
+每个进程只按自己的缓存判断剩余次数，多worker或多实例部署时并发请求可能超额使用，只适合单进程或允许超额的部署。
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Any
+
+from app.core.metrics import Metric, metrics_registry
+from app.services.token_shard_service import (
+    get_token_info_async,
+    reserve_usage_async,
+    release_usage_async,
+    apply_usage_deltas_async,
+)
+from app.services.token_filter_service import token_filter
+
+# 缓存有效期（秒）
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "5"))
+# 本地扣减写回数据库的间隔（秒）
+TOKEN_FLUSH_INTERVAL = float(os.getenv("TOKEN_FLUSH_INTERVAL", "2"))
+# 扣减先在本地累计、定期写回（多进程部署时可能超额使用）；默认关闭，预留直接执行带条件的UPDATE
+TOKEN_CACHE_WRITE_BEHIND = os.getenv("TOKEN_CACHE_WRITE_BEHIND", "false").lower() == "true"
+
+
+class TokenState:
+    """单个token的缓存状态"""
+
+    def __init__(self, use_times: int, center_id: Optional[str]):
+        self.db_use_times = use_times  # 最近一次从数据库读到（或已确认写入）的次数
+        self.center_id = center_id
+        self.loaded_at = time.monotonic()
+        self.pending = 0  # 本地已扣减、尚未写回的次数
+        self.flushing = 0  # 正在写回中的次数
+        self.first_pending_at: Optional[float] = None
+
+    @property
+    def use_times(self) -> int:
+        """扣除本地未写回部分后的剩余次数"""
+        return self.db_use_times - self.pending - self.flushing
+
+
+class TokenStateCache:
+    """token状态缓存（所有操作在事件循环线程内执行）"""
+
+    def __init__(self, ttl: float = TOKEN_CACHE_TTL, flush_interval: float = TOKEN_FLUSH_INTERVAL,
+                 strict: bool = not TOKEN_CACHE_WRITE_BEHIND):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.strict = strict
+        self._states: Dict[str, TokenState] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flush_epoch = 0  # 每次写回结束时加1，加载期间发生过写回时丢弃读到的次数
+
+        # 指标
+        self.hits = 0
+        self.misses = 0
+        self.flush_total = 0
+        self.flush_errors = 0
+        self.last_flush_at: Optional[float] = None
+        self.last_flush_duration = 0.0
+
+    async def _load(self, token: str) -> Optional[TokenState]:
+        """从数据库加载，同一token并发未命中时只查询一次"""
+        future = self._loading.get(token)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[token] = future
+        try:
+            while True:
+                epoch = self._flush_epoch
+                token_info = await get_token_info_async(token)
+                token_filter.record_lookup(token, token_info is not None)
+                state = self._states.get(token)
+                # 读取期间有写回结束且条目已被清理时，读到的值可能不含该次写回，重新读取
+                if state is not None or epoch == self._flush_epoch:
+                    break
+            if token_info is None:
+                # 数据库中已不存在，丢弃未写回的扣减
+                self._states.pop(token, None)
+                state = None
+            elif state is not None:
+                # 刷新已有条目，保留尚未写回的本地扣减；
+                # 读取期间有写回结束或仍在写回时，读到的值是否已包含该次写回无法确定，保留本地的值
+                state.center_id = token_info["center_id"]
+                if epoch == self._flush_epoch and not state.flushing:
+                    state.db_use_times = token_info["use_times"]
+                    state.loaded_at = time.monotonic()
+            else:
+                state = TokenState(token_info["use_times"], token_info["center_id"])
+                self._states[token] = state
+            future.set_result(state)
+            return state
+        except Exception as e:
+            future.set_exception(e)
+            # 避免"Future exception was never retrieved"警告
+            future.exception()
+            raise
+        finally:
+            self._loading.pop(token, None)
+
+    async def get(self, token: str) -> Optional[TokenState]:
+        """
+        获取token状态
+
+        Args:
+            token: token字符串
+
+        Returns:
+            TokenState，token不存在时返回None
+        """
+        state = self._states.get(token)
+        if state is not None:
+            expired = time.monotonic() - state.loaded_at > self.ttl
+            # 写回进行中的条目暂不刷新，避免读到的数据库值与本地计数重复或遗漏
+            if not expired or state.flushing:
+                self.hits += 1
+                return state
+        # 过滤器中没有且最近已确认数据库中没有的token不查询数据库
+        if not token_filter.might_exist(token):
+            return None
+        self.misses += 1
+        return await self._load(token)
+
+    def cached_center_id(self, token: str) -> Optional[str]:
+        """已缓存的token所属中心（不查询数据库、不计入命中率），未缓存时返回None"""
+        state = self._states.get(token)
+        return state.center_id if state is not None else None
+
+    async def get_use_times(self, token: str) -> int:
+        """获取剩余次数，token不存在时返回0"""
+        state = await self.get(token)
+        return state.use_times if state else 0
+
+    async def reserve(self, token: str) -> Optional[int]:
+        """
+        预留一次使用次数
+
+        Args:
+            token: token字符串
+
+        Returns:
+            预留后的剩余次数，次数不足或token不存在时返回None
+        """
+        if self.strict:
+            if not token_filter.might_exist(token):
+                return None
+            # 严格模式：带条件UPDATE直接写库，由数据库保证不超额
+            remaining = await reserve_usage_async(token)
+            if remaining is not None:
+                token_filter.record_lookup(token, True)
+            state = self._states.get(token)
+            if state is not None:
+                if remaining is None:
+                    self._states.pop(token, None)
+                else:
+                    state.db_use_times = remaining
+            return remaining
+
+        state = await self.get(token)
+        if state is None or state.use_times <= 0:
+            return None
+        self._add_pending(state, 1)
+        return state.use_times
+
+    async def release(self, token: str) -> Optional[int]:
+        """
+        归还一次预留的使用次数
+
+        Args:
+            token: token字符串
+
+        Returns:
+            归还后的剩余次数，token不存在时返回None
+        """
+        if self.strict:
+            remaining = await release_usage_async(token)
+            state = self._states.get(token)
+            if state is not None and remaining is not None:
+                state.db_use_times = remaining
+            return remaining
+
+        state = self._states.get(token)
+        if state is None:
+            # 条目已被清理（扣减已写回），直接在数据库中加回
+            return await release_usage_async(token)
+        # pending可能变为负数，写回时即为加回次数
+        self._add_pending(state, -1)
+        return state.use_times
+
+    async def consume(self, token: str) -> bool:
+        """
+        扣减一次使用次数
+
+        Args:
+            token: token字符串
+
+        Returns:
+            是否扣减成功（次数不足或token不存在时返回False）
+        """
+        return await self.reserve(token) is not None
+
+    def _add_pending(self, state: TokenState, delta: int):
+        if state.first_pending_at is None:
+            state.first_pending_at = time.monotonic()
+        state.pending += delta
+        self._ensure_flusher()
+
+    def invalidate(self, token: str):
+        """使缓存失效（未写回的扣减保留，下次读取时重新加载）"""
+        state = self._states.get(token)
+        if state is None:
+            return
+        if state.pending or state.flushing:
+            state.loaded_at = 0
+        else:
+            self._states.pop(token, None)
+
+    async def flush(self):
+        """把本地累计的扣减聚合后写回数据库"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batch = {}
+            for token, state in self._states.items():
+                if state.pending:
+                    state.flushing = state.pending
+                    state.pending = 0
+                    batch[token] = state
+            if not batch:
+                return
+
+            start = time.monotonic()
+            try:
+                failed = await apply_usage_deltas_async(
+                    {token: state.flushing for token, state in batch.items()}
+                )
+            except Exception as e:
+                # 写回失败：把增量放回pending，下次重试
+                self._flush_epoch += 1
+                self.flush_errors += 1
+                print(f"写回Token使用次数失败: {str(e)}")
+                for state in batch.values():
+                    state.pending += state.flushing
+                    state.flushing = 0
+                return
+
+            self._flush_epoch += 1
+            now = time.monotonic()
+            if failed:
+                self.flush_errors += 1
+            for token, state in batch.items():
+                if token in failed:
+                    state.pending += state.flushing
+                    state.flushing = 0
+                    continue
+                state.db_use_times -= state.flushing
+                state.flushing = 0
+                if state.pending == 0:
+                    state.first_pending_at = None
+            self.flush_total += 1
+            self.last_flush_at = now
+            self.last_flush_duration = now - start
+
+            # 清理过期且没有待写回数据的条目，控制内存
+            stale = [
+                token for token, state in self._states.items()
+                if not state.pending and not state.flushing and now - state.loaded_at > self.ttl
+            ]
+            for token in stale:
+                del self._states[token]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Token写回任务异常: {str(e)}")
+
+    def _ensure_flusher(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def close(self):
+        """停止后台任务并写回剩余的扣减"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存状态"""
+        now = time.monotonic()
+        pending_since = [s.first_pending_at for s in self._states.values() if s.first_pending_at is not None]
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._states),
+            "strict": self.strict,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "pending": sum(s.pending + s.flushing for s in self._states.values()),
+            "flush_lag_seconds": round(now - min(pending_since), 3) if pending_since else 0,
+            "flush_total": self.flush_total,
+            "flush_errors": self.flush_errors,
+            "last_flush_duration": round(self.last_flush_duration, 6),
+        }
+
+    def collect_metrics(self):
+        """导出指标"""
+        stats = self.stats()
+        return [
+            Metric("token_cache_size", "gauge", "缓存的token数", [({}, stats["size"])]),
+            Metric("token_cache_hits_total", "counter", "缓存命中次数", [({}, stats["hits"])]),
+            Metric("token_cache_misses_total", "counter", "缓存未命中次数", [({}, stats["misses"])]),
+            Metric("token_cache_hit_rate", "gauge", "缓存命中率", [({}, stats["hit_rate"])]),
+            Metric("token_cache_pending_decrements", "gauge", "本地已扣减、尚未写回数据库的次数", [({}, stats["pending"])]),
+            Metric("token_cache_flush_lag_seconds", "gauge", "最早一笔未写回扣减距今的秒数", [({}, stats["flush_lag_seconds"])]),
+            Metric("token_cache_flush_total", "counter", "写回成功次数", [({}, stats["flush_total"])]),
+            Metric("token_cache_flush_errors_total", "counter", "写回失败次数", [({}, stats["flush_errors"])]),
+            Metric("token_cache_last_flush_duration_seconds", "gauge", "最近一次写回耗时（秒）",
+                   [({}, stats["last_flush_duration"])]),
+        ]
+
+
+# 全局token状态缓存
+token_state_cache = TokenStateCache()
+metrics_registry.register(token_state_cache.collect_metrics)
@@ -0,0 +1,289 @@
+"""
+未知token的布隆过滤器（负缓存）
+
+启动时把所有有效token装入内存中的布隆过滤器，add_token时同步加入，
+其他进程新增的token按id增量同步，并定期全量重建（清除已删除的token）。
+过滤器中没有的token可能是其他进程刚新增、尚未同步的，不能直接判为不存在：第一次仍查询数据库，
+查到时加入过滤器，查不到时记入未命中缓存，TOKEN_FILTER_MISS_TTL 秒内同一token不再查库直接返回TOKEN_NOT_FOUND。
+判定"可能存在"时照常查库。过滤器尚未建好时所有token都视为可能存在。
+"""
+import asyncio
+import hashlib
+import math
+import os
+import threading
+import time
+from typing import Optional, Any, Dict
+
+from app.core.metrics import Metric, metrics_registry
+from app.models.async_database import AsyncTokenRepository
+
+# 是否启用
+ENABLE_TOKEN_FILTER = os.getenv("ENABLE_TOKEN_FILTER", "true").lower() == "true"
+# 目标误判率（不存在的token被判为可能存在、仍需查库的比例）
+TOKEN_FILTER_ERROR_RATE = float(os.getenv("TOKEN_FILTER_ERROR_RATE", "0.001"))
+# 最小容量（条）
+TOKEN_FILTER_MIN_CAPACITY = int(os.getenv("TOKEN_FILTER_MIN_CAPACITY", "10000"))
+# 增量同步其他进程新增token的间隔（秒）
+TOKEN_FILTER_REFRESH_INTERVAL = float(os.getenv("TOKEN_FILTER_REFRESH_INTERVAL", "5"))
+# 全量重建间隔（秒）
+TOKEN_FILTER_REBUILD_INTERVAL = float(os.getenv("TOKEN_FILTER_REBUILD_INTERVAL", "3600"))
+# 增量同步时重新扫描的最近id数：id较小的token可能晚于较大的id提交，只按 id > 已同步的最大id 读取会漏掉
+TOKEN_FILTER_REFRESH_OVERLAP = int(os.getenv("TOKEN_FILTER_REFRESH_OVERLAP", "1000"))
+# 过滤器中没有、数据库中也查不到的token在这段时间内（秒）不再查库
+TOKEN_FILTER_MISS_TTL = float(os.getenv("TOKEN_FILTER_MISS_TTL", "30"))
+# 未命中缓存最多保存的token数，超出时丢弃最早的
+TOKEN_FILTER_MISS_CACHE_SIZE = int(os.getenv("TOKEN_FILTER_MISS_CACHE_SIZE", "100000"))
+# 全量加载时每批读取的条数
+TOKEN_FILTER_LOAD_BATCH = 10000
+
+
+class BloomFilter:
+    """位数组 + 双重哈希的布隆过滤器"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+    def estimated_error_rate(self) -> float:
+        """按当前条数估算的误判率"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class TokenFilter:
+    """有效token的布隆过滤器，负责构建、增量同步与定期重建"""
+
+    def __init__(self, enabled: bool = ENABLE_TOKEN_FILTER, error_rate: float = TOKEN_FILTER_ERROR_RATE,
+                 min_capacity: int = TOKEN_FILTER_MIN_CAPACITY,
+                 refresh_interval: float = TOKEN_FILTER_REFRESH_INTERVAL,
+                 rebuild_interval: float = TOKEN_FILTER_REBUILD_INTERVAL,
+                 refresh_overlap: int = TOKEN_FILTER_REFRESH_OVERLAP,
+                 miss_ttl: float = TOKEN_FILTER_MISS_TTL, miss_cache_size: int = TOKEN_FILTER_MISS_CACHE_SIZE):
+        self.enabled = enabled
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.refresh_overlap = refresh_overlap
+        self.miss_ttl = miss_ttl
+        self.miss_cache_size = miss_cache_size
+        self._misses: Dict[str, float] = {}  # 已确认数据库中没有的token -> 确认时间（按插入顺序淘汰）
+        self._misses_lock = threading.Lock()  # 同步接口在线程池中调用
+        self._filter: Optional[BloomFilter] = None
+        self._last_id = 0
+        self._built_at: Optional[float] = None
+        self._rebuilding: Optional[list] = None  # 重建期间新增的token，重建完成后补进新过滤器
+        self._task: Optional[asyncio.Task] = None
+
+        # 指标
+        self.rejected = 0
+        self.passed = 0
+        self.fallthrough = 0
+        self.rebuilds = 0
+        self.refresh_errors = 0
+        self.last_build_duration = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self._filter is not None
+
+    def might_exist(self, token: str) -> bool:
+        """
+        判断token是否可能存在
+
+        参数:
+            token: token字符串
+        返回:
+            False表示过滤器中没有且最近已确认数据库中没有；过滤器未启用或未建好时返回True。
+            过滤器中没有但尚未确认时返回True，调用方查库后用 record_lookup 报告结果
+        """
+        current = self._filter
+        if current is None:
+            return True
+        if token in current:
+            self.passed += 1
+            return True
+        confirmed_at = self._misses.get(token)
+        if confirmed_at is not None and time.monotonic() - confirmed_at < self.miss_ttl:
+            self.rejected += 1
+            return False
+        self.fallthrough += 1
+        return True
+
+    def record_lookup(self, token: str, found: bool):
+        """
+        报告一次数据库查询的结果：查到时加入过滤器，过滤器中没有且查不到时记入未命中缓存
+
+        参数:
+            token: token字符串
+            found: 数据库中是否存在
+        """
+        current = self._filter
+        if current is None:
+            return
+        with self._misses_lock:
+            if found:
+                self._misses.pop(token, None)
+            elif token not in current:
+                self._misses.pop(token, None)
+                self._misses[token] = time.monotonic()
+                while len(self._misses) > self.miss_cache_size:
+                    del self._misses[next(iter(self._misses))]
+        if found and token not in current:
+            current.add(token)
+
+    def add(self, token: str):
+        """新增token后立即加入过滤器"""
+        with self._misses_lock:
+            self._misses.pop(token, None)
+        if self._filter is not None:
+            self._filter.add(token)
+        if self._rebuilding is not None:
+            self._rebuilding.append(token)
+
+    async def rebuild(self):
+        """从数据库全量构建新的过滤器并替换旧的"""
+        start = time.monotonic()
+        self._rebuilding = []
+        try:
+            rows = []
+            last_id = 0
+            while True:
+                batch = await AsyncTokenRepository.list_tokens_after(last_id, TOKEN_FILTER_LOAD_BATCH)
+                if not batch:
+                    break
+                rows.extend(row['token'] for row in batch)
+                last_id = batch[-1]['id']
+                if len(batch) < TOKEN_FILTER_LOAD_BATCH:
+                    break
+
+            # 预留一倍空间给之后新增的token
+            capacity = max(self.min_capacity, len(rows) * 2)
+            new_filter = BloomFilter(capacity, self.error_rate)
+            for token in rows:
+                new_filter.add(token)
+            for token in self._rebuilding:
+                new_filter.add(token)
+
+            self._filter = new_filter
+            self._last_id = max(self._last_id, last_id)
+            self._built_at = time.monotonic()
+            self.rebuilds += 1
+            self.last_build_duration = self._built_at - start
+        finally:
+            self._rebuilding = None
+
+    async def refresh(self):
+        """
+        增量加入其他进程新增的token（按自增id）；条数超过容量时全量重建
+
+        每次从已同步的最大id往前 refresh_overlap 个id开始读取，补上晚于更大id提交的token
+        （已在过滤器中的不重复计数）；落后更多的由定期全量重建补上
+        """
+        last_id = max(0, self._last_id - self.refresh_overlap)
+        while True:
+            batch = await AsyncTokenRepository.list_tokens_after(last_id, TOKEN_FILTER_LOAD_BATCH)
+            for row in batch:
+                if row['token'] not in self._filter:
+                    self._filter.add(row['token'])
+            if batch:
+                last_id = batch[-1]['id']
+                self._last_id = max(self._last_id, last_id)
+            if len(batch) < TOKEN_FILTER_LOAD_BATCH:
+                break
+        if self._filter.count > self._filter.capacity:
+            await self.rebuild()
+
+    async def _run(self):
+        while True:
+            try:
+                if not self.ready or time.monotonic() - self._built_at > self.rebuild_interval:
+                    await self.rebuild()
+                else:
+                    await self.refresh()
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"同步Token过滤器失败: {str(e)}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """启动构建与同步任务"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """停止同步任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """过滤器状态"""
+        current = self._filter
+        return {
+            "ready": current is not None,
+            "items": current.count if current else 0,
+            "capacity": current.capacity if current else 0,
+            "memory_bytes": current.memory_bytes if current else 0,
+            "num_hashes": current.num_hashes if current else 0,
+            "estimated_error_rate": round(current.estimated_error_rate(), 6) if current else 0,
+            "rejected": self.rejected,
+            "passed": self.passed,
+            "fallthrough": self.fallthrough,
+            "miss_cache_size": len(self._misses),
+            "rebuilds": self.rebuilds,
+            "refresh_errors": self.refresh_errors,
+            "last_build_duration": round(self.last_build_duration, 6),
+        }
+
+    def collect_metrics(self):
+        """导出指标"""
+        stats = self.stats()
+        return [
+            Metric("token_filter_items", "gauge", "过滤器中的token数", [({}, stats["items"])]),
+            Metric("token_filter_memory_bytes", "gauge", "过滤器位数组占用的内存（字节）", [({}, stats["memory_bytes"])]),
+            Metric("token_filter_estimated_error_rate", "gauge", "按当前条数估算的误判率",
+                   [({}, stats["estimated_error_rate"])]),
+            Metric("token_filter_rejected_total", "counter", "已确认不存在、未查询数据库的次数", [({}, stats["rejected"])]),
+            Metric("token_filter_passed_total", "counter", "判定可能存在、继续查询数据库的次数", [({}, stats["passed"])]),
+            Metric("token_filter_fallthrough_total", "counter", "过滤器中没有、仍查询数据库确认的次数",
+                   [({}, stats["fallthrough"])]),
+            Metric("token_filter_miss_cache_size", "gauge", "已确认不存在的token缓存数", [({}, stats["miss_cache_size"])]),
+            Metric("token_filter_rebuilds_total", "counter", "全量重建次数", [({}, stats["rebuilds"])]),
+            Metric("token_filter_refresh_errors_total", "counter", "同步失败次数", [({}, stats["refresh_errors"])]),
+            Metric("token_filter_last_build_duration_seconds", "gauge", "最近一次全量重建耗时（秒）",
+                   [({}, stats["last_build_duration"])]),
+        ]
+
+
+# 全局token过滤器
+token_filter = TokenFilter()
+metrics_registry.register(token_filter.collect_metrics)
@@ -1,47 +1,75 @@
+from typing import Optional
 from fastapi import HTTPException, Form
-from app.models.database import Database
+from app.services.token_cache_service import token_state_cache
+from app.services.token_shard_service import get_token_info, consume_usage
+from app.services.token_filter_service import token_filter
 from fastapi.responses import FileResponse, JSONResponse
 
 
 # 验证token
 
+def check_token_use_times(use_times):
+    """根据查询到的使用次数判断token状态，不存在或次数不足时抛出HTTPException"""
+    if use_times is None:
+        raise HTTPException(
+            status_code=401,
+            detail={
+                "errors": [{
+                    "message": "TOKEN_NOT_FOUND",
+                    "extensions": {
+                        "code": "FORBIDDEN",
+                    }
+                }]
+            }
+        )
+
+    if use_times <= 0:
+        raise HTTPException(
+            status_code=403,
+            detail={
+                "errors": [{
+                    "message": "TOKEN次數不夠",
+                    "extensions": {
+                        "code": "TOKEN_error",
+                    }
+                }]
+            }
+        )
+
+
+def token_system_error():
+    """Token验证系统错误"""
+    return HTTPException(
+        status_code=500,
+        detail={
+            "errors": [{
+                "message": "Token验证系统错误",
+                "extensions": {
+                    "code": "INTERNAL_ERROR",
+                }
+            }]
+        }
+    )
+
+
+def lookup_token_info(token: str):
+    """查询token信息：过滤器中没有且已确认不存在的token不查库，查询结果报告给过滤器"""
+    if not token_filter.might_exist(token):
+        return None
+    token_info = get_token_info(token)
+    token_filter.record_lookup(token, token_info is not None)
+    return token_info
+
+
 def verify_token(token: str = Form(...)):
     """验证用户的token是否有效，如果无效则抛出HTTPException"""
     try:
-        # 使用Database类连接MySQL
-        db = Database()
-
-        # 查询token是否存在及其使用次数
-        db.cursor.execute("SELECT use_times FROM tokens WHERE token=%s", (token,))
+        # 查询token是否存在及其使用次数（分片token为各分片之和），已确认不存在的token不查库
+        token_info = lookup_token_info(token)
         print("token:", token)
-        result = db.cursor.fetchone()
-        print("result:", result)
-
-        if not result:
-            raise HTTPException(
-                status_code=401,
-                detail={
-                    "errors": [{
-                        "message": "TOKEN_NOT_FOUND",
-                        "extensions": {
-                            "code": "FORBIDDEN",
-                        }
-                    }]
-                }
-            )
-
-        if result[0] <= 0:
-            raise HTTPException(
-                status_code=403,
-                detail={
-                    "errors": [{
-                        "message": "TOKEN次數不夠",
-                        "extensions": {
-                            "code": "TOKEN_error",
-                        }
-                    }]
-                }
-            )
+        print("result:", token_info)
+
+        check_token_use_times(token_info["use_times"] if token_info else None)
 
         return token
     except HTTPException:
@@ -49,35 +77,125 @@ def verify_token(token: str = Form(...)):
         raise
     except Exception as e:
         print(f"Token验证错误: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail={
-                "errors": [{
-                    "message": "Token验证系统错误",
-                    "extensions": {
-                        "code": "INTERNAL_ERROR",
-                    }
-                }]
-            }
-        )
+        raise token_system_error()
+
+
+async def verify_token_async(token: str):
+    """verify_token的异步版本，供请求处理路径使用"""
+    try:
+        # 优先读取进程内token状态缓存
+        state = await token_state_cache.get(token)
+        check_token_use_times(state.use_times if state else None)
+        return token
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Token验证错误: {str(e)}")
+        raise token_system_error()
 
 
 # 更新token使用次数
 def update_token_usage(token: str):
     """更新token的使用次数"""
     try:
-        # 使用Database类连接MySQL
-        db = Database()
+        # 更新使用次数（热点token随机扣减其中一个分片）
+        if consume_usage(token):
+            print(f"Token {token} 使用次数已更新")
+        else:
+            print(f"Token {token} 使用次数不足，未扣减")
+    except Exception as e:
+        print(f"更新Token使用次数错误: {str(e)}")
 
-        # 更新使用次数
-        db.cursor.execute("UPDATE tokens SET use_times = use_times - 1 WHERE token=%s", (token,))
-        db.conn.commit()
 
-        print(f"Token {token} 使用次数已更新")
+async def update_token_usage_async(token: str):
+    """update_token_usage的异步版本"""
+    try:
+        # 默认直接执行带条件的UPDATE；启用write-behind时先在本地扣减，由后台任务批量写回数据库
+        if await token_state_cache.consume(token):
+            print(f"Token {token} 使用次数已更新")
+        else:
+            print(f"Token {token} 使用次数不足，未扣减")
     except Exception as e:
         print(f"更新Token使用次数错误: {str(e)}")
 
 
+class QuotaReservation:
+    """一次请求预留的token使用次数"""
+
+    def __init__(self, token: str, remaining: int, center_id: Optional[str] = None):
+        self.token = token
+        self.remaining = remaining  # 预留后的剩余次数
+        self.center_id = center_id  # token所属的中心，记录日志时使用
+        self.committed = False
+        self.released = False
+
+    @property
+    def use_times(self) -> int:
+        """请求结束后的剩余次数：已确认时为预留后的次数，否则预留会被归还"""
+        return self.remaining if self.committed else self.remaining + 1
+
+
+async def reserve_quota(token: str) -> QuotaReservation:
+    """
+    原子地检查并预留一次使用次数，替代"先查询、成功后再扣减"的两步操作
+
+    参数:
+        token: token字符串
+    返回:
+        QuotaReservation
+    异常:
+        HTTPException: token不存在（401）、次数不足（403）或系统错误（500）
+    """
+    try:
+        remaining = await token_state_cache.reserve(token)
+        if remaining is None:
+            # 区分token不存在与次数不足
+            state = await token_state_cache.get(token)
+            check_token_use_times(state.use_times if state else None)
+            check_token_use_times(0)
+        state = await token_state_cache.get(token)
+        return QuotaReservation(token, remaining, state.center_id if state else None)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Token验证错误: {str(e)}")
+        raise token_system_error()
+
+
+async def get_token_center_id(token: str) -> Optional[str]:
+    """
+    token所属的中心（来自token缓存），用于预留失败时的日志
+
+    参数:
+        token: token字符串
+    返回:
+        中心ID，token不存在或查询失败时为None
+    """
+    try:
+        state = await token_state_cache.get(token)
+    except Exception as e:
+        print(f"获取Token中心错误: {str(e)}")
+        return None
+    return state.center_id if state else None
+
+
+async def commit_quota(reservation: QuotaReservation):
+    """确认预留：识别成功，本次使用次数正式扣除"""
+    reservation.committed = True
+    print(f"Token {reservation.token} 使用次数已更新")
+
+
+async def release_quota(reservation: QuotaReservation):
+    """归还预留：请求失败或未产生有效结果，不扣除使用次数"""
+    if reservation.committed or reservation.released:
+        return
+    reservation.released = True
+    try:
+        await token_state_cache.release(reservation.token)
+    except Exception as e:
+        print(f"归还Token使用次数错误: {str(e)}")
+
+
 def get_ip_prefix(ip: str) -> str:
     """获取 IP 地址的前三位（a.b.c）"""
     parts = ip.split(".")
@@ -89,17 +207,22 @@ def get_ip_prefix(ip: str) -> str:
 def get_token_use_times(token: str) -> int:
     """获取token的当前使用次数"""
     try:
-        # 使用Database类连接MySQL
-        db = Database()
-
         # 查询token的使用次数
-        db.cursor.execute("SELECT use_times FROM tokens WHERE token=%s", (token,))
-        result = db.cursor.fetchone()
+        token_info = lookup_token_info(token)
 
-        if result:
-            return result[0]
+        if token_info:
+            return token_info["use_times"]
         else:
             return 0
     except Exception as e:
         print(f"获取Token使用次数错误: {str(e)}")
         return 0
+
+
+async def get_token_use_times_async(token: str) -> int:
+    """get_token_use_times的异步版本"""
+    try:
+        return await token_state_cache.get_use_times(token)
+    except Exception as e:
+        print(f"获取Token使用次数错误: {str(e)}")
+        return 0
@@ -0,0 +1,227 @@
+"""
+热点token分片计数
+
+多台设备共用一个token时，每次扣减都更新 tokens 表的同一行，高并发下会在InnoDB行锁上排队。
+开启分片后，热点token的剩余次数分散到 token_usage_shards 的多行：扣减随机选一行，读取时求和，
+后台任务定期压缩（把 tokens 表上新增的次数并入分片并重新平均分配）。
+未分片的token仍然只读写 tokens 表，调用方无需区分。
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional, Any
+
+from app.core.metrics import Metric, metrics_registry
+from app.models.database import TokenRepository, TokenShardRepository
+from app.models.async_database import AsyncTokenRepository, AsyncTokenShardRepository
+
+# 是否启用分片计数
+ENABLE_TOKEN_SHARDING = os.getenv("ENABLE_TOKEN_SHARDING", "false").lower() == "true"
+# 每个热点token的分片数
+TOKEN_SHARD_COUNT = int(os.getenv("TOKEN_SHARD_COUNT", "8"))
+# 启动时需要分片的热点token，逗号分隔
+TOKEN_HOT_TOKENS = [t.strip() for t in os.getenv("TOKEN_HOT_TOKENS", "").split(",") if t.strip()]
+# 已分片token列表的刷新间隔（秒）
+TOKEN_SHARD_REFRESH_INTERVAL = float(os.getenv("TOKEN_SHARD_REFRESH_INTERVAL", "30"))
+# 分片压缩间隔（秒）
+TOKEN_SHARD_COMPACT_INTERVAL = float(os.getenv("TOKEN_SHARD_COMPACT_INTERVAL", "60"))
+
+
+class TokenShardRegistry:
+    """已分片token的进程内快照，定期从数据库刷新"""
+
+    def __init__(self, enabled: bool = ENABLE_TOKEN_SHARDING,
+                 refresh_interval: float = TOKEN_SHARD_REFRESH_INTERVAL,
+                 compact_interval: float = TOKEN_SHARD_COMPACT_INTERVAL):
+        self.enabled = enabled
+        self.refresh_interval = refresh_interval
+        self.compact_interval = compact_interval
+        self._shards: Dict[str, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._compact_task: Optional[asyncio.Task] = None
+
+        # 指标
+        self.compactions = 0
+        self.compact_errors = 0
+
+    def _begin_refresh(self) -> bool:
+        """快照过期时由一个调用方负责刷新，其余调用方继续使用旧快照"""
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded_at is not None and now - self._loaded_at <= self.refresh_interval:
+                return False
+            self._loaded_at = now
+            return True
+
+    def _replace(self, shards: Dict[str, int]):
+        with self._lock:
+            self._shards = shards
+            self._loaded_at = time.monotonic()
+
+    def shard_count(self, token: str) -> int:
+        """
+        获取token的分片数（同步路径）
+
+        参数:
+            token: token字符串
+        返回:
+            分片数，未分片时返回0
+        """
+        if not self.enabled:
+            return 0
+        if self._begin_refresh():
+            try:
+                self._replace(TokenShardRepository.list_sharded_tokens())
+            except Exception as e:
+                print(f"刷新Token分片列表失败: {str(e)}")
+        return self._shards.get(token, 0)
+
+    async def shard_count_async(self, token: str) -> int:
+        """shard_count的异步版本"""
+        if not self.enabled:
+            return 0
+        if self._begin_refresh():
+            try:
+                self._replace(await AsyncTokenShardRepository.list_sharded_tokens())
+            except Exception as e:
+                print(f"刷新Token分片列表失败: {str(e)}")
+        return self._shards.get(token, 0)
+
+    async def start(self, hot_tokens=None, shard_count: int = TOKEN_SHARD_COUNT):
+        """
+        建表、拆分配置的热点token并启动压缩任务
+
+        参数:
+            hot_tokens: 需要分片的token列表，默认取 TOKEN_HOT_TOKENS
+            shard_count: 分片数
+        """
+        if not self.enabled:
+            return
+        await AsyncTokenShardRepository.ensure_table()
+        for token in TOKEN_HOT_TOKENS if hot_tokens is None else hot_tokens:
+            if await AsyncTokenShardRepository.shard_token(token, shard_count):
+                print(f"Token {token} 已拆分为{shard_count}个分片")
+        self._replace(await AsyncTokenShardRepository.list_sharded_tokens())
+        if self._compact_task is None:
+            self._compact_task = asyncio.get_running_loop().create_task(self._compact_loop())
+
+    async def compact_all(self):
+        """压缩所有分片token"""
+        for token in list(self._shards):
+            try:
+                if await AsyncTokenShardRepository.compact(token):
+                    self.compactions += 1
+            except Exception as e:
+                self.compact_errors += 1
+                print(f"压缩Token分片失败: {token}, {str(e)}")
+
+    async def _compact_loop(self):
+        while True:
+            await asyncio.sleep(self.compact_interval)
+            await self.compact_all()
+
+    async def close(self):
+        """停止压缩任务"""
+        if self._compact_task is not None:
+            self._compact_task.cancel()
+            try:
+                await self._compact_task
+            except asyncio.CancelledError:
+                pass
+            self._compact_task = None
+
+    def collect_metrics(self):
+        """导出指标"""
+        return [
+            Metric("token_sharded_tokens", "gauge", "已分片的token数", [({}, len(self._shards))]),
+            Metric("token_shard_compactions_total", "counter", "分片压缩次数", [({}, self.compactions)]),
+            Metric("token_shard_compact_errors_total", "counter", "分片压缩失败次数", [({}, self.compact_errors)]),
+        ]
+
+
+# 全局分片注册表
+token_shard_registry = TokenShardRegistry()
+metrics_registry.register(token_shard_registry.collect_metrics)
+
+
+# 以下函数对分片与未分片的token统一处理，供token_fun与token缓存调用
+
+def get_token_info(token: str) -> Optional[Dict[str, Any]]:
+    """获取token信息，分片token的use_times为各分片之和"""
+    token_info = TokenRepository.get_token_info(token)
+    if token_info and token_shard_registry.shard_count(token):
+        total = TokenShardRepository.get_total_use_times(token)
+        token_info["use_times"] = total or 0
+    return token_info
+
+
+def consume_usage(token: str) -> bool:
+    """扣减一次使用次数，次数不足时返回False"""
+    shard_count = token_shard_registry.shard_count(token)
+    if shard_count:
+        return TokenShardRepository.decrement(token, shard_count)
+    return TokenRepository.update_token_usage(token)
+
+
+async def get_token_info_async(token: str) -> Optional[Dict[str, Any]]:
+    """get_token_info的异步版本"""
+    token_info = await AsyncTokenRepository.get_token_info(token)
+    if token_info and await token_shard_registry.shard_count_async(token):
+        total = await AsyncTokenShardRepository.get_total_use_times(token)
+        token_info["use_times"] = total or 0
+    return token_info
+
+
+async def reserve_usage_async(token: str) -> Optional[int]:
+    """预留一次使用次数，返回剩余次数，次数不足或token不存在时返回None"""
+    shard_count = await token_shard_registry.shard_count_async(token)
+    if not shard_count:
+        return await AsyncTokenRepository.reserve_usage(token)
+    if not await AsyncTokenShardRepository.decrement(token, shard_count):
+        return None
+    # 扣减事务提交、行锁释放之后再读取总数
+    return await AsyncTokenShardRepository.get_total_use_times(token) or 0
+
+
+async def release_usage_async(token: str) -> Optional[int]:
+    """归还一次使用次数，返回剩余次数，token不存在时返回None"""
+    shard_count = await token_shard_registry.shard_count_async(token)
+    if shard_count and await AsyncTokenShardRepository.increment(token, shard_count):
+        return await AsyncTokenShardRepository.get_total_use_times(token)
+    return await AsyncTokenRepository.release_usage(token)
+
+
+async def apply_usage_deltas_async(deltas: Dict[str, int]) -> Dict[str, int]:
+    """
+    批量写回多个token的扣减
+
+    参数:
+        deltas: {token: 扣减次数}，负数表示加回
+    返回:
+        写回失败的 {token: 扣减次数}；未分片token的批量UPDATE失败时直接抛出异常
+    """
+    plain = {}
+    sharded = {}
+    for token, delta in deltas.items():
+        shard_count = await token_shard_registry.shard_count_async(token)
+        if shard_count:
+            sharded[token] = (delta, shard_count)
+        else:
+            plain[token] = delta
+
+    if plain:
+        await AsyncTokenRepository.apply_usage_deltas(plain)
+
+    failed = {}
+    for token, (delta, shard_count) in sharded.items():
+        try:
+            if delta > 0:
+                await AsyncTokenShardRepository.apply_usage_delta(token, delta)
+            elif delta < 0:
+                await AsyncTokenShardRepository.increment(token, shard_count, -delta)
+        except Exception as e:
+            print(f"写回分片Token使用次数失败: {token}, {str(e)}")
+            failed[token] = delta
+    return failed
@@ -0,0 +1,85 @@
+"""
+上传文件读取：分块读取、边读边计数、边读边计算摘要
+"""
+import hashlib
+from typing import Tuple
+
+from fastapi import Request, UploadFile
+
+# 每次读取的块大小
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class FileTooLargeError(ValueError):
+    """上传文件超过大小限制"""
+
+    def __init__(self, size: int, max_size: int):
+        super().__init__(f"文件大小超过限制: {size} > {max_size}")
+        self.size = size
+        self.max_size = max_size
+
+
+async def read_upload_limited(file: UploadFile, max_size: int,
+                              chunk_size: int = UPLOAD_CHUNK_SIZE) -> Tuple[bytes, str]:
+    """
+    分块读取上传文件，超过大小限制立即中止，并同时计算SHA-256摘要
+
+    参数:
+        file: 上传的文件
+        max_size: 最大文件大小（字节）
+        chunk_size: 每次读取的块大小
+    返回:
+        (文件内容, SHA-256十六进制摘要)
+    异常:
+        FileTooLargeError: 文件超过大小限制
+    """
+    # multipart解析时已知文件大小的，无需读取即可拒绝
+    if file.size is not None and file.size > max_size:
+        raise FileTooLargeError(file.size, max_size)
+
+    hasher = hashlib.sha256()
+    chunks = []
+    total = 0
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_size:
+            raise FileTooLargeError(total, max_size)
+        hasher.update(chunk)
+        chunks.append(chunk)
+
+    return b"".join(chunks), hasher.hexdigest()
+
+
+async def read_request_body_limited(request: Request, max_size: int) -> Tuple[bytes, str]:
+    """
+    以流的方式读取原始请求体（不经过multipart解析），超过大小限制立即中止，
+    并同时计算SHA-256摘要
+
+    参数:
+        request: 请求对象，请求体即图像数据
+        max_size: 最大文件大小（字节）
+    返回:
+        (文件内容, SHA-256十六进制摘要)
+    异常:
+        FileTooLargeError: 请求体超过大小限制
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size:
+        raise FileTooLargeError(int(content_length), max_size)
+
+    hasher = hashlib.sha256()
+    chunks = []
+    total = 0
+    async for chunk in request.stream():
+        if not chunk:
+            continue
+        total += len(chunk)
+        if total > max_size:
+            raise FileTooLargeError(total, max_size)
+        hasher.update(chunk)
+        chunks.append(chunk)
+
+    return b"".join(chunks), hasher.hexdigest()
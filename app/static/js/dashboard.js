@@ -2,8 +2,14 @@
 let centerSuccessChart, deviceAnalysisChart, errorAnalysisChart, centerTimeTrendChart;
 let centerRankingTable, deviceAnalysisTable, errorAnalysisTable, rawDataTable, tokenUsageTable;
 let currentMonth = '';
-let currentRawData = []; // 存储当前的原始数据
+let rawDataMonth = ''; // 原始数据表格对应的月份
+let rawDataCursors = [null]; // 原始数据表格每一页的游标（第一页为null）
+let rawDataQueryKey = ''; // 生成上述游标时的月份/排序/筛选条件
+let rawDataTotal = 0; // 符合筛选条件的原始数据总条数
 let isInitialized = false; // 防止重复初始化
+let dashboardData = null; // 当前显示的统计数据（实时增量在此基础上累加）
+let liveEventSource = null; // 实时增量连接
+let liveReconnecting = false; // 连接断开过，重连后重新加载完整数据
 
 // 页面加载完成后初始化
 $(document).ready(function () {
@@ -49,6 +55,9 @@ async function initializePage() {
             loadDashboardData(currentMonth);
         });
 
+        // 订阅实时增量
+        startLiveUpdates();
+
         console.log('页面初始化完成');
 
         // 初始化完成后移除DataTables悬浮背景
@@ -152,6 +161,7 @@ async function handleMonthDataFallback(errorMessage) {
  */
 async function loadDashboardData(yearMonth) {
     console.log('开始加载仪表盘数据，月份:', yearMonth);
+    rawDataMonth = yearMonth; // 原始数据表格按页单独加载
     showLoading(); // 显示加载动画
 
     try {
@@ -200,8 +210,7 @@ function handleDataLoadFailure(errorMessage) {
         device_analysis: [],
         error_analysis: [],
         center_token_trends: [],         // 修改
-        token_comprehensive_stats: [],   // 修改
-        raw_data: []
+        token_comprehensive_stats: []    // 修改
     };
 
     try {
@@ -224,6 +233,8 @@ function handleDataLoadFailure(errorMessage) {
  * @param {object} data - 仪表盘数据对象。
  */
 function updateDashboard(data) {
+    dashboardData = data;
+
     // 更新统计卡片数据
     $('#totalRequests').text(data.total_requests.toLocaleString()); // 总请求数
     $('#successRate').text(data.success_rate_overall + '%'); // 总体成功率
@@ -240,10 +251,147 @@ function updateDashboard(data) {
     updateCenterRankingTable(data.center_ranking, data.center_stats); // 更新中心排名表格
     updateDeviceAnalysisTable(data.device_analysis); // 更新设备分析表格
     updateErrorAnalysisTable(data.error_analysis); // 更新错误分析表格
-    updateRawDataTable(data.raw_data); // 更新原始数据表格
+    updateRawDataTable(); // 重新加载原始数据表格（分页向后端请求）
     updateTokenUsageTable(data.token_comprehensive_stats); // 更新Token综合统计表格
 }
 
+/**
+ * 订阅 /dashboard/events 的实时增量（Server-Sent Events）。
+ */
+function startLiveUpdates() {
+    if (!window.EventSource || liveEventSource) {
+        return;
+    }
+    liveEventSource = new EventSource('/dashboard/events');
+    liveEventSource.addEventListener('delta', function (event) {
+        try {
+            applyDashboardDelta(JSON.parse(event.data));
+        } catch (error) {
+            console.error('应用实时增量失败:', error);
+        }
+    });
+    liveEventSource.onopen = function () {
+        // 断开期间的增量已经丢失，重连后重新加载当前月份
+        if (liveReconnecting && rawDataMonth) {
+            liveReconnecting = false;
+            loadDashboardData(rawDataMonth);
+        }
+    };
+    liveEventSource.onerror = function () {
+        // 浏览器会自动重连
+        liveReconnecting = true;
+    };
+}
+
+/**
+ * 把一条实时增量累加到当前显示的统计上，并原地更新统计卡片和图表。
+ * 只累加正在查看的月份；表格在重新加载月份时更新。
+ * @param {object} delta - 增量数据。
+ */
+function applyDashboardDelta(delta) {
+    const data = dashboardData;
+    if (!data || delta.year_month !== rawDataMonth || !delta.total_requests) {
+        return;
+    }
+    const rate = (success, total) => total ? Math.round(success / total * 10000) / 100 : 0;
+
+    // 1. 总体
+    const processingTimeCount = data.processing_time_count || 0;
+    const processingTimeSum = processingTimeCount ? data.avg_processing_time * processingTimeCount : 0;
+    data.total_requests += delta.total_requests;
+    data.success_count = (data.success_count || 0) + delta.success_count;
+    data.success_rate_overall = rate(data.success_count, data.total_requests);
+    data.processing_time_count = processingTimeCount + delta.processing_time_count;
+    if (data.processing_time_count) {
+        data.avg_processing_time = Math.round(
+            (processingTimeSum + delta.processing_time_sum) / data.processing_time_count * 1000) / 1000;
+    }
+
+    // 2. 各中心
+    Object.entries(delta.centers).forEach(([centerId, counts]) => {
+        let center = data.center_stats.find(item => item.center_id === centerId);
+        if (!center) {
+            center = {center_id: centerId, total_requests: 0, success_count: 0, failed_count: 0, success_rate: 0};
+            data.center_stats.push(center);
+        }
+        center.total_requests += counts.total_requests;
+        center.success_count += counts.success_count;
+        center.failed_count += counts.failed_count;
+        center.success_rate = rate(center.success_count, center.total_requests);
+    });
+    data.center_stats.sort((a, b) => b.total_requests - a.total_requests);
+    data.center_ranking = data.center_stats
+        .filter(center => center.success_count > 0)
+        .sort((a, b) => b.success_count - a.success_count)
+        .map((center, index) => ({rank: index + 1, center_id: center.center_id, success_count: center.success_count}));
+
+    // 3. 设备类型
+    Object.entries(delta.devices).forEach(([deviceType, counts]) => {
+        let device = data.device_analysis.find(item => item.device_type === deviceType);
+        if (!device) {
+            device = {device_type: deviceType, total_requests: 0, success_count: 0, success_rate: 0,
+                avg_processing_time: 0, processing_time_count: 0};
+            data.device_analysis.push(device);
+        }
+        const deviceTimeCount = device.processing_time_count || 0;
+        const deviceTimeSum = deviceTimeCount ? device.avg_processing_time * deviceTimeCount : 0;
+        device.total_requests += counts.total_requests;
+        device.success_count += counts.success_count;
+        device.success_rate = rate(device.success_count, device.total_requests);
+        device.processing_time_count = deviceTimeCount + counts.processing_time_count;
+        if (device.processing_time_count) {
+            device.avg_processing_time = Math.round(
+                (deviceTimeSum + counts.processing_time_sum) / device.processing_time_count * 1000) / 1000;
+        }
+    });
+
+    // 4. 失败原因
+    Object.entries(delta.errors).forEach(([key, counts]) => {
+        let error = data.error_analysis.find(item => (item.error_code || item.error_message) === key);
+        if (!error) {
+            error = {error_code: counts.error_code, error_message: counts.error_message, count: 0, percentage: 0};
+            data.error_analysis.push(error);
+        }
+        error.count += counts.count;
+    });
+    const failedTotal = data.error_analysis.reduce((sum, error) => sum + error.count, 0);
+    data.error_analysis.forEach(error => {
+        error.percentage = rate(error.count, failedTotal);
+    });
+    data.error_analysis.sort((a, b) => b.count - a.count);
+
+    // 更新统计卡片
+    $('#totalRequests').text(data.total_requests.toLocaleString());
+    $('#successRate').text(data.success_rate_overall + '%');
+    $('#avgProcessingTime').text(data.avg_processing_time + 's');
+    $('#totalCenters').text(data.center_stats.length);
+
+    // 原地更新图表（不重建，避免每次增量都重新播放动画）
+    refreshChart(centerSuccessChart, data.center_stats.map(center => center.center_id),
+        data.center_stats.map(center => center.success_rate), () => updateCenterSuccessChart(data.center_stats));
+    refreshChart(deviceAnalysisChart, data.device_analysis.map(device => device.device_type || 'Unknown'),
+        data.device_analysis.map(device => device.total_requests), () => updateDeviceAnalysisChart(data.device_analysis));
+    refreshChart(errorAnalysisChart, data.error_analysis.map(error => error.error_message.substring(0, 20) + '...'),
+        data.error_analysis.map(error => error.count), () => updateErrorAnalysisChart(data.error_analysis));
+}
+
+/**
+ * 替换图表的标签和数据并无动画重绘；图表尚未创建（之前没有数据）时调用 create 创建。
+ * @param {object} chart - Chart.js 图表实例。
+ * @param {Array} labels - 标签。
+ * @param {Array} values - 第一个数据集的数据。
+ * @param {function} create - 创建图表的函数。
+ */
+function refreshChart(chart, labels, values, create) {
+    if (!chart) {
+        create();
+        return;
+    }
+    chart.data.labels = labels;
+    chart.data.datasets[0].data = values;
+    chart.update('none');
+}
+
 /**
  * 更新中心成功率柱状图。
  * @param {Array} centerStats - 中心统计数据数组。
@@ -292,6 +440,7 @@ function updateDeviceAnalysisChart(deviceAnalysis) {
     // 如果图表已存在，则销毁它
     if (deviceAnalysisChart) {
         deviceAnalysisChart.destroy();
+        deviceAnalysisChart = null;
     }
 
     // 如果没有设备数据，则显示提示信息并返回
@@ -339,6 +488,7 @@ function updateErrorAnalysisChart(errorAnalysis) {
     // 如果图表已存在，则销毁它
     if (errorAnalysisChart) {
         errorAnalysisChart.destroy();
+        errorAnalysisChart = null;
     }
 
     // 如果没有错误数据，则显示提示信息并返回
@@ -687,60 +837,139 @@ function updateErrorAnalysisTable(errorAnalysis) {
 }
 
 /**
- * 更新原始数据表格。
- * @param {Array} rawData - 原始数据数组。
+ * 原始数据表格按列序号对应的后端排序列（其余列不可排序）。
+ */
+const RAW_DATA_SORT_COLUMNS = {1: 'timestamp', 9: 'file_size', 11: 'processing_time'};
+
+/**
+ * 读取原始数据表格上方的筛选条件。
+ * @returns {object} 非空的筛选条件。
  */
-function updateRawDataTable(rawData) {
+function getRawDataFilters() {
+    const filters = {};
+    ['center_id', 'token', 'status', 'device_type', 'error_code'].forEach(name => {
+        const value = ($(`#rawFilter_${name}`).val() || '').trim();
+        if (value) {
+            filters[name] = value;
+        }
+    });
+    return filters;
+}
+
+/**
+ * 从 /dashboard/logs 获取一页原始数据（键集分页：每页保存下一页的游标）。
+ * @param {object} request - DataTables 服务端模式的请求参数。
+ * @param {function} callback - 把结果交给 DataTables 绘制。
+ */
+async function fetchRawDataPage(request, callback) {
+    const orderSpec = request.order && request.order.length ? request.order[0] : {column: 1, dir: 'desc'};
+    const sort = RAW_DATA_SORT_COLUMNS[orderSpec.column] || 'timestamp';
+    const order = orderSpec.dir === 'asc' ? 'asc' : 'desc';
+    const filters = getRawDataFilters();
+
+    // 月份、排序、筛选或每页条数变化时游标失效，从第一页重新开始
+    const queryKey = JSON.stringify([rawDataMonth, sort, order, filters, request.length]);
+    if (queryKey !== rawDataQueryKey) {
+        rawDataQueryKey = queryKey;
+        rawDataCursors = [null];
+        rawDataTotal = 0;
+    }
+    let page = Math.floor(request.start / request.length);
+    if (page >= rawDataCursors.length) {
+        page = rawDataCursors.length - 1;
+    }
+
+    const params = new URLSearchParams({year_month: rawDataMonth, limit: request.length, sort, order, ...filters});
+    if (rawDataCursors[page]) {
+        params.set('cursor', rawDataCursors[page]);
+    } else {
+        params.set('with_total', 'true');
+    }
+
     try {
-        // 存储原始数据到全局变量
-        currentRawData = rawData;
+        const response = await fetch(`/dashboard/logs?${params}`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+        }
+        const result = await response.json();
+        const data = result.data;
+        if (data.total !== null && data.total !== undefined) {
+            rawDataTotal = data.total;
+        }
+        rawDataCursors.length = page + 1;
+        if (data.next_cursor) {
+            rawDataCursors.push(data.next_cursor);
+        }
+        callback({
+            draw: request.draw,
+            data: data.rows,
+            recordsTotal: rawDataTotal,
+            recordsFiltered: rawDataTotal
+        });
+    } catch (error) {
+        console.error('获取原始数据失败:', error);
+        callback({draw: request.draw, data: [], recordsTotal: 0, recordsFiltered: 0});
+    }
+}
 
+/**
+ * 更新原始数据表格：表格按页向后端请求数据，月份变化时回到第一页重新加载。
+ */
+function updateRawDataTable() {
+    try {
         // 确保表格元素存在
         if (!$('#rawDataTable').length) {
             console.warn('原始数据表格元素不存在');
             return;
         }
 
-        // 如果表格已存在，则销毁它
         if (rawDataTable && $.fn.dataTable.isDataTable('#rawDataTable')) {
-            rawDataTable.destroy();
-            rawDataTable = null;
+            rawDataTable.ajax.reload();
+            return;
         }
 
-        $('#rawDataTable tbody').empty(); // 清空表格体
-        // 遍历原始数据，并添加到表格中
-        rawData.forEach(item => {
-            $('#rawDataTable tbody').append(`
-                <tr>
-                    <td class="number-cell">${item.id || 'N/A'}</td>
-                    <td>${new Date(item.timestamp).toLocaleString()}</td>
-                    <td>${item.client_ip || 'N/A'}</td>
-                    <td>${item.token || 'N/A'}</td>
-                    <td>${item.api_endpoint || 'N/A'}</td>
-                    <td>${item.center_id || 'N/A'}</td>
-                    <td>${item.device_type || 'N/A'}</td>
-                    <td>${item.file_upload_id || 'N/A'}</td>
-                    <td>${item.file_name || 'N/A'}</td>
-                    <td class="number-cell">${item.file_size ? item.file_size.toLocaleString() : 'N/A'}</td>
-                    <td><span class="badge ${getStatusBadgeClass(item.status)}">${item.status}</span></td>
-                    <td class="number-cell">${item.processing_time || 'N/A'}</td>
-                    <td class="number-cell">${item.ai_usage || 0}</td>
-                    <td class="number-cell">${item.remaining_times || 0}</td>
-                    <td class="number-cell">${item.original_times || 0}</td>
-                    <td>${item.error_message ? item.error_message.substring(0, 50) + (item.error_message.length > 50 ? '...' : '') : 'N/A'}</td>
-                    <td>${item.error_code || 'N/A'}</td>
-                </tr>
-            `);
-        });
+        const text = data => data === null || data === undefined || data === '' ? 'N/A' : data;
 
-        // 初始化或重新初始化DataTable
+        // 初始化DataTable（服务端分页）
         rawDataTable = $('#rawDataTable').DataTable({
+            serverSide: true,
+            processing: true,
+            searching: false, // 使用表格上方的筛选条件
+            pagingType: 'simple', // 键集分页只能逐页前后翻
             pageLength: 10, // 每页显示10条记录
             order: [[1, 'desc']], // 默认按时间列降序排序
             scrollX: true, // 启用水平滚动
-            // language: {
-            //     url: 'https://cdn.datatables.net/plug-ins/1.13.1/i18n/zh.json' // 设置中文语言包
-            // },
+            ajax: fetchRawDataPage,
+            columns: [
+                {data: 'id', render: text},
+                {data: 'timestamp', render: data => data ? new Date(data).toLocaleString() : 'N/A'},
+                {data: 'client_ip', render: text},
+                {data: 'token', render: text},
+                {data: 'api_endpoint', render: text},
+                {data: 'center_id', render: text},
+                {data: 'device_type', render: text},
+                {data: 'file_upload_id', render: text},
+                {data: 'file_name', render: text},
+                {data: 'file_size', render: data => data ? data.toLocaleString() : 'N/A'},
+                {
+                    data: 'status',
+                    render: data => `<span class="badge ${getStatusBadgeClass(data)}">${data}</span>`
+                },
+                {data: 'processing_time', render: text},
+                {data: 'ai_usage', render: data => data || 0},
+                {data: 'remaining_times', render: data => data || 0},
+                {data: 'original_times', render: data => data || 0},
+                {
+                    data: 'error_message',
+                    render: function (data, type, row) {
+                        if (type === 'display' && data) {
+                            return `<span title="${data}">${data.substring(0, 30)}${data.length > 30 ? '...' : ''}</span>`;
+                        }
+                        return text(data);
+                    }
+                },
+                {data: 'error_code', render: text}
+            ],
             columnDefs: [
                 {targets: [0], width: '60px', className: 'number-cell'},        // ID列
                 {targets: [1], width: '150px'},       // 时间列
@@ -759,85 +988,29 @@ function updateRawDataTable(rawData) {
                 {targets: [14], width: '80px', className: 'number-cell'},       // 原始次数列
                 {targets: [15], width: '120px'},      // 错误信息列
                 {targets: [16], width: '80px'},      // 错误代码列
-                {
-                    targets: [15], // 错误信息列
-                    render: function (data, type, row) {
-                        if (type === 'display' && data && data !== 'N/A') {
-                            return `<span title="${data}">${data.substring(0, 30)}${data.length > 30 ? '...' : ''}</span>`;
-                        }
-                        return data;
-                    }
-                }
-            ],
-            drawCallback: function () {
-                // 每次重绘后移除悬浮背景
-                // removeDataTablesHoverBackground();
-            }
+                {targets: [0, 2, 3, 4, 5, 6, 7, 8, 10, 12, 13, 14, 15, 16], orderable: false} // 后端只支持按时间、文件大小、处理时间排序
+            ]
         });
 
-        // 立即移除悬浮背景
-        // removeDataTablesHoverBackground();
+        // 筛选条件变化时回到第一页重新加载
+        $('.raw-data-filter').off('change').on('change', function () {
+            rawDataTable.ajax.reload();
+        });
 
-        // 绑定自定义导出按钮事件
+        // 绑定导出按钮事件：由后端流式导出整月日志（按中心筛选时只导出该中心）
         $('#exportCsvBtn').off('click').on('click', function () {
-            exportTableToCSV(currentRawData, 'OCR_原始数据');
+            const params = new URLSearchParams({year_month: rawDataMonth, format: 'csv'});
+            const centerId = getRawDataFilters().center_id;
+            if (centerId) {
+                params.set('center_id', centerId);
+            }
+            window.location.href = `/dashboard/export?${params}`;
         });
     } catch (error) {
         console.error('更新原始数据表格失败:', error);
     }
 }
 
-/**
- * 自定义CSV导出函数
- * @param {Array} data - 要导出的数据
- * @param {String} filename - 文件名
- */
-function exportTableToCSV(data, filename) {
-    // CSV头部
-    const csvHeaders = [
-        'ID', '時間', '客戶端IP', 'Token', 'API端點', '中心ID',
-        '裝置類型', '檔案上傳ID', '檔案名稱', '檔案大小(B)', '狀態',
-        '處理時間(s)', 'AI使用量', '剩餘次數', '原始次數', '錯誤訊息', '錯誤代碼'
-    ];
-
-    // 构建CSV内容
-    let csvContent = csvHeaders.join(',') + '\n';
-
-    data.forEach(item => {
-        const row = [
-            item.id || '',
-            new Date(item.timestamp).toLocaleString(),
-            item.client_ip || '',
-            item.token || '',
-            item.api_endpoint || '',
-            item.center_id || '',
-            item.device_type || '',
-            item.file_upload_id || '',
-            item.file_name || '',
-            item.file_size || '',
-            item.status || '',
-            item.processing_time || '',
-            item.ai_usage || 0,
-            item.remaining_times || 0,
-            item.original_times || 0,
-            item.error_message ? `"${item.error_message.replace(/"/g, '""')}"` : '',
-            item.error_code || ''
-        ];
-        csvContent += row.join(',') + '\n';
-    });
-
-    // 创建下载链接
-    const blob = new Blob(['\ufeff' + csvContent], {type: 'text/csv;charset=utf-8;'});
-    const link = document.createElement('a');
-    const url = URL.createObjectURL(blob);
-    link.setAttribute('href', url);
-    link.setAttribute('download', `${filename}_${new Date().toISOString().split('T')[0]}.csv`);
-    link.style.visibility = 'hidden';
-    document.body.appendChild(link);
-    link.click();
-    document.body.removeChild(link);
-}
-
 /**
  * 根据状态获取对应的徽章CSS类。
  * @param {string} status - 状态字符串（success, failed, not_relevant等）。
@@ -0,0 +1,92 @@
+"""
+Dashboard统计的计算耗时（不含数据库查询）
+
+生成一个月的模拟日志，分别测量：
+- raw:    每条日志一行（汇总表尚未建立时的路径），含转换为表格的耗时
+- rollup: 同样的日志先按小时和维度汇总（api_log_rollup_hourly 的形状），再做统计
+
+用法:
+    python -m benchmarks.bench_dashboard_analysis [--rows 1000000] [--centers 200] [--tokens 20000]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--centers", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def make_rows(rows: int, centers: int, tokens: int, seed: int):
+    rng = np.random.default_rng(seed)
+    status = rng.choice(["success", "failed", "error"], size=rows, p=[0.85, 0.12, 0.03])
+    codes = np.array(["IMG_QUALITY_ERROR", "OCR_error", "TOKEN_error"])
+    error_code = np.where(status == "success", None, codes[rng.integers(0, len(codes), rows)])
+    processing_time = np.round(rng.gamma(4.0, 0.7, rows), 3).astype(object)
+    processing_time[status != "success"] = None
+    df = pd.DataFrame({
+        "timestamp": pd.Timestamp("2025-03-01") + pd.to_timedelta(rng.integers(0, 31 * 86400, rows), unit="s"),
+        "center_id": np.char.add("center", rng.integers(0, centers, rows).astype(str)),
+        "token": np.char.add("tok", rng.zipf(1.3, rows).clip(max=tokens).astype(str)),
+        "device_type": rng.choice(["blood_pressure", "blood_glucose"], size=rows),
+        "status": status,
+        "error_code": error_code,
+        "error_message": error_code,
+        "processing_time": processing_time,
+        "repeat_count": 1,
+    })
+    return df.to_dict("records")
+
+
+def main():
+    args = parse_args()
+
+    from app.services.dashboard_service import (
+        DIMENSION_COLUMNS, analyze_requests, frame_from_raw_rows, frame_from_rollup_rows
+    )
+
+    start = time.perf_counter()
+    rows = make_rows(args.rows, args.centers, args.tokens, args.seed)
+    print(f"生成 {len(rows)} 条模拟日志，耗时 {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    raw_frame = frame_from_raw_rows(rows)
+    frame_time = time.perf_counter() - start
+    start = time.perf_counter()
+    raw_result = analyze_requests(raw_frame)
+    analysis_time = time.perf_counter() - start
+    print(f"raw     转换 {frame_time:>6.2f}s   统计 {analysis_time:>6.2f}s   ({len(raw_frame)} 行)")
+
+    # 按小时和维度汇总，得到与汇总表相同形状的行
+    keys = ["bucket", *DIMENSION_COLUMNS]
+    rollup = (raw_frame.fillna({column: "" for column in DIMENSION_COLUMNS})
+              .groupby(keys, sort=False)[["request_count", "processing_time_count", "processing_time_sum"]]
+              .sum().reset_index())
+    rollup["bucket"] = rollup["bucket"].dt.strftime("%Y-%m-%d %H:00:00")
+    for column in DIMENSION_COLUMNS:
+        rollup[column] = rollup[column].replace("", None)
+    rollup_rows = rollup.to_dict("records")
+
+    start = time.perf_counter()
+    rollup_frame = frame_from_rollup_rows(rollup_rows)
+    frame_time = time.perf_counter() - start
+    start = time.perf_counter()
+    rollup_result = analyze_requests(rollup_frame)
+    analysis_time = time.perf_counter() - start
+    print(f"rollup  转换 {frame_time:>6.2f}s   统计 {analysis_time:>6.2f}s   ({len(rollup_frame)} 行)")
+
+    assert rollup_result["total_requests"] == raw_result["total_requests"]
+    assert rollup_result["center_stats"] == raw_result["center_stats"]
+    print(f"中心 {len(raw_result['center_stats'])} 个，"
+          f"token统计 {len(raw_result['token_comprehensive_stats'])} 个，结果一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Dashboard按月查询：DATE_FORMAT(timestamp) 比较与 timestamp 范围比较对比，分别在建复合索引前后测量
+
+在临时表 api_logs_bench（结构同 api_logs）中写入模拟日志，依次测量：
+- month:  某个月的请求数（DATE_FORMAT(a.timestamp, '%Y-%m') = ? 与 timestamp >= ? AND timestamp < ?）
+- months: 有数据的月份列表（DISTINCT DATE_FORMAT 与沿索引逐月跳跃查找）
+需要本地MySQL（连接参数同 .env 中的 DB_*），结束后删除临时表（--keep 保留，下次跳过写入）。
+
+用法:
+    python -m benchmarks.bench_dashboard_queries [--rows 2000000] [--months 24] [--repeat 3] [--keep]
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+TABLE = "api_logs_bench"
+ENDPOINT = "/upload/image"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--months", type=int, default=24, help="模拟数据覆盖的月份数")
+    parser.add_argument("--repeat", type=int, default=3, help="每个查询重复次数（取中位数）")
+    parser.add_argument("--batch", type=int, default=10_000, help="写入时每批的行数")
+    parser.add_argument("--keep", action="store_true", help="保留临时表")
+    return parser.parse_args()
+
+
+def seed(cursor, rows: int, months: int, batch: int):
+    endpoints = [ENDPOINT] * 8 + ["/upload/add_token", "/upload/image/raw"]
+    statuses = ["success"] * 9 + ["failed"]
+    centers = [f"center{i}" for i in range(50)]
+    end = datetime.now().replace(microsecond=0)
+    span = int(timedelta(days=30 * months).total_seconds())
+    start = time.perf_counter()
+    for offset in range(0, rows, batch):
+        values = [
+            (
+                end - timedelta(seconds=random.randrange(span)),
+                f"10.0.{random.randrange(256)}.{random.randrange(256)}",
+                f"tok{random.randrange(20000)}",
+                random.choice(endpoints),
+                random.choice(statuses),
+                random.choice(centers),
+            )
+            for _ in range(min(batch, rows - offset))
+        ]
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (timestamp, client_ip, token, api_endpoint, status, center_id) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            values
+        )
+        cursor.connection.commit()
+    print(f"写入 {rows} 行，耗时 {time.perf_counter() - start:.1f}s")
+
+
+def timed(fn, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def month_by_format(cursor, year_month):
+    cursor.execute(
+        f"SELECT COUNT(*) AS n FROM {TABLE} a WHERE a.api_endpoint = %s AND DATE_FORMAT(a.timestamp, %s) = %s",
+        (ENDPOINT, '%Y-%m', year_month)
+    )
+    return cursor.fetchone()['n']
+
+
+def month_by_range(cursor, year_month):
+    from app.models.database import month_range
+    start, end = month_range(year_month)
+    cursor.execute(
+        f"SELECT COUNT(*) AS n FROM {TABLE} a WHERE a.api_endpoint = %s AND a.timestamp >= %s AND a.timestamp < %s",
+        (ENDPOINT, start, end)
+    )
+    return cursor.fetchone()['n']
+
+
+def months_by_format(cursor):
+    cursor.execute(
+        f"SELECT DISTINCT DATE_FORMAT(timestamp, %s) AS ym FROM {TABLE} WHERE api_endpoint = %s ORDER BY ym DESC",
+        ('%Y-%m', ENDPOINT)
+    )
+    return [row['ym'] for row in cursor.fetchall()]
+
+
+def months_by_skip_scan(cursor):
+    from app.models.database import month_range
+    months = []
+    next_start = datetime(1970, 1, 1)
+    while True:
+        cursor.execute(
+            f"SELECT timestamp FROM {TABLE} WHERE api_endpoint = %s AND timestamp >= %s ORDER BY timestamp LIMIT 1",
+            (ENDPOINT, next_start)
+        )
+        row = cursor.fetchone()
+        if not row:
+            break
+        year_month = row['timestamp'].strftime('%Y-%m')
+        months.append(year_month)
+        next_start = month_range(year_month)[1]
+    return months[::-1]
+
+
+def measure(cursor, label: str, year_month: str, repeat: int):
+    results = [
+        ("month  DATE_FORMAT", timed(lambda: month_by_format(cursor, year_month), repeat)),
+        ("month  range", timed(lambda: month_by_range(cursor, year_month), repeat)),
+        ("months DISTINCT", timed(lambda: months_by_format(cursor), repeat)),
+        ("months skip scan", timed(lambda: months_by_skip_scan(cursor), repeat)),
+    ]
+    assert month_by_format(cursor, year_month) == month_by_range(cursor, year_month)
+    assert months_by_format(cursor) == months_by_skip_scan(cursor)
+    print(f"[{label}]")
+    for name, duration in results:
+        print(f"  {name:<20} {duration * 1000:>10.1f} ms")
+
+
+def main():
+    args = parse_args()
+
+    from app.db.database import db_session
+    from app.db.migrations import API_LOG_INDEXES
+
+    with db_session.get_cursor() as cursor:
+        cursor.execute("SHOW TABLES LIKE %s", (TABLE,))
+        if not cursor.fetchone():
+            cursor.execute(f"CREATE TABLE {TABLE} LIKE api_logs")
+            seed(cursor, args.rows, args.months, args.batch)
+        cursor.execute(f"ANALYZE TABLE {TABLE}")
+        cursor.fetchall()
+
+    try:
+        year_month = (datetime.now().replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+        with db_session.get_cursor() as cursor:
+            cursor.execute(f"SHOW INDEX FROM {TABLE}")
+            existing = {row['Key_name'] for row in cursor.fetchall()}
+            drops = [f"DROP INDEX {name}" for name in API_LOG_INDEXES if name in existing]
+            if drops:
+                cursor.execute(f"ALTER TABLE {TABLE} {', '.join(drops)}")
+            measure(cursor, "无复合索引", year_month, args.repeat)
+
+            start = time.perf_counter()
+            cursor.execute(f"ALTER TABLE {TABLE} " + ", ".join(
+                f"ADD INDEX {name} ({', '.join(columns)})" for name, columns in API_LOG_INDEXES.items()
+            ))
+            print(f"建索引耗时 {time.perf_counter() - start:.1f}s")
+            measure(cursor, "有复合索引", year_month, args.repeat)
+    finally:
+        if not args.keep:
+            with db_session.get_cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+if __name__ == "__main__":
+    main()
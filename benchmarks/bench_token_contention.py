@@ -0,0 +1,86 @@
+"""
+热点token扣减的行锁竞争：单行 tokens.use_times 与分片计数（token_usage_shards）对比
+
+多个线程同时扣减同一个token，统计吞吐量与单次扣减的延迟分位数。
+需要本地MySQL（连接参数同 .env 中的 DB_*），运行时会创建一个临时token，结束后删除。
+
+用法:
+    python -m benchmarks.bench_token_contention [--threads 32] [--ops 200] [--shards 8] [--center bench]
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+import uuid
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--ops", type=int, default=200, help="每个线程的扣减次数")
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--center", default="bench", help="临时token所属的中心ID")
+    return parser.parse_args()
+
+
+def run(label: str, threads: int, ops: int, decrement):
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        local = []
+        barrier.wait()
+        for _ in range(ops):
+            start = time.perf_counter()
+            decrement()
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:<8} {len(latencies) / elapsed:>10.0f} ops/s   "
+          f"p50 {statistics.median(latencies) * 1000:>7.2f} ms   p99 {p99 * 1000:>7.2f} ms")
+
+
+def main():
+    args = parse_args()
+    # 每个线程一个连接，避免测到的是连接池排队
+    os.environ.setdefault("DB_POOL_SIZE", str(args.threads + 2))
+
+    from app.db.database import db_session
+    from app.models.database import CenterRepository, TokenRepository, TokenShardRepository
+
+    total = args.threads * args.ops
+    token = f"bench-{uuid.uuid4().hex[:12]}"
+    CenterRepository.add_center(args.center)
+    TokenShardRepository.ensure_table()
+
+    try:
+        TokenRepository.add_token(token, total, args.center)
+        run("single", args.threads, args.ops, lambda: TokenRepository.update_token_usage(token))
+
+        with db_session.get_cursor() as cursor:
+            cursor.execute("UPDATE tokens SET use_times = %s WHERE token=%s", (total, token))
+        TokenShardRepository.shard_token(token, args.shards)
+        run(f"shards={args.shards}", args.threads, args.ops,
+            lambda: TokenShardRepository.decrement(token, args.shards))
+        print(f"剩余次数: {TokenShardRepository.get_total_use_times(token)}（应为0）")
+    finally:
+        with db_session.get_cursor() as cursor:
+            cursor.execute("DELETE FROM token_usage_shards WHERE token=%s", (token,))
+            cursor.execute("DELETE FROM tokens WHERE token=%s", (token,))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Token批量创建：逐个创建（每个token一次查重 + 一次INSERT，即 /upload/add_token 的数据库路径）
+与批量创建（AsyncTokenRepository.add_tokens，一个事务一次查重 + 一条多行INSERT）对比
+
+需要本地MySQL（连接参数同 .env 中的 DB_*），创建的token在结束后删除。
+
+用法:
+    python -m benchmarks.bench_token_provisioning [--tokens 1000] [--batch 500] [--center bench]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=1000, help="每种方式创建的token数")
+    parser.add_argument("--batch", type=int, default=500, help="批量方式每次请求的token数")
+    parser.add_argument("--center", default="bench", help="临时token所属的中心ID")
+    return parser.parse_args()
+
+
+def report(label: str, count: int, elapsed: float):
+    print(f"{label:<10} {count / elapsed:>10.0f} tokens/s   总耗时 {elapsed * 1000:>8.1f} ms")
+
+
+async def main():
+    args = parse_args()
+
+    from app.db.async_database import async_db_session
+    from app.models.async_database import AsyncCenterRepository, AsyncTokenRepository
+
+    prefix = f"bench{uuid.uuid4().hex[:8]}"
+    single = [f"{prefix}s{i}" for i in range(args.tokens)]
+    bulk = [f"{prefix}b{i}" for i in range(args.tokens)]
+    if not await AsyncCenterRepository.center_exists(args.center):
+        await AsyncCenterRepository.add_center(args.center)
+
+    try:
+        start = time.perf_counter()
+        for token in single:
+            if not await AsyncTokenRepository.token_exists(token):
+                await AsyncTokenRepository.add_token(token, 10, args.center)
+        report("single", len(single), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i in range(0, len(bulk), args.batch):
+            await AsyncTokenRepository.add_tokens([(token, 10) for token in bulk[i:i + args.batch]], args.center)
+        report(f"batch={args.batch}", len(bulk), time.perf_counter() - start)
+    finally:
+        async with async_db_session.get_cursor() as cursor:
+            await cursor.execute("DELETE FROM tokens WHERE token LIKE %s", (f"{prefix}%",))
+        await async_db_session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
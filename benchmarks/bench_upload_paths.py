@@ -0,0 +1,114 @@
+"""
+对比 multipart 上传（/upload/image）与原始请求体上传（/upload/image/raw）
+在服务端的每请求CPU耗时
+
+只测量接收与读取阶段（中间件 + 请求体解析 + 分块读取/摘要），
+两条路径之后的识别流程完全相同。请求体预先构造好，直接调用ASGI应用，
+不包含HTTP客户端的编码开销。
+
+用法:
+    python -m benchmarks.bench_upload_paths [--size 300000] [--requests 2000]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from fastapi import FastAPI, File, Request, UploadFile
+
+from app.core.middleware import UploadSizeLimitMiddleware, UploadTooLargeError, upload_too_large_handler
+from app.services.upload_fun import read_request_body_limited, read_upload_limited
+
+MAX_FILE_SIZE = 500 * 1024
+BOUNDARY = "----benchboundary7MA4YWxkTrZu0gW"
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, max_body_size=MAX_FILE_SIZE + 16 * 1024)
+    app.add_exception_handler(UploadTooLargeError, upload_too_large_handler)
+
+    @app.post("/upload/image")
+    async def upload_image(image: UploadFile = File(...), token: str = None):
+        content, digest = await read_upload_limited(image, MAX_FILE_SIZE)
+        return {"size": len(content), "digest": digest}
+
+    @app.post("/upload/image/raw")
+    async def upload_image_raw(request: Request, token: str = None):
+        content, digest = await read_request_body_limited(request, MAX_FILE_SIZE)
+        return {"size": len(content), "digest": digest}
+
+    return app
+
+
+def build_multipart_body(payload: bytes) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="image"; filename="bench.jpg"\r\n'
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + payload + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+async def call(app, path: str, content_type: str, body: bytes, chunk_size: int = 64 * 1024):
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    status = {}
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"token=bench", "root_path": "",
+        "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 12345), "server": ("127.0.0.1", 8000),
+    }
+    await app(scope, receive, send)
+    assert status.get("code") == 200, status
+
+
+async def run(size: int, requests: int):
+    app = build_app()
+    payload = os.urandom(size)
+    cases = [
+        ("multipart /upload/image", "/upload/image",
+         f"multipart/form-data; boundary={BOUNDARY}", build_multipart_body(payload)),
+        ("raw body  /upload/image/raw", "/upload/image/raw", "image/jpeg", payload),
+    ]
+
+    for name, path, content_type, body in cases:
+        for _ in range(min(50, requests)):
+            await call(app, path, content_type, body)
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        for _ in range(requests):
+            await call(app, path, content_type, body)
+        cpu = (time.process_time() - cpu_start) / requests
+        wall = (time.perf_counter() - wall_start) / requests
+        print(f"{name}: CPU {cpu * 1e6:8.1f} µs/请求, 耗时 {wall * 1e6:8.1f} µs/请求")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比两种上传路径的每请求CPU耗时")
+    parser.add_argument("--size", type=int, default=300 * 1024, help="图像大小（字节）")
+    parser.add_argument("--requests", type=int, default=2000, help="每条路径的请求数")
+    args = parser.parse_args()
+    asyncio.run(run(args.size, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+/dashboard/logs 键集分页游标的编码与解析
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from app.services.dashboard_service import decode_log_cursor, encode_log_cursor
+
+
+@pytest.mark.parametrize("sort, value, expected", [
+    ("timestamp", datetime(2026, 3, 1, 12, 30, 5, 123456), "2026-03-01 12:30:05.123456"),
+    ("processing_time", Decimal("1.234"), "1.234"),
+    ("file_size", 204800, 204800),
+    ("processing_time", -1, -1),
+])
+def test_round_trip(sort, value, expected):
+    cursor = encode_log_cursor(sort, "desc", value, 42)
+    assert decode_log_cursor(cursor, sort, "desc") == (expected, 42)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_log_cursor("timestamp", "asc", datetime(2026, 3, 1), 2 ** 40)
+    assert all(c.isalnum() or c in "-_=" for c in cursor)
+
+
+@pytest.mark.parametrize("sort, order", [("file_size", "desc"), ("timestamp", "asc")])
+def test_rejects_other_sort(sort, order):
+    cursor = encode_log_cursor("timestamp", "desc", datetime(2026, 3, 1), 1)
+    with pytest.raises(ValueError):
+        decode_log_cursor(cursor, sort, order)
+
+
+def _raw(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    "游标",
+    base64.urlsafe_b64encode(b"not json").decode("ascii"),
+    _raw(7),
+    _raw(["timestamp", "desc", "2026-03-01"]),
+    _raw(["timestamp", "desc", "2026-03-01", "1"]),
+])
+def test_rejects_invalid(cursor):
+    with pytest.raises(ValueError):
+        decode_log_cursor(cursor, "timestamp", "desc")
@@ -0,0 +1,136 @@
+"""
+app.core.sketches 的误差界与序列化
+"""
+import json
+import random
+from collections import Counter
+
+import pytest
+
+from app.core.sketches import LatencySketch, SpaceSaving
+
+
+def zipf_stream(rows: int, keys: int, seed: int):
+    """按Zipf分布生成键（少数键占大部分计数，长尾键触发频繁替换）"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(keys)]
+    return rng.choices([f"key-{i}" for i in range(keys)], weights=weights, k=rows)
+
+
+def space_saving(stream, capacity: int) -> SpaceSaving:
+    sketch = SpaceSaving(capacity)
+    for key in stream:
+        sketch.add(key)
+    return sketch
+
+
+def assert_space_saving_bounds(sketch: SpaceSaving, exact: Counter):
+    """跟踪的键真实计数在 [计数-误差, 计数] 内，误差与未跟踪键的计数都不超过 总数/capacity"""
+    assert sketch.total == sum(exact.values())
+    bound = sketch.total / sketch.capacity
+    tracked = set()
+    for key, count, error in sketch.top(sketch.capacity):
+        tracked.add(key)
+        assert count - error <= exact[key] <= count
+        assert error <= bound
+    floor = sketch._min_count()
+    for key, count in exact.items():
+        if key not in tracked:
+            assert count <= floor <= bound
+        if count > bound:
+            assert key in tracked
+
+
+def test_space_saving_bounds():
+    stream = zipf_stream(20000, 2000, seed=1)
+    assert_space_saving_bounds(space_saving(stream, 50), Counter(stream))
+
+
+def test_space_saving_merge_bounds():
+    left, right = zipf_stream(20000, 2000, seed=2), zipf_stream(10000, 3000, seed=3)
+    merged = space_saving(left, 50)
+    merged.merge(space_saving(right, 50))
+    assert len(merged) == 50
+    assert_space_saving_bounds(merged, Counter(left) + Counter(right))
+
+
+def test_space_saving_merge_not_full_is_exact():
+    merged = space_saving(["a", "a", "b"], 10)
+    merged.merge(space_saving(["b", "c"], 10))
+    assert sorted(merged.top(3)) == [("a", 2, 0), ("b", 2, 0), ("c", 1, 0)]
+    assert merged.total == 5
+
+
+def test_space_saving_round_trip():
+    sketch = space_saving(zipf_stream(5000, 500, seed=4), 20)
+    restored = SpaceSaving.from_dict(json.loads(json.dumps(sketch.to_dict())))
+    assert restored.to_dict() == sketch.to_dict()
+    assert restored.top(20) == sketch.top(20)
+
+
+def latency_samples(rows: int, seed: int):
+    """对数正态分布的处理时间（秒），含少量不大于 min_value 的样本"""
+    rng = random.Random(seed)
+    return [rng.lognormvariate(0, 1.5) for _ in range(rows)] + [0.0] * (rows // 100)
+
+
+@pytest.mark.parametrize("accuracy", [0.01, 0.05])
+def test_latency_quantile_relative_accuracy(accuracy):
+    samples = latency_samples(20000, seed=5)
+    sketch = LatencySketch(accuracy)
+    for value in samples:
+        sketch.add(value)
+    ordered = sorted(samples)
+    for q in (0.0, 0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 0.999, 1.0):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        estimate = sketch.quantile(q)
+        if exact <= sketch.min_value:
+            assert estimate <= sketch.min_value
+        else:
+            assert abs(estimate - exact) <= accuracy * exact * (1 + 1e-9)
+    assert sketch.count == len(samples)
+    assert sketch.min == ordered[0] and sketch.max == ordered[-1]
+
+
+def test_latency_quantile_empty():
+    assert LatencySketch().quantile(0.5) is None
+
+
+def test_latency_merge_matches_single_sketch():
+    left, right = latency_samples(5000, seed=6), latency_samples(3000, seed=7)
+    merged, single = LatencySketch(), LatencySketch()
+    for value in left:
+        merged.add(value)
+    other = LatencySketch()
+    for value in right:
+        other.add(value)
+    merged.merge(other)
+    for value in left + right:
+        single.add(value)
+    for q in (0.5, 0.95, 0.99):
+        assert merged.quantile(q) == single.quantile(q)
+    assert (merged.count, merged.min, merged.max) == (single.count, single.min, single.max)
+    assert merged.sum == pytest.approx(single.sum)
+
+
+def test_latency_merge_empty_keeps_min_max():
+    sketch = LatencySketch()
+    sketch.add(0.5)
+    sketch.merge(LatencySketch())
+    assert (sketch.count, sketch.min, sketch.max) == (1, 0.5, 0.5)
+
+
+@pytest.mark.parametrize("other", [LatencySketch(0.02), LatencySketch(0.01, min_value=1e-4)])
+def test_latency_merge_rejects_different_precision(other):
+    with pytest.raises(ValueError):
+        LatencySketch(0.01).merge(other)
+
+
+def test_latency_round_trip():
+    sketch = LatencySketch()
+    for value in latency_samples(2000, seed=8):
+        sketch.add(value)
+    restored = LatencySketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+    assert restored.to_dict() == sketch.to_dict()
+    for q in (0.5, 0.99):
+        assert restored.quantile(q) == sketch.quantile(q)
@@ -0,0 +1,89 @@
+"""
+StreamAnalytics 的时间片过期与 StreamSummary 的序列化
+"""
+import json
+from datetime import datetime
+
+from app.models.database import API_LOG_COLUMNS
+from app.services.stream_analytics_service import StreamAnalytics, StreamSummary
+
+
+def make_record(token: str = "t1", status: str = "success", center_id: str = "c1",
+                processing_time: float = 0.5, error_code: str = None) -> tuple:
+    """按 API_LOG_COLUMNS 的顺序组装一条日志"""
+    values = {
+        "timestamp": datetime(2026, 1, 1), "client_ip": "10.0.0.1", "token": token,
+        "api_endpoint": "/upload/image", "status": status, "error_code": error_code,
+        "center_id": center_id, "processing_time": processing_time,
+    }
+    return tuple(values.get(column) for column in API_LOG_COLUMNS)
+
+
+def test_slot_expiry():
+    analytics = StreamAnalytics(enabled=True, window=60, slot=10)
+    analytics.publish(make_record(token="old"), now=1000)
+    analytics.publish(make_record(token="mid"), now=1015)
+    analytics.publish(make_record(token="new"), now=1075)
+
+    # 时间片 [1000, 1010) 已滑出60秒窗口，[1010, 1020) 仍有部分在窗口内
+    summary = analytics.summary(now=1075)
+    assert summary.requests == 2
+    assert {key for key, _, _ in summary.heavy_hitters["token"].top(10)} == {"mid", "new"}
+    assert [slot.start for slot in analytics._slots] == [1010, 1070]
+
+    # 更短的窗口只合并与其重叠的时间片
+    assert analytics.summary(window=10, now=1075).requests == 1
+    # 窗口最多为保留范围
+    assert analytics.summary(window=3600, now=1075).requests == 2
+
+    # 全部时间片过期后为空
+    assert analytics.summary(now=2000).requests == 0
+    assert not analytics._slots
+
+
+def test_publish_disabled():
+    analytics = StreamAnalytics(enabled=False, window=60, slot=10)
+    analytics.publish(make_record(), now=1000)
+    assert analytics.summary(now=1000).requests == 0
+
+
+def test_summary_counts_failures_and_latency():
+    analytics = StreamAnalytics(enabled=True, window=60, slot=10)
+    analytics.publish(make_record(processing_time=1.0), now=1000)
+    analytics.publish(make_record(status="failed", error_code="AI_ERROR", processing_time=3.0), now=1001)
+    report = analytics.summary(now=1002).report()
+    assert (report["requests"], report["failed"]) == (2, 1)
+    assert report["heavy_hitters"]["error_code"] == [{"key": "AI_ERROR", "count": 1, "error": 0}]
+    assert report["latency"]["count"] == 2
+    assert report["latency"]["max"] == 3.0
+    assert report["center_latency"]["c1"]["count"] == 2
+
+
+def test_summary_round_trip():
+    analytics = StreamAnalytics(enabled=True, window=60, slot=10)
+    for i in range(200):
+        analytics.publish(make_record(token=f"t{i % 7}", center_id=f"c{i % 3}", processing_time=0.1 * (i % 20),
+                                      status="failed" if i % 5 == 0 else "success", error_code="E"), now=1000 + i / 10)
+    summary = analytics.summary(now=1020)
+    restored = StreamSummary.from_dict(json.loads(json.dumps(summary.to_dict())))
+    assert restored.to_dict() == summary.to_dict()
+    assert restored.report() == summary.report()
+
+
+def test_summary_merge_across_workers():
+    """两个worker的窗口合并后与单个进程计入全部日志的结果一致"""
+    single, first, second = (StreamAnalytics(enabled=True, window=60, slot=10) for _ in range(3))
+    for i in range(100):
+        record = make_record(token=f"t{i % 4}", processing_time=0.05 * i)
+        single.publish(record, now=1000 + i / 10)
+        (first if i % 2 else second).publish(record, now=1000 + i / 10)
+    merged = first.summary(now=1010)
+    merged.merge(second.summary(now=1010))
+    expected = single.summary(now=1010).report()
+    report = merged.report()
+    assert report["requests"] == expected["requests"]
+    for dimension, items in expected["heavy_hitters"].items():
+        # 计数相同的键顺序不固定
+        assert sorted(report["heavy_hitters"][dimension], key=lambda item: item["key"]) == sorted(
+            items, key=lambda item: item["key"])
+    assert report["latency"] == expected["latency"]
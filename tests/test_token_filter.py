@@ -0,0 +1,93 @@
+"""
+BloomFilter 的误判率与 TokenFilter 的未命中缓存
+"""
+import pytest
+
+from app.services.token_filter_service import BloomFilter, TokenFilter
+
+
+def test_bloom_filter_no_false_negatives():
+    bloom = BloomFilter(10000, 0.01)
+    tokens = [f"token-{i}" for i in range(10000)]
+    for token in tokens:
+        bloom.add(token)
+    assert all(token in bloom for token in tokens)
+    assert bloom.count == 10000
+
+
+@pytest.mark.parametrize("error_rate", [0.01, 0.001])
+def test_bloom_filter_false_positive_rate(error_rate):
+    bloom = BloomFilter(10000, error_rate)
+    for i in range(10000):
+        bloom.add(f"token-{i}")
+    probes = 100000
+    false_positives = sum(f"missing-{i}" in bloom for i in range(probes))
+    assert false_positives / probes < error_rate * 2
+    assert bloom.estimated_error_rate() == pytest.approx(error_rate, rel=0.2)
+
+
+def test_bloom_filter_sizing():
+    bloom = BloomFilter(10000, 0.01)
+    # 每条约 9.6 位，7 个哈希
+    assert bloom.num_hashes == 7
+    assert bloom.memory_bytes == (bloom.num_bits + 7) // 8
+    assert 95000 < bloom.num_bits < 97000
+
+
+def ready_filter(tokens, **kwargs) -> TokenFilter:
+    token_filter = TokenFilter(enabled=True, **kwargs)
+    token_filter._filter = BloomFilter(1000, 0.001)
+    for token in tokens:
+        token_filter._filter.add(token)
+    return token_filter
+
+
+def test_might_exist_not_ready():
+    token_filter = TokenFilter(enabled=True)
+    assert not token_filter.ready
+    assert token_filter.might_exist("anything")
+
+
+def test_miss_falls_through_until_confirmed():
+    token_filter = ready_filter(["known"])
+    assert token_filter.might_exist("known")
+    assert token_filter.passed == 1
+
+    # 过滤器中没有：先查库，确认不存在后才拒绝
+    assert token_filter.might_exist("unknown")
+    assert token_filter.fallthrough == 1
+    token_filter.record_lookup("unknown", False)
+    assert not token_filter.might_exist("unknown")
+    assert token_filter.rejected == 1
+
+
+def test_miss_expires_after_ttl():
+    token_filter = ready_filter([], miss_ttl=0)
+    token_filter.record_lookup("unknown", False)
+    assert token_filter.might_exist("unknown")
+    assert token_filter.fallthrough == 1
+
+
+def test_found_token_is_added_to_filter():
+    """其他进程新增、尚未同步到过滤器的token查库命中后加入过滤器"""
+    token_filter = ready_filter([])
+    token_filter.record_lookup("created-elsewhere", False)
+    token_filter.record_lookup("created-elsewhere", True)
+    assert "created-elsewhere" in token_filter._filter
+    assert "created-elsewhere" not in token_filter._misses
+    assert token_filter.might_exist("created-elsewhere")
+
+
+def test_add_clears_confirmed_miss():
+    token_filter = ready_filter([])
+    token_filter.record_lookup("new", False)
+    token_filter.add("new")
+    assert token_filter.might_exist("new")
+    assert token_filter.rejected == 0
+
+
+def test_miss_cache_is_bounded():
+    token_filter = ready_filter([], miss_cache_size=3)
+    for i in range(5):
+        token_filter.record_lookup(f"missing-{i}", False)
+    assert list(token_filter._misses) == ["missing-2", "missing-3", "missing-4"]